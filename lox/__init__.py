@@ -3,24 +3,44 @@ from lox.callable import *
 from lox.class_ import *
 from lox.environment import *
 from lox.error import *
+from lox.incremental import *
+from lox.inference import *
 from lox.interpreter import *
+from lox.quicken import *
+from lox.compiler import *
+from lox.bytecode import *
+from lox.vm import *
+from lox.transpile import *
+from lox.jit import *
+from lox.optimizer import *
 from lox.parser import *
 from lox.resolver import *
 from lox.scanner import *
 from lox.token import *
+from lox.backend import *
 from lox import expr, stmt
-from lox import callable, class_, environment, interpreter, lox, parser, resolver, scanner, token
+from lox import backend, bytecode, callable, class_, compiler, environment, incremental, inference, interpreter, jit, lox, optimizer, parser, quicken, resolver, scanner, token, transpile, vm
 
 __all__ = (
     lox .__all__
+    + backend.__all__
+    + bytecode.__all__
     + callable.__all__
     + class_.__all__
+    + compiler.__all__
     + environment.__all__
+    + incremental.__all__
+    + inference.__all__
     + interpreter.__all__
+    + jit.__all__
+    + optimizer.__all__
     + scanner.__all__
     + token.__all__
+    + transpile.__all__
+    + vm.__all__
     + parser.__all__
+    + quicken.__all__
     + resolver.__all__
-    + ['LoxRuntimeError', 'LoxStopIteration', 'LoxReturn']
+    + ['LoxRuntimeError']
     + ['expr', 'stmt']
 )
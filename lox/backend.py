@@ -0,0 +1,11 @@
+"""Interpreters that can run resolved programs, by name, see --backend"""
+import lox
+
+backends = {
+    'ast': lox.Interpreter,
+    'closures': lox.CompiledInterpreter,
+    'bytecode': lox.VM,
+    'python': lox.PythonInterpreter,
+}
+
+__all__ = ['backends']
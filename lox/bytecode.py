@@ -0,0 +1,546 @@
+"""Bytecode compiler
+
+Compiles resolved programs into Code objects for lox.VM to run. Each
+function and the top-level code of a program become a Code object, with a
+flat list of instructions, the constants they use and a table of the lines
+they were compiled from.
+
+An instruction is an opcode (see Op) followed by its operands, all ints:
+slots of locals and globals, indices into the constants, counts and jump
+targets. Values are passed on a stack, and locals, captured variables and
+globals are kept where lox.Interpreter keeps them, in the slots the
+resolver gave them.
+
+Code objects can be written to disk and read back, see dumps and loads.
+"""
+import enum
+from typing import Dict, List, Optional, Tuple, Union
+
+import lox
+import lox.expr as expr
+import lox.stmt as stmt
+from lox.token import TokenType as TT
+
+MAGIC = b'LOXB\x00\x01'
+
+
+class Op(enum.IntEnum):
+    """Opcodes, with the operands they take as comments"""
+    CONSTANT = 1  # constant
+    NIL = 2
+    POP = 3
+    GET_LOCAL = 4  # slot
+    SET_LOCAL = 5  # slot
+    GET_CELL = 6  # slot
+    SET_CELL = 7  # slot
+    NEW_CELL = 8  # slot
+    MAKE_CELL = 9  # slot
+    GET_ENCLOSING = 10  # depth, slot
+    SET_ENCLOSING = 11  # depth, slot
+    GET_ENCLOSING_CELL = 12  # depth, slot
+    SET_ENCLOSING_CELL = 13  # depth, slot
+    GET_GLOBAL = 14  # global
+    SET_GLOBAL = 15  # global
+    DEFINE_GLOBAL = 16  # global
+    CHECK_GLOBAL = 17  # global
+    GET_PROPERTY = 18  # constant with the name
+    CHECK_INSTANCE = 19  # constant with the name
+    SET_PROPERTY = 20  # constant with the name
+    ADD = 21
+    SUBTRACT = 22
+    MULTIPLY = 23
+    DIVIDE = 24
+    GREATER = 25
+    GREATER_EQUAL = 26
+    LESS = 27
+    LESS_EQUAL = 28
+    EQUAL = 29
+    NOT_EQUAL = 30
+    NOT = 31
+    NEGATE = 32
+    # On operands of known types, see lox.infer_types
+    ADD_TYPED = 33
+    SUBTRACT_TYPED = 34
+    MULTIPLY_TYPED = 35
+    DIVIDE_TYPED = 36
+    GREATER_TYPED = 37
+    GREATER_EQUAL_TYPED = 38
+    LESS_TYPED = 39
+    LESS_EQUAL_TYPED = 40
+    NEGATE_TYPED = 41
+    JUMP = 42  # target
+    JUMP_IF_FALSE = 43  # target
+    JUMP_IF_FALSE_OR_POP = 44  # target
+    JUMP_IF_TRUE_OR_POP = 45  # target
+    CALL = 46  # arguments
+    CALL_CHECKED = 47  # arguments
+    STORE_ARGUMENTS = 48  # slot, arguments
+    CLOSURE = 49  # constant with the Code
+    CLASS = 50  # constant with the name, methods, class methods, setters,
+    # class setters
+    PRINT = 51
+    RETURN = 52
+
+
+# Number of operands of each opcode
+operand_counts = {op: 0 for op in Op}
+operand_counts.update({
+    Op.CONSTANT: 1, Op.GET_LOCAL: 1, Op.SET_LOCAL: 1, Op.GET_CELL: 1,
+    Op.SET_CELL: 1, Op.NEW_CELL: 1, Op.MAKE_CELL: 1, Op.GET_ENCLOSING: 2,
+    Op.SET_ENCLOSING: 2, Op.GET_ENCLOSING_CELL: 2, Op.SET_ENCLOSING_CELL: 2,
+    Op.GET_GLOBAL: 1, Op.SET_GLOBAL: 1, Op.DEFINE_GLOBAL: 1,
+    Op.CHECK_GLOBAL: 1, Op.GET_PROPERTY: 1, Op.CHECK_INSTANCE: 1,
+    Op.SET_PROPERTY: 1, Op.JUMP: 1, Op.JUMP_IF_FALSE: 1,
+    Op.JUMP_IF_FALSE_OR_POP: 1, Op.JUMP_IF_TRUE_OR_POP: 1, Op.CALL: 1,
+    Op.CALL_CHECKED: 1, Op.STORE_ARGUMENTS: 2, Op.CLOSURE: 1, Op.CLASS: 5,
+})
+
+binary_ops = {
+    TT.PLUS: Op.ADD, TT.MINUS: Op.SUBTRACT, TT.STAR: Op.MULTIPLY,
+    TT.SLASH: Op.DIVIDE, TT.GREATER: Op.GREATER,
+    TT.GREATER_EQUAL: Op.GREATER_EQUAL, TT.LESS: Op.LESS,
+    TT.LESS_EQUAL: Op.LESS_EQUAL, TT.EQUAL_EQUAL: Op.EQUAL,
+    TT.BANG_EQUAL: Op.NOT_EQUAL,
+}
+typed_binary_ops = {
+    TT.PLUS: Op.ADD_TYPED, TT.MINUS: Op.SUBTRACT_TYPED,
+    TT.STAR: Op.MULTIPLY_TYPED, TT.SLASH: Op.DIVIDE_TYPED,
+    TT.GREATER: Op.GREATER_TYPED, TT.GREATER_EQUAL: Op.GREATER_EQUAL_TYPED,
+    TT.LESS: Op.LESS_TYPED, TT.LESS_EQUAL: Op.LESS_EQUAL_TYPED,
+}
+
+
+class Code:
+    """A compiled function, or the top-level code of a program
+
+    The body of a function parsed lazily (see --lazy) is only compiled on
+    its first call, until then instructions is None and declaration is the
+    function to compile.
+    """
+    __slots__ = ('name', 'arity', 'frame_size', 'cells', 'captures',
+                 'is_init', 'is_getter', 'instructions', 'constants',
+                 'lines', 'declaration')
+
+    def __init__(self, name: str, arity: int = 0, is_init: bool = False,
+                 is_getter: bool = False):
+        self.name = name
+        self.arity = arity
+        # Same as for stmt.Function, the top-level code's frame is the
+        # interpreter's top frame, see stmt.Block
+        self.frame_size = 0
+        self.cells: List[int] = []
+        self.captures: List[Tuple[int, int]] = []
+        self.is_init = is_init
+        self.is_getter = is_getter
+        self.instructions: Optional[List[int]] = []
+        self.constants: list = []
+        # Pairs of the offset of an instruction and the line of the code it
+        # was compiled from, for the instructions up to the next pair
+        self.lines: List[int] = []
+        self.declaration: Optional[stmt.Function] = None
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+    def line(self, offset: int) -> int:
+        """Line the instruction at offset was compiled from"""
+        lines = self.lines
+        line = 0
+        for i in range(0, len(lines), 2):
+            if lines[i] > offset:
+                break
+            line = lines[i + 1]
+        return line
+
+
+class BytecodeCompiler(expr.Visitor[None], stmt.Visitor[None]):
+    """Compiles resolved statements into Code objects
+
+    table has the slots the statements were resolved with.
+    """
+
+    def __init__(self, table: 'lox.GlobalTable'):
+        self.table = table
+        self.code = Code('script')
+        # Indices of the constants in code, by type and value
+        self.constant_indices: Dict[tuple, int] = {}
+        # Jumps of the breaks in each loop being compiled, to its end
+        self.breaks: List[List[int]] = []
+
+    def compile(self, statements: List[stmt.Stmt]) -> Code:
+        """Code of a program's top-level statements"""
+        self.start(Code('script'))
+        for s in statements:
+            s.accept(self)
+        self.emit(Op.NIL)
+        self.emit(Op.RETURN)
+        return self.code
+
+    def compile_expression(self, e: expr.Expr) -> Code:
+        """Code of a program evaluating e"""
+        self.start(Code('script'))
+        e.accept(self)
+        self.emit(Op.RETURN)
+        return self.code
+
+    def compile_function(self, declaration: stmt.Function,
+                         is_init: bool = False,
+                         code: Optional[Code] = None) -> Code:
+        """Code of a function, compiled into code if given
+
+        Functions whose body hasn't been parsed yet are left to be compiled
+        on their first call.
+        """
+        if code is None:
+            code = Code(declaration.name.lexeme, len(declaration.params),
+                        is_init, declaration.is_getter)
+        code.captures = declaration.captures or []
+        if isinstance(declaration.body, lox.LazyBody):
+            code.instructions = None
+            code.declaration = declaration
+            return code
+        code.declaration = None
+        code.instructions = []
+        code.frame_size = declaration.frame_size
+        code.cells = declaration.cells or []
+        enclosing = self.code, self.constant_indices, self.breaks
+        self.start(code)
+        for s in declaration.body:
+            s.accept(self)
+        self.emit(Op.NIL)
+        self.emit(Op.RETURN)
+        self.code, self.constant_indices, self.breaks = enclosing
+        return code
+
+    def start(self, code: Code) -> None:
+        self.code = code
+        self.constant_indices = {}
+        self.breaks = []
+
+    def emit(self, op: Op, *operands: int,
+             token: Optional['lox.Token'] = None) -> int:
+        """Adds an instruction, returns its offset
+
+        token is where the instruction comes from, it must be given for
+        instructions that can fail.
+        """
+        code = self.code
+        offset = len(code.instructions)
+        if token is not None:
+            lines = code.lines
+            if not lines or lines[-1] != token.line:
+                lines += (offset, token.line)
+        code.instructions.append(op.value)
+        code.instructions.extend(operands)
+        return offset
+
+    def emit_jump(self, op: Op, token: Optional['lox.Token'] = None) -> int:
+        """Adds a jump to be patched, returns the offset of its target"""
+        return self.emit(op, -1, token=token) + 1
+
+    def patch(self, jump: int) -> None:
+        """Makes jump go to the next instruction"""
+        self.code.instructions[jump] = len(self.code.instructions)
+
+    def constant(self, value: object) -> int:
+        """Index of value in the constants"""
+        constants = self.code.constants
+        kind = type(value)
+        if kind is float or kind is str or kind is bool:
+            # Keyed by type, and repr so that -0.0 isn't 0.0
+            key = (kind, repr(value))
+            index = self.constant_indices.get(key)
+            if index is None:
+                index = self.constant_indices[key] = len(constants)
+                constants.append(value)
+            return index
+        constants.append(value)
+        return len(constants) - 1
+
+    def global_slot(self, name: 'lox.Token') -> int:
+        return self.table.slot(name.lexeme)
+
+    def load(self, depth: Optional[int], slot: int, cell: bool,
+             token: 'lox.Token') -> None:
+        """Pushes the value of a variable"""
+        if depth is None:
+            self.emit(Op.GET_GLOBAL, slot, token=token)
+        elif depth == 0:
+            self.emit(Op.GET_CELL if cell else Op.GET_LOCAL, slot,
+                      token=token)
+        else:
+            self.emit(Op.GET_ENCLOSING_CELL if cell else Op.GET_ENCLOSING,
+                      depth, slot, token=token)
+
+    def store(self, depth: Optional[int], slot: int, cell: bool,
+              token: 'lox.Token') -> None:
+        """Pops a value into a variable"""
+        if depth is None:
+            self.emit(Op.SET_GLOBAL, slot, token=token)
+        elif depth == 0:
+            self.emit(Op.SET_CELL if cell else Op.SET_LOCAL, slot,
+                      token=token)
+        else:
+            self.emit(Op.SET_ENCLOSING_CELL if cell else Op.SET_ENCLOSING,
+                      depth, slot, token=token)
+
+    def define(self, s: Union[stmt.Var, stmt.Function, stmt.Class]) -> None:
+        """Pops the value of the variable s declares into it"""
+        if s.slot is None:
+            self.emit(Op.DEFINE_GLOBAL, self.global_slot(s.name),
+                      token=s.name)
+        else:
+            self.emit(Op.SET_LOCAL, s.slot, token=s.name)
+
+    def visit_block_stmt(self, s: stmt.Block) -> None:
+        if s.frame_size is not None:
+            self.code.frame_size = max(self.code.frame_size, s.frame_size)
+        for statement in s.statements:
+            statement.accept(self)
+
+    def visit_break_stmt(self, s: stmt.Break) -> None:
+        self.breaks[-1].append(self.emit_jump(Op.JUMP, s.keyword))
+
+    def visit_class_stmt(self, s: stmt.Class) -> None:
+        if s.cell:
+            # Captured by its own methods
+            self.emit(Op.NEW_CELL, s.slot, token=s.name)
+        groups = (s.methods, s.class_methods, s.setters, s.class_setters)
+        for group in groups:
+            for method in group:
+                is_init = group is s.methods and method.name.lexeme == 'init'
+                self.emit(Op.CLOSURE, self.constant(
+                    self.compile_function(method, is_init)),
+                    token=method.name)
+        self.emit(Op.CLASS, self.constant(s.name.lexeme),
+                  *(len(group) for group in groups), token=s.name)
+        if s.cell:
+            self.emit(Op.SET_CELL, s.slot)
+        else:
+            self.define(s)
+
+    def visit_expression_stmt(self, s: stmt.Expression) -> None:
+        self.discard(s.expression)
+
+    def discard(self, e: expr.Expr) -> None:
+        """Evaluates e without leaving its value on the stack"""
+        if type(e) is expr.Assign:
+            self.assign(e)
+        else:
+            e.accept(self)
+            self.emit(Op.POP)
+
+    def visit_for_stmt(self, s: stmt.For) -> None:
+        if s.frame_size is not None:
+            self.code.frame_size = max(self.code.frame_size, s.frame_size)
+        if s.initializer is not None:
+            s.initializer.accept(self)
+        start = len(self.code.instructions)
+        end = None
+        if s.condition is not None:
+            s.condition.accept(self)
+            end = self.emit_jump(Op.JUMP_IF_FALSE)
+        self.breaks.append([])
+        s.body.accept(self)
+        if s.increment is not None:
+            self.discard(s.increment)
+        self.emit(Op.JUMP, start)
+        if end is not None:
+            self.patch(end)
+        for jump in self.breaks.pop():
+            self.patch(jump)
+
+    def visit_function_stmt(self, s: stmt.Function) -> None:
+        if s.cell:
+            # Captured by itself
+            self.emit(Op.NEW_CELL, s.slot, token=s.name)
+        self.emit(Op.CLOSURE, self.constant(self.compile_function(s)),
+                  token=s.name)
+        if s.cell:
+            self.emit(Op.SET_CELL, s.slot)
+        else:
+            self.define(s)
+
+    def visit_if_stmt(self, s: stmt.If) -> None:
+        s.condition.accept(self)
+        else_branch = self.emit_jump(Op.JUMP_IF_FALSE)
+        s.then_branch.accept(self)
+        if s.else_branch is None:
+            self.patch(else_branch)
+            return
+        end = self.emit_jump(Op.JUMP)
+        self.patch(else_branch)
+        s.else_branch.accept(self)
+        self.patch(end)
+
+    def visit_print_stmt(self, s: stmt.Print) -> None:
+        s.expression.accept(self)
+        self.emit(Op.PRINT)
+
+    def visit_return_stmt(self, s: stmt.Return) -> None:
+        if s.value is None:
+            self.emit(Op.NIL, token=s.keyword)
+        else:
+            s.value.accept(self)
+        self.emit(Op.RETURN, token=s.keyword)
+
+    def visit_var_stmt(self, s: stmt.Var) -> None:
+        if s.initializer is None:
+            self.emit(Op.NIL)
+        else:
+            s.initializer.accept(self)
+        if s.cell:
+            self.emit(Op.MAKE_CELL, s.slot, token=s.name)
+        else:
+            self.define(s)
+
+    def visit_while_stmt(self, s: stmt.While) -> None:
+        start = len(self.code.instructions)
+        s.condition.accept(self)
+        end = self.emit_jump(Op.JUMP_IF_FALSE)
+        self.breaks.append([])
+        s.body.accept(self)
+        self.emit(Op.JUMP, start)
+        self.patch(end)
+        for jump in self.breaks.pop():
+            self.patch(jump)
+
+    def visit_assign_expr(self, e: expr.Assign) -> None:
+        self.assign(e)
+        # Assignments evaluate to nil
+        self.emit(Op.NIL)
+
+    def assign(self, e: expr.Assign) -> None:
+        e.value.accept(self)
+        self.store(e.depth, e.slot, e.cell, e.name)
+
+    def visit_binary_expr(self, e: expr.Binary) -> None:
+        e.left.accept(self)
+        o = e.operator.type
+        if o is TT.COMMA:
+            self.emit(Op.POP)
+            e.right.accept(self)
+            return
+        e.right.accept(self)
+        self.emit((typed_binary_ops if e.typed else binary_ops)[o],
+                  token=e.operator)
+
+    def visit_call_expr(self, e: expr.Call) -> None:
+        e.callee.accept(self)
+        for argument in e.arguments:
+            argument.accept(self)
+        # Checked calls are to a global function or class taking these many
+        # arguments, getting the callee checked that it's defined
+        self.emit(Op.CALL_CHECKED if e.checked else Op.CALL,
+                  len(e.arguments), token=e.paren)
+
+    def visit_conditional_expr(self, e: expr.Conditional) -> None:
+        e.condition.accept(self)
+        else_branch = self.emit_jump(Op.JUMP_IF_FALSE)
+        e.then_branch.accept(self)
+        end = self.emit_jump(Op.JUMP)
+        self.patch(else_branch)
+        e.else_branch.accept(self)
+        self.patch(end)
+
+    def visit_get_expr(self, e: expr.Get) -> None:
+        e.object.accept(self)
+        self.emit(Op.GET_PROPERTY, self.constant(e.name), token=e.name)
+
+    def visit_grouping_expr(self, e: expr.Grouping) -> None:
+        e.expression.accept(self)
+
+    def visit_inline_expr(self, e: expr.Inline) -> None:
+        self.emit(Op.CHECK_GLOBAL, e.callee.slot, token=e.callee.name)
+        for argument in e.arguments:
+            argument.accept(self)
+        self.emit(Op.STORE_ARGUMENTS, e.slot, len(e.arguments))
+        e.body.accept(self)
+
+    def visit_literal_expr(self, e: expr.Literal) -> None:
+        if e.value is None:
+            self.emit(Op.NIL)
+        else:
+            self.emit(Op.CONSTANT, self.constant(e.value))
+
+    def visit_logical_expr(self, e: expr.Logical) -> None:
+        e.left.accept(self)
+        end = self.emit_jump(Op.JUMP_IF_TRUE_OR_POP
+                             if e.operator.type is TT.OR
+                             else Op.JUMP_IF_FALSE_OR_POP)
+        e.right.accept(self)
+        self.patch(end)
+
+    def visit_set_expr(self, e: expr.Set) -> None:
+        e.object.accept(self)
+        name = self.constant(e.name)
+        # Checked before evaluating the value, as lox.Interpreter does
+        self.emit(Op.CHECK_INSTANCE, name, token=e.name)
+        e.value.accept(self)
+        self.emit(Op.SET_PROPERTY, name, token=e.name)
+
+    def visit_this_expr(self, e: expr.This) -> None:
+        self.load(e.depth, e.slot, False, e.keyword)
+
+    def visit_unary_expr(self, e: expr.Unary) -> None:
+        e.right.accept(self)
+        if e.typed:
+            op = Op.NEGATE_TYPED
+        elif e.operator.type is TT.BANG:
+            op = Op.NOT
+        else:
+            op = Op.NEGATE
+        self.emit(op, token=e.operator)
+
+    def visit_variable_expr(self, e: expr.Variable) -> None:
+        self.load(e.depth, e.slot, e.cell, e.name)
+
+
+def disassemble(code: Code) -> str:
+    """Listing of code's instructions, and of the functions in it"""
+    lines = []
+    codes = [code]
+    while codes:
+        code = codes.pop(0)
+        lines.append(f'{code.name}:')
+        if code.instructions is None:
+            lines.append('  not compiled yet')
+            continue
+        instructions = code.instructions
+        offset = 0
+        while offset < len(instructions):
+            op = Op(instructions[offset])
+            end = offset + 1 + operand_counts[op]
+            operands = instructions[offset + 1:end]
+            line = f'  {offset:4} {code.line(offset):4} {op.name}'
+            if operands:
+                line += ' ' + ' '.join(map(str, operands))
+            if op in (Op.CONSTANT, Op.GET_PROPERTY, Op.CHECK_INSTANCE,
+                      Op.SET_PROPERTY, Op.CLOSURE, Op.CLASS):
+                constant = code.constants[operands[0]]
+                if type(constant) is Code:
+                    codes.append(constant)
+                elif type(constant) is lox.Token:
+                    constant = constant.lexeme
+                line += f' ({constant!r})'
+            lines.append(line)
+            offset += 1 + len(operands)
+    return '\n'.join(lines)
+
+
+def dumps(table: 'lox.GlobalTable', code: Code) -> bytes:
+    """code, compiled with the slots in table, as bytes"""
+    # Imported here, pickle isn't available in Brython
+    import pickle
+    return MAGIC + pickle.dumps((table, code), pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data: bytes) -> Tuple['lox.GlobalTable', Code]:
+    """The table and code written by dumps"""
+    import pickle
+    if not data.startswith(MAGIC):
+        raise ValueError('not compiled lox code')
+    return pickle.loads(data[len(MAGIC):])
+
+
+__all__ = ['Op', 'Code', 'BytecodeCompiler', 'disassemble']
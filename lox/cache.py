@@ -0,0 +1,128 @@
+"""On-disk cache of resolved programs
+
+A script's statements are stored in a .loxc file, along with the depths
+and slots the resolver stored in them and its table of globals, so that
+running an unchanged script skips scanning, parsing and resolving. Cache
+files live in a __loxcache__ directory next to the script, or under the
+directory named by the LOXCACHEPREFIX environment variable.
+
+A cache file starts with a magic number and a key, the hash of the source
+together with a fingerprint of the interpreter and whether the program was
+optimized (see lox.Optimizer). Files whose key doesn't match, and files
+that can't be read, are ignored and rebuilt.
+
+This module isn't imported by the lox package itself, since pickle and
+hashlib aren't available everywhere lox runs (Brython).
+"""
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from typing import List, Optional, Tuple
+
+import lox
+import lox.stmt as stmt
+from lox.scanner import paused_gc
+
+# Identifies the layout of cache files. Changes to what's pickled in them
+# come with changes to the lox package, which the key covers already, see
+# interpreter_fingerprint.
+MAGIC = b'LOXC\x00\x01'
+CACHE_DIR = '__loxcache__'
+SUFFIX = '.loxc'
+
+_fingerprint: Optional[bytes] = None
+
+
+def interpreter_fingerprint() -> bytes:
+    """Hash identifying this interpreter's sources and the Python running it
+
+    Any change to the lox package makes all existing cache files stale.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        h = hashlib.sha256(sys.version.encode())
+        package = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(package)):
+            if name.endswith('.py'):
+                h.update(name.encode())
+                with open(os.path.join(package, name), 'rb') as f:
+                    h.update(f.read())
+        _fingerprint = h.digest()
+    return _fingerprint
+
+
+def cache_key(source: str, optimize: bool = True) -> bytes:
+    h = hashlib.sha256(interpreter_fingerprint())
+    h.update(b'O' if optimize else b'-')
+    h.update(source.encode('utf-8', 'surrogatepass'))
+    return h.digest()
+
+
+def cache_path(path: str) -> str:
+    """Path of the cache file for the script at path"""
+    path = os.path.abspath(path)
+    directory, name = os.path.split(path)
+    prefix = os.environ.get('LOXCACHEPREFIX')
+    if prefix:
+        # Mirror the script's directory under the prefix
+        drive, directory = os.path.splitdrive(directory)
+        directory = os.path.join(prefix, directory.lstrip(os.sep))
+    else:
+        directory = os.path.join(directory, CACHE_DIR)
+    return os.path.join(directory, name + SUFFIX)
+
+
+def load(path: str, source: str, optimize: bool = True
+         ) -> Optional[Tuple['lox.GlobalTable', List[stmt.Stmt]]]:
+    """Returns the cached globals and statements for the script, or None on
+    a miss"""
+    key = cache_key(source, optimize)
+    try:
+        with open(cache_path(path), 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC or f.read(len(key)) != key:
+                return None
+            # The tree is acyclic too, see paused_gc
+            with paused_gc():
+                return pickle.load(f)
+    except Exception:
+        # Missing, unreadable, truncated or corrupt: rebuild it
+        return None
+
+
+def store(path: str, source: str, table: 'lox.GlobalTable',
+          statements: List[stmt.Stmt], optimize: bool = True) -> None:
+    """Writes the program to the script's cache file
+
+    The file is written under a temporary name and renamed into place, so
+    concurrent runs never see a partially written file. Failing to write
+    the cache isn't an error.
+    """
+    target = cache_path(path)
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, temp = tempfile.mkstemp(prefix=os.path.basename(target),
+                                    suffix='.tmp',
+                                    dir=os.path.dirname(target))
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(cache_key(source, optimize))
+            pickle.dump((table, statements), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, target)
+    except Exception:
+        # Unwritable, or something in the program can't be pickled
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+
+__all__ = [
+    'load',
+    'store',
+    'cache_path',
+]
@@ -1,5 +1,6 @@
 import time
 from abc import ABC, abstractmethod
+from typing import List, Optional
 
 import lox
 import lox.stmt as stmt
@@ -27,10 +28,13 @@ class LoxClock(LoxCallable):
 
 lox_clock = LoxClock()
 
+# Globals defined by every interpreter
+natives = {'clock': lox_clock}
+
 
 class LoxFunction(LoxCallable):
     def __init__(self, declaration: stmt.Function,
-                 closure: 'lox.Environment',
+                 closure: Optional['lox.Frame'],
                  is_init=False):
         self.declaration = declaration
         self.closure = closure
@@ -51,26 +55,51 @@ class LoxFunction(LoxCallable):
         return self.declaration.is_setter  # pragma: no cover
 
     def call(self, interpreter: 'lox.Interpreter', arguments: list) -> object:
-        environment = lox.Environment(self.closure)
-        for param, argument in zip(self.declaration.params, arguments):
-            environment.define(param.lexeme, argument)
-
-        try:
-            interpreter.execute_block(self.declaration.body, environment)
-        except lox.LoxReturn as r:
-            if self.is_init:
-                return self.closure.get_at(0, 'this')
-            return r.value
+        declaration = self.declaration
+        body = declaration.body
+        if isinstance(body, lox.LazyBody):
+            body = self.parse_body(interpreter, body)
+
+        # Parameters take the first slots, in order, then the other locals.
+        # The list is the caller's, it isn't used after the call.
+        locals = declaration.frame_size - len(arguments)
+        if locals:
+            arguments += [None] * locals
+        cells = declaration.cells
+        if cells:
+            for slot in cells:
+                arguments[slot] = lox.Cell(arguments[slot])
+        environment = lox.Frame(self.closure, arguments)
+
+        completion = interpreter.execute_block(body, environment)
         if self.is_init:
-            return self.closure.get_at(0, 'this')
+            return self.closure.values[0]
+        if completion is lox.Completion.RETURN:
+            return interpreter.returned
         return None
 
     def arity(self) -> int:
         return len(self.declaration.params)
 
+    def parse_body(self, interpreter: 'lox.Interpreter',
+                   body: 'lox.LazyBody') -> List[stmt.Stmt]:
+        """Parses and resolves a body skipped by a lazy parser"""
+        declaration = self.declaration
+        statements = body.parse()
+        if not lox.lox.had_error:
+            declaration.body = statements
+            lox.Resolver(interpreter.globals.table, types=True) \
+                .resolve_lazy(declaration, body)
+            interpreter.globals.grow()
+            if not lox.lox.had_error:
+                return statements
+            declaration.body = body
+        raise lox.LoxRuntimeError(
+            declaration.name,
+            f"Can't compile the body of '{declaration.name.lexeme}'.")
+
     def bind(self, instance):
-        environment = lox.Environment(self.closure)
-        environment.define('this', instance)
+        environment = lox.Frame(self.closure, [instance])
         return LoxFunction(self.declaration, environment, self.is_init)
 
 
@@ -78,5 +107,6 @@ __all__ = [
     'LoxCallable',
     'LoxClock',
     'lox_clock',
+    'natives',
     'LoxFunction',
 ]
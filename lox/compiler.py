@@ -0,0 +1,756 @@
+"""Closure compiling backend
+
+Compiles resolved statements and expressions once into nested Python
+closures, which run them the same way lox.Interpreter does: each expression
+becomes a function of the frame of the locals it's evaluated in returning
+its value, and each statement a function of the frame returning None or a
+lox.Completion. What lox.Interpreter decides every time it evaluates a node,
+by dispatching on its class and going through the operators, depths and
+slots it could have, is decided once here, so running a closure only does
+the work of that node.
+
+Top-level code outside of blocks runs without a frame.
+"""
+from typing import Callable, Dict, List, Optional, Union
+
+import lox
+import lox.expr as expr
+import lox.stmt as stmt
+from lox.quicken import typed_operations
+from lox.token import TokenType as TT
+
+Frame = Optional['lox.Frame']
+Code = Callable[[Frame], object]
+
+BREAK = lox.Completion.BREAK
+RETURN = lox.Completion.RETURN
+NAN = float('nan')
+
+
+class Compiler(expr.Visitor[Code], stmt.Visitor[Code]):
+    """Compiles code to run in interpreter"""
+
+    def __init__(self, interpreter: 'CompiledInterpreter'):
+        self.interpreter = interpreter
+        # Bodies of the functions compiled so far
+        self.bodies: Dict[stmt.Function, Code] = {}
+
+    def compile(self, node: Union[expr.Expr, stmt.Stmt]) -> Code:
+        return node.accept(self)
+
+    def sequence(self, statements: List[stmt.Stmt]) -> Code:
+        """Code running statements one after the other"""
+        codes = tuple(s.accept(self) for s in statements)
+        if len(codes) == 1:
+            return codes[0]
+        if len(codes) == 2:
+            first, second = codes
+
+            def run_two(frame):
+                completion = first(frame)
+                if completion is not None:
+                    return completion
+                return second(frame)
+            return run_two
+
+        def run(frame):
+            for code in codes:
+                completion = code(frame)
+                if completion is not None:
+                    return completion
+            return None
+        return run
+
+    def function(self, declaration: stmt.Function,
+                 is_init: bool = False) -> Code:
+        """Code making a function where it's declared"""
+        if type(declaration.body) is list:
+            self.bodies[declaration] = self.sequence(declaration.body)
+        body = self.bodies.get(declaration)
+        capture = self.capture(declaration)
+
+        def make(frame):
+            return CompiledFunction(declaration, capture(frame), is_init,
+                                    body, self)
+        return make
+
+    def capture(self, function: stmt.Function) -> Callable[[Frame], Frame]:
+        """Code making the frame of the variables function captures"""
+        captures = function.captures
+        if not captures:
+            return lambda frame: None
+        if all(depth == 0 for depth, _ in captures):
+            slots = [slot for _, slot in captures]
+
+            def capture_locals(frame):
+                values = frame.values
+                return lox.Frame(None, [values[i] for i in slots])
+            return capture_locals
+
+        def capture(frame):
+            values = []
+            for depth, slot in captures:
+                enclosing = frame
+                while depth:
+                    enclosing = enclosing.enclosing
+                    depth -= 1
+                values.append(enclosing.values[slot])
+            return lox.Frame(None, values)
+        return capture
+
+    def define(self, s: Union[stmt.Var, stmt.Function, stmt.Class]
+               ) -> Callable[[Frame, object], None]:
+        """Code defining the variable s declares"""
+        slot = s.slot
+        if slot is None:
+            globals = self.interpreter.globals
+            slot = globals.table.slot(s.name.lexeme)
+            globals.grow()
+            values = globals.values
+
+            def define_global(frame, value):
+                values[slot] = value
+            return define_global
+
+        def define(frame, value):
+            frame.values[slot] = value
+        return define
+
+    def visit_block_stmt(self, s: stmt.Block) -> Code:
+        run = self.sequence(s.statements)
+        size = s.frame_size
+        if size is None:
+            return run
+        interpreter = self.interpreter
+
+        def run_top_level(frame):
+            interpreter.grow_top_frame(size)
+            return run(interpreter.top_frame)
+        return run_top_level
+
+    def visit_break_stmt(self, s: stmt.Break) -> Code:
+        return lambda frame: BREAK
+
+    def visit_class_stmt(self, s: stmt.Class) -> Code:
+        define = self.define(s)
+        cell = s.cell
+        name = s.name.lexeme
+
+        def functions(declarations: List[stmt.Function], methods=False):
+            return [(i.name.lexeme, self.function(
+                        i, methods and i.name.lexeme == 'init'))
+                    for i in declarations]
+        methods = functions(s.methods, True)
+        class_methods = functions(s.class_methods)
+        setters = functions(s.setters)
+        class_setters = functions(s.class_setters)
+
+        def make(frame, functions):
+            return {function_name: make_function(frame)
+                    for function_name, make_function in functions}
+
+        def declare_class(frame):
+            if cell:
+                # Captured by its own methods
+                class_cell = lox.Cell()
+                define(frame, class_cell)
+            meta = lox.LoxClass(
+                metaclass=None,
+                name=f'{name} metaclass',
+                methods=make(frame, class_methods),
+                setters=make(frame, class_setters)
+            )
+            class_ = lox.LoxClass(meta, name, make(frame, methods),
+                                  make(frame, setters))
+            if cell:
+                class_cell.value = class_
+            else:
+                define(frame, class_)
+        return declare_class
+
+    def visit_expression_stmt(self, s: stmt.Expression) -> Code:
+        expression = s.expression.accept(self)
+        if type(s.expression) is expr.Assign:
+            # Evaluates to nil, which is also what a statement that ran to
+            # its end returns
+            return expression
+
+        def run(frame):
+            expression(frame)
+        return run
+
+    def visit_for_stmt(self, s: stmt.For) -> Code:
+        initializer = s.initializer and s.initializer.accept(self)
+        condition = s.condition and s.condition.accept(self)
+        increment = s.increment and s.increment.accept(self)
+        body = s.body.accept(self)
+
+        def run_loop(frame):
+            if initializer is not None:
+                initializer(frame)
+            while True:
+                if condition is not None:
+                    value = condition(frame)
+                    if value is None or value is False:
+                        return None
+                completion = body(frame)
+                if completion is not None:
+                    if completion is BREAK:
+                        return None
+                    return completion
+                if increment is not None:
+                    increment(frame)
+
+        size = s.frame_size
+        if size is None:
+            return run_loop
+        interpreter = self.interpreter
+
+        def run_top_level(frame):
+            interpreter.grow_top_frame(size)
+            return run_loop(interpreter.top_frame)
+        return run_top_level
+
+    def visit_function_stmt(self, s: stmt.Function) -> Code:
+        define = self.define(s)
+        make = self.function(s)
+        if s.cell:
+            def declare_captured(frame):
+                # Captured by itself
+                cell = lox.Cell()
+                define(frame, cell)
+                cell.value = make(frame)
+            return declare_captured
+
+        def declare(frame):
+            define(frame, make(frame))
+        return declare
+
+    def visit_if_stmt(self, s: stmt.If) -> Code:
+        condition = s.condition.accept(self)
+        then_branch = s.then_branch.accept(self)
+        if s.else_branch is None:
+            def run_if(frame):
+                value = condition(frame)
+                if value is not None and value is not False:
+                    return then_branch(frame)
+                return None
+            return run_if
+        else_branch = s.else_branch.accept(self)
+
+        def run_if_else(frame):
+            value = condition(frame)
+            if value is not None and value is not False:
+                return then_branch(frame)
+            return else_branch(frame)
+        return run_if_else
+
+    def visit_print_stmt(self, s: stmt.Print) -> Code:
+        expression = s.expression.accept(self)
+        stringify = self.interpreter.stringify
+
+        def run(frame):
+            print(stringify(expression(frame)))
+        return run
+
+    def visit_return_stmt(self, s: stmt.Return) -> Code:
+        interpreter = self.interpreter
+        if s.value is None:
+            def return_nil(frame):
+                interpreter.returned = None
+                return RETURN
+            return return_nil
+        value = s.value.accept(self)
+
+        def return_value(frame):
+            interpreter.returned = value(frame)
+            return RETURN
+        return return_value
+
+    def visit_var_stmt(self, s: stmt.Var) -> Code:
+        initializer = s.initializer and s.initializer.accept(self)
+        if s.cell:
+            define = self.define(s)
+
+            def declare_captured(frame):
+                value = None if initializer is None else initializer(frame)
+                define(frame, lox.Cell(value))
+            return declare_captured
+        slot = s.slot
+        if slot is None:
+            define = self.define(s)
+
+            def declare_global(frame):
+                define(frame,
+                       None if initializer is None else initializer(frame))
+            return declare_global
+        if initializer is None:
+            def declare_nil(frame):
+                frame.values[slot] = None
+            return declare_nil
+
+        def declare(frame):
+            frame.values[slot] = initializer(frame)
+        return declare
+
+    def visit_while_stmt(self, s: stmt.While) -> Code:
+        condition = s.condition.accept(self)
+        body = s.body.accept(self)
+
+        def run_loop(frame):
+            while True:
+                value = condition(frame)
+                if value is None or value is False:
+                    return None
+                completion = body(frame)
+                if completion is not None:
+                    if completion is BREAK:
+                        return None
+                    return completion
+        return run_loop
+
+    def visit_assign_expr(self, e: expr.Assign) -> Code:
+        value = e.value.accept(self)
+        depth, slot = e.depth, e.slot
+        if depth is None:
+            globals = self.interpreter.globals
+            values = globals.values
+            name = e.name
+
+            def assign_global(frame):
+                result = value(frame)
+                if values[slot] is lox.UNDEFINED:
+                    raise globals.undefined(name)
+                values[slot] = result
+            return assign_global
+        if depth == 0:
+            if e.cell:
+                def assign_cell(frame):
+                    frame.values[slot].value = value(frame)
+                return assign_cell
+
+            def assign(frame):
+                frame.values[slot] = value(frame)
+            return assign
+        ancestor = self.ancestor(depth)
+        if e.cell:
+            def assign_enclosing_cell(frame):
+                result = value(frame)
+                ancestor(frame).values[slot].value = result
+            return assign_enclosing_cell
+
+        def assign_enclosing(frame):
+            result = value(frame)
+            ancestor(frame).values[slot] = result
+        return assign_enclosing
+
+    def ancestor(self, depth: int) -> Callable[[Frame], Frame]:
+        """Code finding the frame depth frames out"""
+        if depth == 1:
+            return lambda frame: frame.enclosing
+        if depth == 2:
+            return lambda frame: frame.enclosing.enclosing
+
+        def ancestor(frame):
+            return frame.ancestor(depth)
+        return ancestor
+
+    def visit_binary_expr(self, e: expr.Binary) -> Code:
+        left, right = e.left.accept(self), e.right.accept(self)
+        o = e.operator.type
+        if e.typed:
+            return self.typed_binary(e, left, right)
+        token = e.operator
+
+        if o is TT.PLUS:
+            def add(frame):
+                a, b = left(frame), right(frame)
+                if type(a) is float and type(b) is float:
+                    return a + b
+                _ = isinstance
+                if _(a, str) and _(b, float) or _(a, float) and _(b, str):
+                    return str(a) + str(b)
+                try:
+                    return a + b
+                except TypeError:
+                    raise lox.LoxRuntimeError(
+                        token, 'Operands must be two numbers or two strings')
+            return add
+
+        if o is TT.EQUAL_EQUAL:
+            return lambda frame: left(frame) == right(frame)
+        if o is TT.BANG_EQUAL:
+            return lambda frame: left(frame) != right(frame)
+        if o is TT.COMMA:
+            def comma(frame):
+                left(frame)
+                return right(frame)
+            return comma
+
+        # Number only expressions
+        def numbers():
+            return lox.LoxRuntimeError(token, 'Operands must be numbers')
+
+        if o is TT.MINUS:
+            def subtract(frame):
+                a, b = left(frame), right(frame)
+                if type(a) is float and type(b) is float:
+                    return a - b
+                raise numbers()
+            return subtract
+        if o is TT.STAR:
+            def multiply(frame):
+                a, b = left(frame), right(frame)
+                if type(a) is float and type(b) is float:
+                    return a * b
+                raise numbers()
+            return multiply
+        if o is TT.SLASH:
+            def divide(frame):
+                a, b = left(frame), right(frame)
+                if type(a) is float and type(b) is float:
+                    return a / b if b else NAN
+                raise numbers()
+            return divide
+        if o is TT.GREATER:
+            def greater(frame):
+                a, b = left(frame), right(frame)
+                if type(a) is float and type(b) is float:
+                    return a > b
+                raise numbers()
+            return greater
+        if o is TT.GREATER_EQUAL:
+            def greater_equal(frame):
+                a, b = left(frame), right(frame)
+                if type(a) is float and type(b) is float:
+                    return a >= b
+                raise numbers()
+            return greater_equal
+        if o is TT.LESS:
+            def less(frame):
+                a, b = left(frame), right(frame)
+                if type(a) is float and type(b) is float:
+                    return a < b
+                raise numbers()
+            return less
+        if o is TT.LESS_EQUAL:
+            def less_equal(frame):
+                a, b = left(frame), right(frame)
+                if type(a) is float and type(b) is float:
+                    return a <= b
+                raise numbers()
+            return less_equal
+        raise AssertionError(f'unknown operator {o}')  # pragma: no cover
+
+    def typed_binary(self, e: expr.Binary, left: Code, right: Code) -> Code:
+        """Code for an operator whose operands are known to be numbers, or
+        strings for '+', see lox.infer_types"""
+        o = e.operator.type
+        if type(e.right) is expr.Literal:
+            # Saves calling the operands' code, which is most of the time
+            # spent on simple operations like 'i + 1'
+            op = typed_operations[o]
+            value = e.right.value
+            if self.is_local(e.left):
+                slot = e.left.slot
+                return lambda frame: op(frame.values[slot], value)
+            return lambda frame: op(left(frame), value)
+        if self.is_local(e.left) and self.is_local(e.right):
+            op = typed_operations[o]
+            a, b = e.left.slot, e.right.slot
+
+            def operate_locals(frame):
+                values = frame.values
+                return op(values[a], values[b])
+            return operate_locals
+        if o is TT.PLUS:
+            return lambda frame: left(frame) + right(frame)
+        if o is TT.MINUS:
+            return lambda frame: left(frame) - right(frame)
+        if o is TT.STAR:
+            return lambda frame: left(frame) * right(frame)
+        if o is TT.SLASH:
+            def divide(frame):
+                a, b = left(frame), right(frame)
+                return a / b if b else NAN
+            return divide
+        if o is TT.GREATER:
+            return lambda frame: left(frame) > right(frame)
+        if o is TT.GREATER_EQUAL:
+            return lambda frame: left(frame) >= right(frame)
+        if o is TT.LESS:
+            return lambda frame: left(frame) < right(frame)
+        if o is TT.LESS_EQUAL:
+            return lambda frame: left(frame) <= right(frame)
+        raise AssertionError(f'untyped operator {o}')  # pragma: no cover
+
+    @staticmethod
+    def is_local(e: expr.Expr) -> bool:
+        """Whether e reads a local of the frame it's evaluated in"""
+        return type(e) is expr.Variable and e.depth == 0 and not e.cell
+
+    def visit_call_expr(self, e: expr.Call) -> Code:
+        interpreter = self.interpreter
+        arguments = self.arguments(e.arguments)
+        if e.checked:
+            # A global function or class taking these many arguments
+            globals = interpreter.globals
+            values = globals.values
+            slot, name = e.callee.slot, e.callee.name
+
+            def call_global(frame):
+                function = values[slot]
+                if function is lox.UNDEFINED:
+                    raise globals.undefined(name)
+                return function.call(interpreter, arguments(frame))
+            return call_global
+
+        callee = e.callee.accept(self)
+        paren = e.paren
+
+        def call(frame):
+            function = callee(frame)
+            values = arguments(frame)
+            if type(function) is CompiledFunction:
+                if len(values) == len(function.declaration.params):
+                    return function.call(interpreter, values)
+            elif not isinstance(function, lox.LoxCallable):
+                raise lox.LoxRuntimeError(
+                    paren, 'Can only call functions and classes.')
+            if len(values) != function.arity():
+                raise lox.LoxRuntimeError(
+                    paren,
+                    f'Expected {function.arity()} '
+                    f'arguments but got {len(values)}.')
+            return function.call(interpreter, values)
+        return call
+
+    def arguments(self, arguments: List[expr.Expr]) -> Callable[[Frame],
+                                                                list]:
+        """Code evaluating arguments into a new list"""
+        codes = [i.accept(self) for i in arguments]
+        if not codes:
+            return lambda frame: []
+        if len(codes) == 1:
+            first, = codes
+            return lambda frame: [first(frame)]
+        if len(codes) == 2:
+            first, second = codes
+            return lambda frame: [first(frame), second(frame)]
+        return lambda frame: [code(frame) for code in codes]
+
+    def visit_conditional_expr(self, e: expr.Conditional) -> Code:
+        condition = e.condition.accept(self)
+        then_branch = e.then_branch.accept(self)
+        else_branch = e.else_branch.accept(self)
+
+        def conditional(frame):
+            value = condition(frame)
+            if value is not None and value is not False:
+                return then_branch(frame)
+            return else_branch(frame)
+        return conditional
+
+    def visit_get_expr(self, e: expr.Get) -> Code:
+        object_ = e.object.accept(self)
+        name = e.name
+        interpreter = self.interpreter
+
+        def get(frame):
+            instance = object_(frame)
+            if isinstance(instance, lox.LoxInstance):
+                return instance.get(name, interpreter)
+            raise lox.LoxRuntimeError(
+                name, 'Can only access properties on instances and '
+                      'classes.')
+        return get
+
+    def visit_grouping_expr(self, e: expr.Grouping) -> Code:
+        return e.expression.accept(self)
+
+    def visit_inline_expr(self, e: expr.Inline) -> Code:
+        globals = self.interpreter.globals
+        values = globals.values
+        callee_slot, name = e.callee.slot, e.callee.name
+        arguments = self.arguments(e.arguments)
+        body = e.body.accept(self)
+        start = e.slot
+        end = start + len(e.arguments)
+
+        def inline(frame):
+            if values[callee_slot] is lox.UNDEFINED:
+                raise globals.undefined(name)
+            # Stored once all are evaluated, since they may be inlined calls
+            # storing theirs in the same slots
+            frame.values[start:end] = arguments(frame)
+            return body(frame)
+        return inline
+
+    def visit_literal_expr(self, e: expr.Literal) -> Code:
+        value = e.value
+        return lambda frame: value
+
+    def visit_logical_expr(self, e: expr.Logical) -> Code:
+        left, right = e.left.accept(self), e.right.accept(self)
+        if e.operator.type is TT.OR:
+            def or_(frame):
+                value = left(frame)
+                if value is not None and value is not False:
+                    return value
+                return right(frame)
+            return or_
+
+        def and_(frame):
+            value = left(frame)
+            if value is None or value is False:
+                return value
+            return right(frame)
+        return and_
+
+    def visit_set_expr(self, e: expr.Set) -> Code:
+        object_, value = e.object.accept(self), e.value.accept(self)
+        name = e.name
+        interpreter = self.interpreter
+
+        def set_(frame):
+            instance = object_(frame)
+            if not isinstance(instance, lox.LoxInstance):
+                raise lox.LoxRuntimeError(
+                    name, 'Can only set properties on instances.')
+            result = value(frame)
+            instance.set(name, result, interpreter)
+            return result
+        return set_
+
+    def visit_this_expr(self, e: expr.This) -> Code:
+        return self.local(e.depth, e.slot, False)
+
+    def visit_unary_expr(self, e: expr.Unary) -> Code:
+        right = e.right.accept(self)
+        if e.typed:
+            return lambda frame: -right(frame)
+        if e.operator.type is TT.BANG:
+            def not_(frame):
+                value = right(frame)
+                return value is None or value is False
+            return not_
+        token = e.operator
+
+        def negate(frame):
+            value = right(frame)
+            if type(value) is float:
+                return -value
+            raise lox.LoxRuntimeError(token, "Operand must be a number.")
+        return negate
+
+    def visit_variable_expr(self, e: expr.Variable) -> Code:
+        if e.depth is None:
+            globals = self.interpreter.globals
+            values = globals.values
+            slot, name = e.slot, e.name
+
+            def get_global(frame):
+                value = values[slot]
+                if value is lox.UNDEFINED:
+                    raise globals.undefined(name)
+                return value
+            return get_global
+        return self.local(e.depth, e.slot, e.cell)
+
+    def local(self, depth: int, slot: int, cell: bool) -> Code:
+        """Code reading a local"""
+        if depth == 0:
+            if cell:
+                return lambda frame: frame.values[slot].value
+            return lambda frame: frame.values[slot]
+        if depth == 1:
+            if cell:
+                return lambda frame: frame.enclosing.values[slot].value
+            return lambda frame: frame.enclosing.values[slot]
+        ancestor = self.ancestor(depth)
+        if cell:
+            return lambda frame: ancestor(frame).values[slot].value
+        return lambda frame: ancestor(frame).values[slot]
+
+
+class CompiledFunction(lox.LoxFunction):
+    """A function whose body is compiled, see Compiler
+
+    The body of a function parsed lazily is compiled on its first call.
+    """
+
+    def __init__(self, declaration: stmt.Function,
+                 closure: Optional['lox.Frame'],
+                 is_init: bool,
+                 body: Optional[Code],
+                 compiler: Compiler):
+        super().__init__(declaration, closure, is_init)
+        self.body = body
+        self.compiler = compiler
+
+    def call(self, interpreter: 'lox.Interpreter', arguments: list) -> object:
+        body = self.body
+        declaration = self.declaration
+        if body is None:
+            body = self.compile_body(interpreter)
+
+        # Same frame as lox.LoxFunction.call makes
+        locals = declaration.frame_size - len(arguments)
+        if locals:
+            arguments += [None] * locals
+        cells = declaration.cells
+        if cells:
+            for slot in cells:
+                arguments[slot] = lox.Cell(arguments[slot])
+
+        completion = body(lox.Frame(self.closure, arguments))
+        if self.is_init:
+            return self.closure.values[0]
+        if completion is RETURN:
+            return interpreter.returned
+        return None
+
+    def compile_body(self, interpreter: 'lox.Interpreter') -> Code:
+        declaration = self.declaration
+        bodies = self.compiler.bodies
+        body = bodies.get(declaration)
+        if body is None:
+            statements = declaration.body
+            if isinstance(statements, lox.LazyBody):
+                statements = self.parse_body(interpreter, statements)
+            body = bodies[declaration] = self.compiler.sequence(statements)
+        self.body = body
+        return body
+
+    def bind(self, instance):
+        environment = lox.Frame(self.closure, [instance])
+        return CompiledFunction(self.declaration, environment, self.is_init,
+                                self.body, self.compiler)
+
+
+class CompiledInterpreter(lox.Interpreter):
+    """Interpreter running code compiled by Compiler"""
+
+    def __init__(self, table: Optional['lox.GlobalTable'] = None):
+        super().__init__(table)
+        self.compiler = Compiler(self)
+
+    def interpret(self, statements: List[stmt.Stmt]) -> None:
+        self.globals.grow()
+        code = self.compiler.sequence(statements)
+        try:
+            code(None)
+        except lox.LoxRuntimeError as e:
+            lox.lox.runtime_error(e)
+
+    def interpret_expression(self, expression: expr.Expr) -> Optional[str]:
+        self.globals.grow()
+        code = self.compiler.compile(expression)
+        try:
+            return self.stringify(code(None))
+        except lox.LoxRuntimeError as e:
+            lox.lox.runtime_error(e)
+            return None
+
+
+__all__ = ['Compiler', 'CompiledFunction', 'CompiledInterpreter']
@@ -1,47 +1,111 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Union
 
 import lox
 
 
+# Value of the globals that haven't been defined yet
+UNDEFINED = object()
+
+
+class GlobalTable:
+    """Slots of the global variables of a program
+
+    The resolver numbers globals by name as it first sees them, so that
+    they're kept in a list at run time like locals. The table is shared
+    by everything resolving and running the same program.
+    """
+    __slots__ = ('slots', 'names')
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def slot(self, name: str) -> int:
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.names)
+            self.names.append(name)
+        return slot
+
+
 class Environment:
-    def __init__(self, enclosing: Optional['Environment'] = None):
-        self.values: Dict[str, object] = {}
-        self.enclosing = enclosing
+    """The global scope
 
-    def define(self, name: str, value: object) -> None:
-        self.values[name] = value
+    Values are kept by slot in the program's GlobalTable, globals that
+    aren't defined yet are UNDEFINED.
+    """
+    __slots__ = ('table', 'values')
 
-    def ancestor(self, distance: int) -> 'Environment':
-        environment = self
-        for i in range(distance):
-            environment = environment.enclosing
-        return environment
+    def __init__(self, table: Optional[GlobalTable] = None):
+        self.table = GlobalTable() if table is None else table
+        self.values: List[object] = []
+        self.grow()
+
+    def grow(self) -> None:
+        """Makes room for the globals added to the table since"""
+        missing = len(self.table.names) - len(self.values)
+        if missing:
+            self.values.extend([UNDEFINED] * missing)
+
+    def define(self, name: str, value: object) -> None:
+        slot = self.table.slot(name)
+        if slot >= len(self.values):
+            self.grow()
+        self.values[slot] = value
 
     def get(self, name: 'lox.Token') -> object:
-        try:
-            return self.values[name.lexeme]
-        except KeyError:
-            if self.enclosing:
-                # this is not used anymore
-                return self.enclosing.get(name)  # pragma: no cover
-            raise lox.LoxRuntimeError(
-                name, f"Undefined variable '{name.lexeme}'.")
-
-    def get_at(self, distance: int, name: str) -> object:
-        return self.ancestor(distance).values.get(name)
-
-    def assign(self, name: 'lox.Token', value: object):
-        if name.lexeme in self.values:
-            self.values[name.lexeme] = value
-        else:
-            if self.enclosing:
-                # this is not used anymore
-                return self.enclosing.assign(name, value)  # pragma: no cover
-            raise lox.LoxRuntimeError(
-                name, f"Undefined variable '{name.lexeme}'.")
-
-    def assign_at(self, distance: int, name: 'lox.Token', value: object):
-        self.ancestor(distance).values[name.lexeme] = value
-
-
-__all__ = ['Environment']
+        slot = self.table.slots.get(name.lexeme)
+        if slot is not None and slot < len(self.values):
+            value = self.values[slot]
+            if value is not UNDEFINED:
+                return value
+        raise self.undefined(name)
+
+    def undefined(self, name: 'lox.Token') -> 'lox.LoxRuntimeError':
+        return lox.LoxRuntimeError(
+            name, f"Undefined variable '{name.lexeme}'.")
+
+
+class Cell:
+    """A local variable shared by the scope declaring it and closures"""
+    __slots__ = ('value',)
+
+    def __init__(self, value: object = None):
+        self.value = value
+
+
+class Frame:
+    """The locals of a function call
+
+    The resolver gives every local of a function a slot, so the values are
+    kept in a list indexed by those slots and names are only needed to
+    resolve variables. All the scopes of a call share its frame: nothing
+    can refer to a frame after the call, since closures copy what they
+    capture.
+
+    The frame of a call is enclosed by the frame of the variables the
+    function captured (see stmt.Function), which encloses nothing, so
+    closures don't keep the scopes they were created in alive.
+    """
+    __slots__ = ('values', 'enclosing')
+
+    def __init__(self, enclosing: Union['Frame', Environment, None],
+                 values: Optional[List[object]] = None):
+        self.values = [] if values is None else values
+        self.enclosing = enclosing
+
+    def ancestor(self, distance: int) -> 'Frame':
+        frame = self
+        while distance:
+            frame = frame.enclosing
+            distance -= 1
+        return frame
+
+    def get_at(self, distance: int, slot: int) -> object:
+        return self.ancestor(distance).values[slot]
+
+    def assign_at(self, distance: int, slot: int, value: object):
+        self.ancestor(distance).values[slot] = value
+
+
+__all__ = ['GlobalTable', 'Environment', 'Cell', 'Frame', 'UNDEFINED']
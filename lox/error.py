@@ -8,14 +8,4 @@ class LoxRuntimeError(Exception):
         super().__init__(message)
 
 
-class LoxStopIteration(Exception):
-    pass
-
-
-class LoxReturn(Exception):
-    def __init__(self, value):
-        super().__init__()
-        self.value = value
-
-
-__all__ = ['LoxRuntimeError', 'LoxStopIteration', 'LoxReturn']
+__all__ = ['LoxRuntimeError']
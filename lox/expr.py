@@ -1,100 +1,253 @@
 """AUTOGENERATED! DO NOT EDIT! Make changes to tool/generate_ast.py instead"""
 from abc import ABC, abstractmethod
-from typing import Any, Generic, List, Optional, TypeVar
-from collections import namedtuple
+from typing import Any, Generic, List, Optional, Tuple, TypeVar
 from lox.token import Token
 
 T = TypeVar('T')
 
 class Expr:
+    __slots__ = ()
+    kind: int
     def accept(self, visitor: 'Visitor[T]') -> T: ...
-    def __hash__(self): return id(self)
 
-class Assign(Expr, namedtuple('Assign', 'name value')):
-    name: Token
-    value: Expr
+class Assign(Expr):
+    __slots__ = ('name', 'value', 'depth', 'slot', 'cell')
+    kind = 0
+
+    def __init__(self, name: Token, value: Expr, depth: Optional[int] = None, slot: Optional[int] = None, cell: bool = False):
+        self.name = name
+        self.value = value
+        self.depth = depth
+        self.slot = slot
+        self.cell = cell
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_assign_expr(self)
 
-class Binary(Expr, namedtuple('Binary', 'left operator right')):
-    left: Expr
-    operator: Token
-    right: Expr
+    def __repr__(self):
+        return f'Assign(name={self.name!r}, value={self.value!r}, depth={self.depth!r}, slot={self.slot!r}, cell={self.cell!r})'
+
+    def __reduce__(self):
+        return Assign, (self.name, self.value, self.depth, self.slot, self.cell)
+
+class Binary(Expr):
+    __slots__ = ('left', 'operator', 'right', 'typed', 'variant')
+    kind = 1
+
+    def __init__(self, left: Expr, operator: Token, right: Expr, typed: bool = False):
+        self.left = left
+        self.operator = operator
+        self.right = right
+        self.typed = typed
+        self.variant = None
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_binary_expr(self)
 
-class Call(Expr, namedtuple('Call', 'callee paren arguments')):
-    callee: Expr
-    paren: Token
-    arguments: List[Expr]
+    def __repr__(self):
+        return f'Binary(left={self.left!r}, operator={self.operator!r}, right={self.right!r}, typed={self.typed!r})'
+
+    def __reduce__(self):
+        return Binary, (self.left, self.operator, self.right, self.typed)
+
+class Call(Expr):
+    __slots__ = ('callee', 'paren', 'arguments', 'checked')
+    kind = 2
+
+    def __init__(self, callee: Expr, paren: Token, arguments: List[Expr], checked: bool = False):
+        self.callee = callee
+        self.paren = paren
+        self.arguments = arguments
+        self.checked = checked
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_call_expr(self)
 
-class Conditional(Expr, namedtuple('Conditional', 'condition then_branch else_branch')):
-    condition: Expr
-    then_branch: Expr
-    else_branch: Expr
+    def __repr__(self):
+        return f'Call(callee={self.callee!r}, paren={self.paren!r}, arguments={self.arguments!r}, checked={self.checked!r})'
+
+    def __reduce__(self):
+        return Call, (self.callee, self.paren, self.arguments, self.checked)
+
+class Conditional(Expr):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+    kind = 3
+
+    def __init__(self, condition: Expr, then_branch: Expr, else_branch: Expr):
+        self.condition = condition
+        self.then_branch = then_branch
+        self.else_branch = else_branch
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_conditional_expr(self)
 
-class Get(Expr, namedtuple('Get', 'object name')):
-    object: Expr
-    name: Token
+    def __repr__(self):
+        return f'Conditional(condition={self.condition!r}, then_branch={self.then_branch!r}, else_branch={self.else_branch!r})'
+
+    def __reduce__(self):
+        return Conditional, (self.condition, self.then_branch, self.else_branch)
+
+class Get(Expr):
+    __slots__ = ('object', 'name', 'variant')
+    kind = 4
+
+    def __init__(self, object: Expr, name: Token):
+        self.object = object
+        self.name = name
+        self.variant = None
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_get_expr(self)
 
-class Grouping(Expr, namedtuple('Grouping', 'expression')):
-    expression: Expr
+    def __repr__(self):
+        return f'Get(object={self.object!r}, name={self.name!r})'
+
+    def __reduce__(self):
+        return Get, (self.object, self.name)
+
+class Grouping(Expr):
+    __slots__ = ('expression',)
+    kind = 5
+
+    def __init__(self, expression: Expr):
+        self.expression = expression
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_grouping_expr(self)
 
-class Literal(Expr, namedtuple('Literal', 'value')):
-    value: Any
+    def __repr__(self):
+        return f'Grouping(expression={self.expression!r})'
+
+    def __reduce__(self):
+        return Grouping, (self.expression,)
+
+class Inline(Expr):
+    __slots__ = ('callee', 'arguments', 'slot', 'body')
+    kind = 6
+
+    def __init__(self, callee: Expr, arguments: List[Expr], slot: int, body: Expr):
+        self.callee = callee
+        self.arguments = arguments
+        self.slot = slot
+        self.body = body
+
+    def accept(self, visitor: 'Visitor[T]') -> T:
+        return visitor.visit_inline_expr(self)
+
+    def __repr__(self):
+        return f'Inline(callee={self.callee!r}, arguments={self.arguments!r}, slot={self.slot!r}, body={self.body!r})'
+
+    def __reduce__(self):
+        return Inline, (self.callee, self.arguments, self.slot, self.body)
+
+class Literal(Expr):
+    __slots__ = ('value',)
+    kind = 7
+
+    def __init__(self, value: Any):
+        self.value = value
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_literal_expr(self)
 
-class Logical(Expr, namedtuple('Logical', 'left operator right')):
-    left: Expr
-    operator: Token
-    right: Expr
+    def __repr__(self):
+        return f'Literal(value={self.value!r})'
+
+    def __reduce__(self):
+        return Literal, (self.value,)
+
+class Logical(Expr):
+    __slots__ = ('left', 'operator', 'right')
+    kind = 8
+
+    def __init__(self, left: Expr, operator: Token, right: Expr):
+        self.left = left
+        self.operator = operator
+        self.right = right
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_logical_expr(self)
 
-class Set(Expr, namedtuple('Set', 'object name value')):
-    object: Expr
-    name: Token
-    value: Expr
+    def __repr__(self):
+        return f'Logical(left={self.left!r}, operator={self.operator!r}, right={self.right!r})'
+
+    def __reduce__(self):
+        return Logical, (self.left, self.operator, self.right)
+
+class Set(Expr):
+    __slots__ = ('object', 'name', 'value')
+    kind = 9
+
+    def __init__(self, object: Expr, name: Token, value: Expr):
+        self.object = object
+        self.name = name
+        self.value = value
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_set_expr(self)
 
-class This(Expr, namedtuple('This', 'keyword')):
-    keyword: Token
+    def __repr__(self):
+        return f'Set(object={self.object!r}, name={self.name!r}, value={self.value!r})'
+
+    def __reduce__(self):
+        return Set, (self.object, self.name, self.value)
+
+class This(Expr):
+    __slots__ = ('keyword', 'depth', 'slot')
+    kind = 10
+
+    def __init__(self, keyword: Token, depth: Optional[int] = None, slot: Optional[int] = None):
+        self.keyword = keyword
+        self.depth = depth
+        self.slot = slot
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_this_expr(self)
 
-class Unary(Expr, namedtuple('Unary', 'operator right')):
-    operator: Token
-    right: Expr
+    def __repr__(self):
+        return f'This(keyword={self.keyword!r}, depth={self.depth!r}, slot={self.slot!r})'
+
+    def __reduce__(self):
+        return This, (self.keyword, self.depth, self.slot)
+
+class Unary(Expr):
+    __slots__ = ('operator', 'right', 'typed', 'variant')
+    kind = 11
+
+    def __init__(self, operator: Token, right: Expr, typed: bool = False):
+        self.operator = operator
+        self.right = right
+        self.typed = typed
+        self.variant = None
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_unary_expr(self)
 
-class Variable(Expr, namedtuple('Variable', 'name')):
-    name: Token
+    def __repr__(self):
+        return f'Unary(operator={self.operator!r}, right={self.right!r}, typed={self.typed!r})'
+
+    def __reduce__(self):
+        return Unary, (self.operator, self.right, self.typed)
+
+class Variable(Expr):
+    __slots__ = ('name', 'depth', 'slot', 'cell')
+    kind = 12
+
+    def __init__(self, name: Token, depth: Optional[int] = None, slot: Optional[int] = None, cell: bool = False):
+        self.name = name
+        self.depth = depth
+        self.slot = slot
+        self.cell = cell
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_variable_expr(self)
 
+    def __repr__(self):
+        return f'Variable(name={self.name!r}, depth={self.depth!r}, slot={self.slot!r}, cell={self.cell!r})'
+
+    def __reduce__(self):
+        return Variable, (self.name, self.depth, self.slot, self.cell)
+
 R = TypeVar('R')
 
 class Visitor(Generic[R], ABC):
@@ -111,6 +264,8 @@ class Visitor(Generic[R], ABC):
     @abstractmethod
     def visit_grouping_expr(self, e: Grouping) -> R: ...
     @abstractmethod
+    def visit_inline_expr(self, e: Inline) -> R: ...
+    @abstractmethod
     def visit_literal_expr(self, e: Literal) -> R: ...
     @abstractmethod
     def visit_logical_expr(self, e: Logical) -> R: ...
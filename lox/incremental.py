@@ -0,0 +1,271 @@
+"""Incremental front end
+
+A Document keeps a program split into chunks of top-level declarations.
+When the source is updated, only the chunks overlapping the edited range
+are scanned, parsed and resolved again, so the time an update takes grows
+with the size of the edit rather than the size of the program.
+
+A chunk starts at the beginning of a line whose first token is a 'fun',
+'class' or 'var' outside of any braces and parentheses that follows a ';'
+or a '}', like the pieces of lox.parallel. The scanner is at the start of a
+token there and the parser at the start of a declaration. Top-level
+declarations are resolved independently of each other, since globals are
+looked up dynamically. Their slots are kept in a table for the whole
+document, which only ever grows. Calls aren't checked statically (see
+lox.Resolver), since an edit anywhere could reassign a function.
+
+After an edit, source is scanned from the start of the chunk the edit
+begins in until the scan cleanly reaches the start of one of the unchanged
+chunks following it: at a line start, with all braces and parentheses
+closed after a ';' or a '}'. Only the chunks before that one are parsed and
+resolved again. If the edit changed the number of lines, the tokens of the
+chunks after it are moved to their new lines, which is still several times
+cheaper than parsing them again.
+
+Diagnostics have to match a full run, so if the updated chunks have any
+errors, the whole program is scanned, parsed and resolved again to report
+them, and the next update starts from scratch.
+"""
+import contextlib
+import io
+import itertools
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+import lox
+import lox.expr as expr
+import lox.lox
+import lox.stmt as stmt
+from lox.token import Token, TokenList, TokenType as TT
+
+# Lines that may start a chunk, the scan tells which of them really do
+chunk_start = re.compile(r'^[ \t\r\f\v]*(?:fun|class|var)\b', re.MULTILINE)
+statement_ends = {TT.SEMICOLON, TT.RIGHT_BRACE}
+node_types = {*expr.Expr.__subclasses__(), *stmt.Stmt.__subclasses__()}
+
+# Characters compared at a time when looking for the edited range
+BLOCK = 4096
+
+
+class Chunk:
+    """Top-level declarations starting at a line start"""
+    __slots__ = ('offset', 'line', 'statements', 'optimized')
+
+    def __init__(self, offset: int, line: int):
+        self.offset = offset
+        self.line = line
+        self.statements: List[stmt.Stmt] = []
+        # Whether statements have been optimized, see Document.optimize
+        self.optimized = False
+
+
+class Document:
+    """A program that can be updated with new versions of its source"""
+
+    def __init__(self):
+        self.source = ''
+        # None until the source has been built without errors
+        self.chunks: Optional[List[Chunk]] = None
+        self.table = lox.GlobalTable()
+
+    @property
+    def statements(self) -> List[stmt.Stmt]:
+        return list(itertools.chain.from_iterable(
+            chunk.statements for chunk in self.chunks))
+
+    def optimize(self) -> None:
+        """Optimizes the chunks that haven't been since they were parsed
+
+        lox.Optimizer rewrites statements in place, so the others, already
+        rewritten, are left as they are. Each chunk is optimized on its own,
+        which is the same as optimizing the whole program as long as no call
+        is inlined, and calls aren't checked in documents.
+        """
+        optimizer = lox.Optimizer()
+        for chunk in self.chunks:
+            if not chunk.optimized:
+                chunk.statements = optimizer.optimize(chunk.statements)
+                chunk.optimized = True
+
+    def update(self, source: str) -> bool:
+        """Brings the program up to date with source
+
+        Errors are reported as in a full run. Returns whether the program
+        is free of them and can be run.
+        """
+        if self.chunks is None:
+            return self.build(source)
+        if source == self.source:
+            return True
+
+        # Errors are reported by the full build, if there are any
+        lox.lox.had_error = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            updated = self.rebuild(source)
+        if not updated:
+            lox.lox.had_error = False
+            return self.build(source)
+        return True
+
+    def build(self, source: str) -> bool:
+        """Builds the program from scratch"""
+        self.source = source
+        self.chunks = None
+        tokens, starts, _, _ = self.scan(source, 0, 1, set())
+        chunks = self.parse(tokens, starts, Chunk(0, 1))
+        if lox.lox.had_error:
+            return False
+        self.chunks = chunks
+        return True
+
+    def rebuild(self, source: str) -> bool:
+        """Updates the chunks the edit touched, returns whether it could"""
+        old = self.source
+        chunks = self.chunks
+        start = common_prefix(old, source)
+        old_end = len(old) - common_suffix(old, source, start)
+        delta = len(source) - len(old)
+
+        # The edit starts in chunk first and ends before chunk last
+        first = 0
+        while first + 1 < len(chunks) and chunks[first + 1].offset <= start:
+            first += 1
+        last = first + 1
+        while last < len(chunks) and chunks[last].offset < old_end:
+            last += 1
+
+        head = chunks[first]
+        stops = {chunk.offset + delta for chunk in chunks[last:]}
+        tokens, starts, end, line = self.scan(source, head.offset, head.line,
+                                              stops)
+        if end in stops:
+            while chunks[last].offset + delta != end:
+                last += 1
+        else:
+            last = len(chunks)
+        replaced = self.parse(tokens, starts, Chunk(head.offset, head.line))
+        if lox.lox.had_error:
+            return False
+        if first and not replaced[0].statements:
+            # Only the first chunk of the program can be empty
+            del replaced[0]
+
+        lines = line - chunks[last].line if last < len(chunks) else 0
+        for chunk in chunks[last:]:
+            chunk.offset += delta
+            if lines:
+                chunk.line += lines
+                shift_lines(chunk.statements, lines)
+        chunks[first:last] = replaced
+        self.source = source
+        return True
+
+    def scan(self, source: str, start: int, line: int, stops: Set[int]
+             ) -> Tuple[TokenList, Dict[int, Tuple[int, int]], int, int]:
+        """Scans source from start until the scan cleanly reaches one of
+        stops, or to the end of source
+
+        Returns the tokens with an EOF, the chunks starting in them as
+        (offset, line) by token index, and the position and line number the
+        scan ended at.
+        """
+        scanner = lox.RegexScanner(source)
+        scanner.current, scanner.line = start, line
+        tokens = scanner.tokens
+        starts = {}
+        depth = 0
+        previous = TT.SEMICOLON
+        checked = 0
+        for m in chunk_start.finditer(source, start + 1):
+            end = m.start()
+            # Stops short of a string or block comment reaching past end
+            scanner.scan_lines(end, False)
+            if scanner.current != end:
+                continue
+            for i in range(checked, len(tokens)):
+                type = tokens[i].type
+                if type is TT.LEFT_BRACE or type is TT.LEFT_PAREN:
+                    depth += 1
+                elif type is TT.RIGHT_BRACE or type is TT.RIGHT_PAREN:
+                    depth -= 1
+                previous = type
+            checked = len(tokens)
+            if depth == 0 and previous in statement_ends:
+                if end in stops:
+                    break
+                starts[len(tokens)] = end, scanner.line
+        else:
+            scanner.scan_lines(len(source), True)
+        tokens.append(Token(TT.EOF, '', None, scanner.line))
+        return tokens, starts, scanner.current, scanner.line
+
+    def parse(self, tokens: TokenList, starts: Dict[int, Tuple[int, int]],
+              head: Chunk) -> List[Chunk]:
+        """Parses and resolves tokens into chunks, the first one being
+        head"""
+        chunks = [head]
+        parser = lox.Parser(tokens)
+        while not parser.is_at_end:
+            if parser.current in starts and chunks[-1].statements:
+                chunks.append(Chunk(*starts[parser.current]))
+            chunks[-1].statements.append(parser.run(parser.declaration()))
+        if lox.lox.had_error:
+            return chunks
+
+        resolver = lox.Resolver(self.table, types=True)
+        for chunk in chunks:
+            resolver.resolve(chunk.statements)
+        return chunks
+
+
+def common_prefix(a: str, b: str) -> int:
+    """Length of the longest common prefix of a and b"""
+    limit = min(len(a), len(b))
+    n = 0
+    while n + BLOCK <= limit and a[n:n + BLOCK] == b[n:n + BLOCK]:
+        n += BLOCK
+    while n < limit and a[n] == b[n]:
+        n += 1
+    return n
+
+
+def common_suffix(a: str, b: str, prefix: int) -> int:
+    """Length of the longest common suffix of a and b that doesn't overlap
+    their first prefix characters"""
+    limit = min(len(a), len(b)) - prefix
+    n = 0
+    while n + BLOCK <= limit and a[len(a) - n - BLOCK:len(a) - n] \
+            == b[len(b) - n - BLOCK:len(b) - n]:
+        n += BLOCK
+    while n < limit and a[len(a) - n - 1] == b[len(b) - n - 1]:
+        n += 1
+    return n
+
+
+def shift_lines(statements: List[stmt.Stmt], delta: int) -> None:
+    """Moves the tokens in statements delta lines down"""
+    new = tuple.__new__
+    nodes = list(statements)
+    while nodes:
+        node = nodes.pop()
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if type(value) is Token:
+                t, lexeme, literal, line = value
+                setattr(node, name,
+                        new(Token, (t, lexeme, literal, line + delta)))
+            elif type(value) in node_types:
+                nodes.append(value)
+            elif type(value) is list:
+                for i, item in enumerate(value):
+                    if type(item) is Token:
+                        t, lexeme, literal, line = item
+                        value[i] = new(Token,
+                                       (t, lexeme, literal, line + delta))
+                    elif type(item) in node_types:
+                        nodes.append(item)
+
+
+__all__ = [
+    'Document',
+]
@@ -0,0 +1,170 @@
+"""Static types of expressions
+
+An optional pass of the resolver (see lox.Resolver) over the code it has
+resolved. It finds the Binary and Unary expressions whose operands can only
+be numbers, or only strings for '+', and marks them typed, so that the
+interpreter evaluates them without checking their operands.
+
+A type is the set of the kinds of values an expression can evaluate to, as
+a bit mask. Locals have the union of the types of the values assigned to
+them anywhere, closures included. Parameters, globals, calls and properties
+can be anything. Types only grow as more of the values assigned to locals
+are known, so the code is gone over until they stop changing, which takes
+two passes unless a loop feeds a local to another declared before it.
+"""
+from typing import Dict, List, Union
+
+import lox
+import lox.expr as expr
+import lox.stmt as stmt
+from lox.token import TokenType as TT
+
+NUMBER = 1
+STRING = 2
+BOOLEAN = 4
+NIL = 8
+# Functions, classes, instances, and the integers '+' makes of booleans
+OBJECT = 16
+ANY = NUMBER | STRING | BOOLEAN | NIL | OBJECT
+
+literal_types = {float: NUMBER, str: STRING, bool: BOOLEAN,
+                 type(None): NIL}
+arithmetic = {TT.MINUS, TT.STAR, TT.SLASH}
+comparisons = {TT.GREATER, TT.GREATER_EQUAL, TT.LESS, TT.LESS_EQUAL}
+node_types = {*expr.Expr.__subclasses__(), *stmt.Stmt.__subclasses__()}
+expr_types = set(expr.Expr.__subclasses__())
+# Fields of each node class that hold nodes or lists of them
+children = {
+    cls: tuple(name for name, t in cls.__init__.__annotations__.items()
+               if any(i in str(t) for i in ('Expr', 'Stmt', 'Function')))
+    for cls in node_types
+}
+
+Node = Union[expr.Expr, stmt.Stmt]
+
+
+def infer_types(root: Union[List[stmt.Stmt], Node],
+                variables: List['lox.resolver.VarState']) -> None:
+    """Marks the typed expressions in root, whose locals are variables"""
+    nodes = [node for node in postorder(root)
+             if type(node) in expr_types or type(node) is stmt.Var]
+    # Var declarations, Variables and Assigns by the local they refer to
+    states: Dict[Node, 'lox.resolver.VarState'] = {}
+    types: Dict['lox.resolver.VarState', int] = {}
+    for state in variables:
+        declaration = state.declaration
+        if type(declaration) is stmt.Var:
+            states[declaration] = state
+            types[state] = 0 if declaration.initializer else NIL
+        elif type(declaration) is stmt.Function \
+                and state.name is not declaration.name:
+            # A parameter
+            types[state] = ANY
+        else:
+            types[state] = OBJECT
+        for node in state.nodes:
+            states[node] = state
+
+    values: Dict[expr.Expr, int] = {}
+    changed = True
+    while changed:
+        changed = False
+        for node in nodes:
+            kind = type(node)
+            if kind is stmt.Var or kind is expr.Assign:
+                state = states.get(node)
+                value = node.initializer if kind is stmt.Var else node.value
+                if state is not None and value is not None:
+                    t = types[state]
+                    if t | values[value] != t:
+                        types[state] = t | values[value]
+                        changed = True
+                if kind is expr.Assign:
+                    # Assignments evaluate to nil
+                    values[node] = NIL
+            elif kind is expr.Variable:
+                state = states.get(node)
+                values[node] = ANY if state is None else types[state]
+            else:
+                values[node] = expression_type(node, values)
+
+    for node in nodes:
+        kind = type(node)
+        if kind is expr.Binary:
+            left, right = values[node.left], values[node.right]
+            o = node.operator.type
+            if o is TT.PLUS:
+                node.typed = left == right and left in (NUMBER, STRING)
+            else:
+                node.typed = left == right == NUMBER \
+                    and (o in arithmetic or o in comparisons)
+        elif kind is expr.Unary:
+            node.typed = node.operator.type is TT.MINUS \
+                and values[node.right] == NUMBER
+
+
+def expression_type(e: expr.Expr, values: Dict[expr.Expr, int]) -> int:
+    """Type of e, given the types of its operands"""
+    kind = type(e)
+    if kind is expr.Literal:
+        return literal_types.get(type(e.value), ANY)
+    if kind is expr.Binary:
+        o = e.operator.type
+        if o in arithmetic:
+            # Or it fails
+            return NUMBER
+        if o is TT.PLUS:
+            return plus_type(values[e.left], values[e.right])
+        if o is TT.COMMA:
+            return values[e.right]
+        return BOOLEAN
+    if kind is expr.Unary:
+        return NUMBER if e.operator.type is TT.MINUS else BOOLEAN
+    if kind is expr.Grouping:
+        return values[e.expression]
+    if kind is expr.Logical:
+        return values[e.left] | values[e.right]
+    if kind is expr.Conditional:
+        return values[e.then_branch] | values[e.else_branch]
+    if kind is expr.Set:
+        return values[e.value]
+    return ANY
+
+
+def plus_type(left: int, right: int) -> int:
+    if not left or not right:
+        # Not known yet
+        return 0
+    if (left | right) & ~(NUMBER | STRING):
+        # Python's + accepts booleans, and objects may be anything
+        return ANY
+    t = 0
+    if left & NUMBER and right & NUMBER:
+        t |= NUMBER
+    if (left | right) & STRING:
+        t |= STRING
+    return t
+
+
+def postorder(root: Union[List[stmt.Stmt], Node]) -> List[Node]:
+    """The nodes in root, each after the nodes in it, in source order
+
+    Bodies that haven't been parsed yet are skipped.
+    """
+    nodes = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if type(node) is list:
+            stack.extend(i for i in node if type(i) in node_types)
+            continue
+        nodes.append(node)
+        for name in children[type(node)]:
+            value = getattr(node, name)
+            if type(value) in node_types or type(value) is list:
+                stack.append(value)
+    nodes.reverse()
+    return nodes
+
+
+__all__ = ['infer_types']
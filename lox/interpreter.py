@@ -1,20 +1,40 @@
-from typing import Optional, Dict, List
+from enum import Enum
+from typing import Optional, List, Union
 
 import lox
 import lox.expr as expr
 import lox.stmt as stmt
-from lox.token import TokenType as TT, Token
+from lox.token import TokenType as TT
 
 
-class Interpreter(expr.Visitor[object], stmt.Visitor[None]):
-    def __init__(self):
-        self.globals = lox.Environment()
+class Completion(Enum):
+    """How a statement was left, if it didn't run to its end
+
+    Executing a statement returns None, or one of these to be passed up
+    by the statements around it until the loop or call it's meant for
+    handles it. The value of a return is in Interpreter.returned.
+    """
+    BREAK = 1
+    RETURN = 2
+
+
+class Interpreter(expr.Visitor[object], stmt.Visitor[Optional[Completion]]):
+    def __init__(self, table: Optional['lox.GlobalTable'] = None):
+        """table has the slots the statements to interpret were resolved
+        with"""
+        self.globals = lox.Environment(table)
         self.environment = self.globals
-        self.environment.define('clock', lox.lox_clock)
-        self.locals: Dict[expr.Expr, int] = {}
+        # Locals of top-level blocks, see stmt.Block
+        self.top_frame = lox.Frame(self.globals)
+        # Value of the last return statement executed
+        self.returned: object = None
+        self.jit = lox.JIT(self)
+        for name, native in lox.natives.items():
+            self.environment.define(name, native)
 
     def interpret(self, statements: List[stmt.Stmt]) -> None:
         """Interprets expression and reports if runtime error occured"""
+        self.globals.grow()
         try:
             for s in statements:
                 self.execute(s)
@@ -24,50 +44,68 @@ class Interpreter(expr.Visitor[object], stmt.Visitor[None]):
 
     def interpret_expression(self, expression: expr.Expr) -> Optional[str]:
         """Evaluates expression and returns stringified value"""
+        self.globals.grow()
         try:
             return self.stringify(self.evaluate(expression))
         except lox.LoxRuntimeError as e:
             lox.lox.runtime_error(e)
             return None
 
-    def execute(self, s: stmt.Stmt) -> None:
+    def execute(self, s: stmt.Stmt) -> Optional[Completion]:
         return s.accept(self)
 
     def execute_block(self,
                       statements: List[stmt.Stmt],
-                      environment: lox.Environment):
+                      environment: lox.Frame) -> Optional[Completion]:
         previous = self.environment
         try:
             self.environment = environment
             for statement in statements:
-                self.execute(statement)
+                completion = statement.accept(self)
+                if completion is not None:
+                    return completion
         finally:
             self.environment = previous
 
-    def resolve(self, e: expr.Expr, depth: int):
-        self.locals[e] = depth
+    def visit_break_stmt(self, s: stmt.Break) -> Optional[Completion]:
+        return Completion.BREAK
 
-    def visit_break_stmt(self, s: stmt.Break) -> None:
-        raise lox.LoxStopIteration()
+    def visit_block_stmt(self, s: stmt.Block) -> Optional[Completion]:
+        size = s.frame_size
+        if size is None:
+            for statement in s.statements:
+                completion = statement.accept(self)
+                if completion is not None:
+                    return completion
+            return None
+        self.grow_top_frame(size)
+        return self.execute_block(s.statements, self.top_frame)
 
-    def visit_block_stmt(self, s: stmt.Block) -> None:
-        self.execute_block(s.statements, lox.Environment(self.environment))
+    def grow_top_frame(self, size: int) -> None:
+        values = self.top_frame.values
+        if len(values) < size:
+            values.extend([None] * (size - len(values)))
 
     def visit_class_stmt(self, s: stmt.Class) -> None:
+        if s.cell:
+            # Captured by its own methods
+            cell = lox.Cell()
+            self.define(s, cell)
+
         methods = {i.name.lexeme: lox.LoxFunction(
-            i, self.environment, i.name.lexeme == 'init')
+            i, self.capture(i), i.name.lexeme == 'init')
             for i in s.methods}
 
         class_methods = {i.name.lexeme: lox.LoxFunction(
-            i, self.environment, False)
+            i, self.capture(i), False)
             for i in s.class_methods}
 
         setters = {i.name.lexeme: lox.LoxFunction(
-            i, self.environment, False)
+            i, self.capture(i), False)
             for i in s.setters}
 
         class_setters = {i.name.lexeme: lox.LoxFunction(
-            i, self.environment, False)
+            i, self.capture(i), False)
             for i in s.class_setters}
 
         meta = lox.LoxClass(
@@ -77,99 +115,156 @@ class Interpreter(expr.Visitor[object], stmt.Visitor[None]):
             setters=class_setters
         )
         class_ = lox.LoxClass(meta, s.name.lexeme, methods, setters)
-        self.environment.define(s.name.lexeme, class_)
+        if s.cell:
+            cell.value = class_
+        else:
+            self.define(s, class_)
 
     def visit_expression_stmt(self, s: stmt.Expression) -> None:
         self.evaluate(s.expression)
 
+    def visit_for_stmt(self, s: stmt.For) -> Optional[Completion]:
+        size = s.frame_size
+        if size is None:
+            return self.run_loop(s)
+        self.grow_top_frame(size)
+        previous = self.environment
+        try:
+            self.environment = self.top_frame
+            return self.run_loop(s)
+        finally:
+            self.environment = previous
+
+    def run_loop(self, s: stmt.For) -> Optional[Completion]:
+        if s.initializer:
+            s.initializer.accept(self)
+        jit = self.jit
+        completion = jit.enter(s)
+        if completion is not lox.DEOPT:
+            return completion
+        condition, increment, body = s.condition, s.increment, s.body
+        is_truthy = self.is_truthy
+        threshold, iterations = jit.threshold, 0
+        while condition is None or is_truthy(condition.accept(self)):
+            completion = body.accept(self)
+            if completion is not None:
+                if completion is Completion.BREAK:
+                    break
+                return completion
+            if increment is not None:
+                increment.accept(self)
+            iterations += 1
+            if iterations == threshold:
+                completion = jit.hot(s)
+                if completion is not lox.DEOPT:
+                    return completion
+        return None
+
     def visit_function_stmt(self, s: stmt.Function) -> None:
-        function = lox.LoxFunction(s, self.environment)
-        self.environment.define(s.name.lexeme, function)
+        if s.cell:
+            # Captured by itself
+            cell = lox.Cell()
+            self.define(s, cell)
+            cell.value = lox.LoxFunction(s, self.capture(s))
+        else:
+            self.define(s, lox.LoxFunction(s, self.capture(s)))
+
+    def define(self, s: Union[stmt.Var, stmt.Function, stmt.Class],
+               value: object) -> None:
+        if s.slot is None:
+            self.globals.define(s.name.lexeme, value)
+        else:
+            self.environment.values[s.slot] = value
 
-    def visit_if_stmt(self, s: stmt.If) -> None:
+    def capture(self, function: stmt.Function) -> Optional[lox.Frame]:
+        """Frame of the variables function captures where it's declared"""
+        captures = function.captures
+        if not captures:
+            return None
+        values = []
+        for depth, slot in captures:
+            frame = self.environment
+            while depth:
+                frame = frame.enclosing
+                depth -= 1
+            values.append(frame.values[slot])
+        return lox.Frame(None, values)
+
+    def visit_if_stmt(self, s: stmt.If) -> Optional[Completion]:
         if self.is_truthy(self.evaluate(s.condition)):
-            self.execute(s.then_branch)
+            return s.then_branch.accept(self)
         elif s.else_branch:
-            self.execute(s.else_branch)
+            return s.else_branch.accept(self)
+        return None
 
     def visit_print_stmt(self, s: stmt.Print) -> None:
         value = self.evaluate(s.expression)
         print(self.stringify(value))
 
-    def visit_return_stmt(self, s: stmt.Return) -> None:
-        value = s.value and self.evaluate(s.value)
-        raise lox.LoxReturn(value)
-
-    def visit_while_stmt(self, s: stmt.While) -> None:
-        while self.is_truthy(self.evaluate(s.condition)):
-            try:
-                self.execute(s.body)
-            except lox.LoxStopIteration:
-                break
+    def visit_return_stmt(self, s: stmt.Return) -> Optional[Completion]:
+        self.returned = s.value and self.evaluate(s.value)
+        return Completion.RETURN
+
+    def visit_while_stmt(self, s: stmt.While) -> Optional[Completion]:
+        jit = self.jit
+        completion = jit.enter(s)
+        if completion is not lox.DEOPT:
+            return completion
+        condition, body = s.condition, s.body
+        threshold, iterations = jit.threshold, 0
+        while self.is_truthy(condition.accept(self)):
+            completion = body.accept(self)
+            if completion is not None:
+                if completion is Completion.BREAK:
+                    break
+                return completion
+            iterations += 1
+            if iterations == threshold:
+                # Hot, the rest of it may run compiled, see lox.JIT
+                completion = jit.hot(s)
+                if completion is not lox.DEOPT:
+                    return completion
+        return None
 
     def visit_var_stmt(self, s: stmt.Var) -> None:
-        self.environment.define(
-            s.name.lexeme,
-            self.evaluate(s.initializer) if s.initializer else None)
+        value = self.evaluate(s.initializer) if s.initializer else None
+        if s.cell:
+            value = lox.Cell(value)
+        self.define(s, value)
 
     def evaluate(self, expression: expr.Expr):
         return expression.accept(self)
 
     def visit_assign_expr(self, e: expr.Assign):
         value = self.evaluate(e.value)
-        distance = self.locals.get(e)
-        if distance is not None:
-            return self.environment.assign_at(distance, e.name, value)
+        depth = e.depth
+        if depth is not None:
+            frame = self.environment
+            while depth:
+                frame = frame.enclosing
+                depth -= 1
+            if e.cell:
+                frame.values[e.slot].value = value
+            else:
+                frame.values[e.slot] = value
         else:
-            return self.globals.assign(e.name, value)
+            values = self.globals.values
+            if values[e.slot] is lox.UNDEFINED:
+                raise self.globals.undefined(e.name)
+            values[e.slot] = value
 
     def visit_binary_expr(self, e: expr.Binary):
-        a, b = e.left.accept(self), e.right.accept(self)
-        o = e.operator.type
-
-        if o == TT.PLUS:
-            _ = isinstance
-            if _(a, str) and _(b, float) or _(a, float) and _(b, str):
-                return str(a) + str(b)
-            try:
-                return a + b
-            except TypeError:
-                raise lox.LoxRuntimeError(
-                    e.operator,
-                    'Operands must be two numbers or two strings'
-                )
-
-        if o == TT.EQUAL_EQUAL:
-            return a == b
-        if o == TT.BANG_EQUAL:
-            return a != b
-        if o == TT.COMMA:
-            return b
-
-        # Number only expressions
-        if not (isinstance(a, float) and isinstance(b, float)):
-            raise lox.LoxRuntimeError(e.operator, 'Operands must be numbers')
-
-        if o == TT.MINUS:
-            return a - b
-        if o == TT.STAR:
-            return a * b
-        if o == TT.SLASH:
-            try:
-                return a / b
-            except ZeroDivisionError:
-                return float('nan')
-        if o == TT.GREATER:
-            return a > b
-        if o == TT.GREATER_EQUAL:
-            return a >= b
-        if o == TT.LESS:
-            return a < b
-        if o == TT.LESS_EQUAL:
-            return a <= b
-        # unreachable
+        return (e.variant or lox.specialize_binary)(self, e)
 
     def visit_call_expr(self, e: expr.Call):
+        if e.checked:
+            # A global function or class taking these many arguments
+            function = self.globals.values[e.callee.slot]
+            if function is lox.UNDEFINED:
+                raise self.globals.undefined(e.callee.name)
+            return function.call(self,
+                                 [self.evaluate(i) for i in e.arguments])
+
         callee = self.evaluate(e.callee)
         arguments = [self.evaluate(i) for i in e.arguments]
 
@@ -192,17 +287,21 @@ class Interpreter(expr.Visitor[object], stmt.Visitor[None]):
             return e.else_branch.accept(self)
 
     def visit_get_expr(self, e: expr.Get):
-        instance: 'lox.LoxInstance' = e.object.accept(self)
-        if isinstance(instance, lox.LoxInstance):
-            prop = instance.get(e.name, self)
-            return prop
-
-        raise lox.LoxRuntimeError(
-            e.name, 'Can only access properties on instances and classes.')
+        return (e.variant or lox.specialize_get)(self, e)
 
     def visit_grouping_expr(self, e: expr.Grouping):
         return e.expression.accept(self)
 
+    def visit_inline_expr(self, e: expr.Inline):
+        if self.globals.values[e.callee.slot] is lox.UNDEFINED:
+            raise self.globals.undefined(e.callee.name)
+        arguments = [self.evaluate(i) for i in e.arguments]
+        # Stored once all are evaluated, since they may be inlined calls
+        # storing theirs in the same slots
+        slot = e.slot
+        self.environment.values[slot:slot + len(arguments)] = arguments
+        return e.body.accept(self)
+
     def visit_literal_expr(self, e: expr.Literal):
         return e.value
 
@@ -226,29 +325,25 @@ class Interpreter(expr.Visitor[object], stmt.Visitor[None]):
         return value
 
     def visit_this_expr(self, e: expr.This):
-        return self.look_up_variable(e.keyword, e)
+        return self.environment.get_at(e.depth, e.slot)
 
     def visit_unary_expr(self, e: expr.Unary):
-        a = e.right.accept(self)
-        o = e.operator.type
-        if o == TT.BANG:
-            return not self.is_truthy(a)
-        if o == TT.MINUS:
-            if not isinstance(a, float):
-                raise lox.LoxRuntimeError(
-                    e.operator, "Operand must be a number.")
-            return -a
-        # unreachable
+        return (e.variant or lox.specialize_unary)(self, e)
 
     def visit_variable_expr(self, e: expr.Variable):
-        return self.look_up_variable(e.name, e)
-
-    def look_up_variable(self, name: Token, e: expr.Expr):
-        distance = self.locals.get(e)
-        if distance is not None:
-            return self.environment.get_at(distance, name.lexeme)
-        else:
-            return self.globals.get(name)
+        depth = e.depth
+        if depth is None:
+            value = self.globals.values[e.slot]
+            if value is lox.UNDEFINED:
+                raise self.globals.undefined(e.name)
+            return value
+        frame = self.environment
+        while depth:
+            frame = frame.enclosing
+            depth -= 1
+        if e.cell:
+            return frame.values[e.slot].value
+        return frame.values[e.slot]
 
     def is_truthy(self, obj):
         if obj is None:
@@ -267,4 +362,4 @@ class Interpreter(expr.Visitor[object], stmt.Visitor[None]):
         return str(obj)
 
 
-__all__ = ['Interpreter']
+__all__ = ['Interpreter', 'Completion']
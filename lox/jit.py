@@ -0,0 +1,281 @@
+"""Compiling hot loops of the tree walking interpreter
+
+lox.Interpreter counts the iterations of each loop it runs and the times
+it's entered. Once either reaches JIT.threshold, the loop is traced: the
+types of the values of the locals it reads are taken from the frame it's
+running in, and the types of the values its expressions evaluate to are
+worked out from those the same way lox.infer_types does, going over the
+nodes one iteration of the loop runs until the types of the locals it
+assigns stop changing. The Binary and Unary expressions whose operands are
+then known to be numbers, or strings for '+', are typed in the trace.
+
+The trace is transpiled into a Python function running the rest of the
+loop in the frame (see lox.Transpiler), which only runs if the locals
+still have the types they were traced with. If they don't it returns
+DEOPT before running anything, and the interpreter runs the loop instead,
+tracing it again once it's hot again, or for good after it fails
+JIT.retraces times. Types of the locals can't change while the function
+runs other than as the trace says, since nothing else can assign them.
+"""
+from typing import Callable, Dict, List, Optional, Set, Union
+
+import lox
+import lox.expr as expr
+import lox.stmt as stmt
+from lox.inference import ANY, NIL, NUMBER, STRING, arithmetic, \
+    comparisons, expr_types, expression_type, postorder
+from lox.token import TokenType as TT
+from lox.transpile import Body, Transpiler, namespace
+
+Loop = Union[stmt.While, stmt.For]
+Node = Union[expr.Expr, stmt.Stmt]
+Trace = Callable[[list, Optional['lox.Frame']], object]
+
+# Returned instead of how a loop was left when it wasn't run
+DEOPT = object()
+
+# Types of values that the traces check
+guards = {NUMBER: 'float', STRING: 'str'}
+python_types = {float: NUMBER, str: STRING}
+
+
+def loop_nodes(s: Loop) -> List[Node]:
+    """The nodes an iteration of s runs, those in the bodies of the
+    functions declared in it aside"""
+    roots = [s.condition, s.body]
+    if type(s) is stmt.For:
+        roots.append(s.increment)
+    nodes = postorder([i for i in roots if i is not None])
+    functions = set()
+    for node in nodes:
+        if type(node) is stmt.Function and type(node.body) is list:
+            functions.update(postorder(node.body))
+    return [i for i in nodes if i not in functions]
+
+
+def trace_types(nodes: List[Node], types: Dict[int, int]) -> Set[Node]:
+    """The Binary and Unary expressions of nodes that are typed if the
+    locals not declared in them have types, by slot"""
+    types = dict(types)
+    values: Dict[Node, int] = {}
+
+    def assign(slot: int, t: int) -> bool:
+        if types.get(slot, 0) | t != types.get(slot, 0):
+            types[slot] = types.get(slot, 0) | t
+            return True
+        return False
+
+    changed = True
+    while changed:
+        changed = False
+        for node in nodes:
+            kind = type(node)
+            if kind is stmt.Var:
+                if node.slot is not None:
+                    t = NIL if node.initializer is None \
+                        else values[node.initializer]
+                    changed |= assign(node.slot, t)
+            elif kind is stmt.Function or kind is stmt.Class:
+                if node.slot is not None:
+                    changed |= assign(node.slot, ANY)
+            elif kind is expr.Assign:
+                if node.depth == 0 and not node.cell:
+                    changed |= assign(node.slot, values[node.value])
+                values[node] = NIL
+            elif kind is expr.Inline:
+                for i, argument in enumerate(node.arguments):
+                    changed |= assign(node.slot + i, values[argument])
+                values[node] = values[node.body]
+            elif kind is expr.Variable:
+                if node.depth == 0 and not node.cell:
+                    values[node] = types.get(node.slot, 0)
+                else:
+                    values[node] = ANY
+            elif kind in expr_types:
+                values[node] = expression_type(node, values)
+
+    typed = set()
+    for node in nodes:
+        kind = type(node)
+        if kind is expr.Binary:
+            left, right = values[node.left], values[node.right]
+            o = node.operator.type
+            if o is TT.PLUS and left == right and left in (NUMBER, STRING) \
+                    or left == right == NUMBER \
+                    and (o in arithmetic or o in comparisons):
+                typed.add(node)
+        elif kind is expr.Unary:
+            if node.operator.type is TT.MINUS \
+                    and values[node.right] == NUMBER:
+                typed.add(node)
+    return typed
+
+
+class TraceTranspiler(Transpiler):
+    """Transpiles the traces of loops, see JIT"""
+
+    def __init__(self, interpreter: 'lox.Interpreter'):
+        super().__init__(interpreter)
+        self.typed: Set[Node] = set()
+        self.trace: Optional[Body] = None
+
+    def transpile_loop(self, name: str, s: Loop, types: Dict[int, int],
+                       reads: List[int], writes: List[int]) -> str:
+        """Module defining name, the function of the values of the frame
+        s runs in and the frame it captured from running the rest of s
+
+        The locals in reads are the types in types when it's called, the
+        others in writes are assigned by s, and written back when it's
+        left by its end or a break.
+        """
+        self.typed = trace_types(loop_nodes(s), types)
+        self.functions = []
+        self.body = self.trace = Body()
+        self.emit(f'def {name}(values, c):')
+        self.body.indent += 1
+        slots = sorted(set(reads) | set(writes))
+        if slots:
+            self.emit(', '.join(f'v{i}' for i in slots) + ' = '
+                      + ', '.join(f'values[{i}]' for i in slots))
+        checks = [f'type(v{slot}) is not {guards[t]}'
+                  for slot, t in sorted(types.items()) if t in guards]
+        if checks:
+            self.emit(f"if {' or '.join(checks)}:")
+            self.emit('    return DEOPT')
+        body = [s.body]
+        if type(s) is stmt.For and s.increment is not None:
+            body.append(stmt.Expression(s.increment))
+        self.loop(s.condition, body)
+        if writes:
+            self.emit(', '.join(f'values[{i}]' for i in writes) + ' = '
+                      + ', '.join(f'v{i}' for i in writes))
+        self.emit('return None')
+        self.trace = None
+        return '\n\n'.join(self.functions + ['\n'.join(self.body.lines)]) \
+            + '\n'
+
+    def is_typed(self, e: Union[expr.Binary, expr.Unary]) -> bool:
+        return e.typed or e in self.typed
+
+    def visit_return_stmt(self, s: stmt.Return) -> None:
+        if self.body is not self.trace:
+            super().visit_return_stmt(s)
+            return
+        value = 'None' if s.value is None else self.expression(s.value)
+        self.emit(f'interpreter.returned = {value}')
+        self.emit('return RETURN')
+
+
+class JIT:
+    """Traces and compiles the hot loops interpreter runs"""
+    # Iterations or entries after which a loop is hot
+    threshold = 100
+    # Times a loop is traced before it's left to the interpreter
+    retraces = 3
+
+    def __init__(self, interpreter: 'lox.Interpreter'):
+        self.interpreter = interpreter
+        # Made on the first hot loop
+        self.transpiler: Optional[TraceTranspiler] = None
+        self.namespace: Dict[str, object] = {}
+        # Traces by loop, None for loops left to the interpreter
+        self.traces: Dict[Loop, Optional[Trace]] = {}
+        self.entries: Dict[Loop, int] = {}
+        self.traced: Dict[Loop, int] = {}
+
+    def enter(self, s: Loop) -> object:
+        """Runs s by its trace, if it has one or it's now hot
+
+        Returns how s was left, or DEOPT if it wasn't run.
+        """
+        trace = self.traces.get(s)
+        if trace is not None:
+            return self.run(s, trace)
+        if s in self.traces:
+            return DEOPT
+        entries = self.entries[s] = self.entries.get(s, 0) + 1
+        if entries < self.threshold:
+            return DEOPT
+        return self.hot(s)
+
+    def hot(self, s: Loop) -> object:
+        """Traces s and runs the rest of it, see enter"""
+        trace = self.traces.get(s)
+        if trace is None:
+            if s in self.traces:
+                return DEOPT
+            trace = self.record(s)
+            if trace is None:
+                return DEOPT
+        return self.run(s, trace)
+
+    def run(self, s: Loop, trace: Trace) -> object:
+        environment = self.interpreter.environment
+        completion = trace(environment.values,
+                           getattr(environment, 'enclosing', None))
+        if completion is DEOPT:
+            # Traced again with the types it runs with once it's hot again,
+            # if it wasn't too many times
+            self.entries[s] = 0
+            del self.traces[s]
+            if self.traced[s] >= self.retraces:
+                self.traces[s] = None
+        return completion
+
+    def record(self, s: Loop) -> Optional[Trace]:
+        """Traces s in the frame it's running in"""
+        interpreter = self.interpreter
+        environment = interpreter.environment
+        nodes = loop_nodes(s)
+        reads, writes, cells = set(), set(), set()
+        for node in nodes:
+            kind = type(node)
+            if kind is expr.Variable or kind is expr.Assign:
+                if node.depth == 0:
+                    (writes if kind is expr.Assign else reads).add(node.slot)
+                    if node.cell:
+                        cells.add(node.slot)
+            elif kind is stmt.Var or kind is stmt.Function \
+                    or kind is stmt.Class:
+                if node.slot is not None:
+                    writes.add(node.slot)
+            elif kind is expr.Inline:
+                writes.update(range(node.slot,
+                                    node.slot + len(node.arguments)))
+            if kind is stmt.Function:
+                reads.update(slot for depth, slot in node.captures or ()
+                             if depth == 0)
+        if (reads or writes) and type(environment) is not lox.Frame:
+            # Locals of the top level outside of blocks
+            self.traces[s] = None
+            return None
+
+        declared = {node.slot for node in nodes
+                    if type(node) in (stmt.Var, stmt.Function, stmt.Class)}
+        declared.update(slot for node in nodes if type(node) is expr.Inline
+                        for slot in range(node.slot,
+                                          node.slot + len(node.arguments)))
+        values = environment.values
+        types = {slot: python_types.get(type(values[slot]), ANY)
+                 for slot in reads
+                 if slot not in declared and slot not in cells}
+
+        if self.transpiler is None:
+            self.transpiler = TraceTranspiler(interpreter)
+            self.namespace = namespace(interpreter, self.transpiler)
+            self.namespace.update(DEOPT=DEOPT, RETURN=lox.Completion.RETURN)
+        self.traced[s] = self.traced.get(s, 0) + 1
+        name = f'loop_{len(self.traced)}_{self.traced[s]}'
+        try:
+            source = self.transpiler.transpile_loop(
+                name, s, types, sorted(reads), sorted(writes))
+            exec(compile(source, '<lox>', 'exec'), self.namespace)
+        except (SyntaxError, RecursionError, MemoryError):
+            # Nested too deeply
+            self.traces[s] = None
+            return None
+        trace = self.traces[s] = self.namespace[name]
+        return trace
+
+
+__all__ = ['JIT', 'TraceTranspiler', 'DEOPT']
@@ -1,4 +1,7 @@
+import os
 import sys
+import time
+from typing import Iterable, List, Optional, Type, Union
 
 import lox
 
@@ -6,20 +9,85 @@ had_error = False
 had_runtime_error = False
 
 
-def run_file(path: str) -> None:
-    with open(path) as f:
-        code = f.read()
-    run(code)
+def run_file(path: str,
+             scanner: Optional[Type['lox.Scanner']] = None,
+             stream: bool = False,
+             cache: bool = True,
+             jobs: int = 1,
+             lazy: bool = False,
+             optimize: bool = True,
+             backend: Optional[Type['lox.Interpreter']] = None) -> None:
+    if stream:
+        # Imported here, mmap isn't available everywhere lox runs (Brython)
+        import mmap
+        with open(path, 'rb') as f:
+            try:
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                source = f
+            run_tokens(lox.StreamScanner(source), optimize=optimize,
+                       backend=backend)
+    else:
+        with open(path) as f:
+            code = f.read()
+        # Lazily parsed bodies can't be cached, cached programs don't need
+        # to be parsed anyway
+        if cache and not lazy:
+            run_cached(path, code, scanner, jobs, optimize, backend)
+        else:
+            run(code, scanner, jobs, lazy, optimize, backend)
     if had_error:
         sys.exit(65)
     if had_runtime_error:
         sys.exit(70)
 
 
-def run_prompt() -> None:
+def watch_file(path: str, interval: float = 0.2,
+               optimize: bool = True,
+               backend: Optional[Type['lox.Interpreter']] = None) -> None:
+    """Runs the script at path, and again every time it's saved
+
+    Only the parts of the script that changed are scanned, parsed,
+    resolved and optimized again, see lox.Document. The statements that
+    didn't change are run again as they were before the last run.
+    """
+    global had_error, had_runtime_error
+    document = lox.Document()
+    mtime = None
+    try:
+        while True:
+            try:
+                modified = os.stat(path).st_mtime_ns
+            except OSError:
+                # Editors may replace the file instead of writing it
+                modified = mtime
+            if modified != mtime:
+                mtime = modified
+                with open(path) as f:
+                    source = f.read()
+                had_error = had_runtime_error = False
+                if document.update(source):
+                    if optimize:
+                        document.optimize()
+                    statements = document.statements
+                    lox.unspecialize(statements)
+                    (backend or lox.Interpreter)(document.table) \
+                        .interpret(statements)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_prompt(scanner: Optional[Type['lox.Scanner']] = None,
+               optimize: bool = True,
+               backend: Optional[Type['lox.Interpreter']] = None) -> None:
     global had_error
-    interpreter = lox.Interpreter()
-    resolver = lox.Resolver(interpreter)
+    scanner = scanner or lox.Scanner
+    interpreter = (backend or lox.Interpreter)()
+    # Later lines can assign to any global, so calls aren't checked
+    resolver = lox.Resolver(interpreter.globals.table, types=True)
+    optimizer = lox.Optimizer() if optimize else None
     debug = False
     while True:
         had_error = False
@@ -31,7 +99,7 @@ def run_prompt() -> None:
                 print('turned debug on')
             else:
 
-                tokens = lox.Scanner(source).scan_tokens()
+                tokens = scanner(source).scan_tokens()
                 if debug:
                     for token in tokens:
                         print(token)
@@ -47,6 +115,11 @@ def run_prompt() -> None:
                 if had_error:
                     continue
 
+                if optimizer:
+                    statements = optimizer.optimize(statements)
+                    if debug:
+                        print(optimizer.report())
+
                 if isinstance(statements, list):
                     interpreter.interpret(statements)
                 else:
@@ -57,22 +130,79 @@ def run_prompt() -> None:
             break
 
 
-def run(source: str) -> None:
-    global had_error
-    scanner = lox.Scanner(source)
-    tokens = scanner.scan_tokens()
+def run(source: str,
+        scanner: Optional[Type['lox.Scanner']] = None,
+        jobs: int = 1,
+        lazy: bool = False,
+        optimize: bool = True,
+        backend: Optional[Type['lox.Interpreter']] = None) -> None:
+    run_tokens((scanner or lox.Scanner)(source).scan_tokens(), jobs, lazy,
+               optimize, backend)
 
-    statements = lox.Parser(tokens).parse()
+
+def run_tokens(tokens: Union[List['lox.Token'], Iterable['lox.Token']],
+               jobs: int = 1,
+               lazy: bool = False,
+               optimize: bool = True,
+               backend: Optional[Type['lox.Interpreter']] = None):
+    statements = parse(tokens, jobs, lazy)
     if had_error:
         return
 
-    interpreter = lox.Interpreter()
-    resolver = lox.Resolver(interpreter)
-    resolver.resolve(statements)
+    # Bodies parsed lazily are resolved separately, so calls can only be
+    # checked once the whole program is resolved
+    table = lox.GlobalTable()
+    lox.Resolver(table, constants=not lazy, types=True).resolve(statements)
     if had_error:
         return
 
-    interpreter.interpret(statements)
+    if optimize:
+        statements = lox.Optimizer().optimize(statements)
+    (backend or lox.Interpreter)(table).interpret(statements)
+
+
+def run_cached(path: str, source: str,
+               scanner: Optional[Type['lox.Scanner']] = None,
+               jobs: int = 1,
+               optimize: bool = True,
+               backend: Optional[Type['lox.Interpreter']] = None) -> None:
+    """Runs the script at path, going through its .loxc cache file"""
+    # Imported here, pickle and hashlib aren't available in Brython
+    import lox.cache
+
+    program = lox.cache.load(path, source, optimize)
+    if program is None:
+        tokens = (scanner or lox.Scanner)(source).scan_tokens()
+        statements = parse(tokens, jobs)
+        if had_error:
+            return
+
+        table = lox.GlobalTable()
+        lox.Resolver(table, constants=True, types=True).resolve(statements)
+        if had_error:
+            return
+        if optimize:
+            statements = lox.Optimizer().optimize(statements)
+        lox.cache.store(path, source, table, statements, optimize)
+    else:
+        table, statements = program
+
+    (backend or lox.Interpreter)(table).interpret(statements)
+
+
+def parse(tokens: Union[List['lox.Token'], Iterable['lox.Token']],
+          jobs: Optional[int] = 1,
+          lazy: bool = False) -> List['lox.stmt.Stmt']:
+    """Parses tokens, in jobs processes (None for one per core)
+
+    With lazy, bodies of top-level functions and methods are only parsed
+    when they are first called, and always in this process.
+    """
+    if jobs == 1 or lazy:
+        return lox.Parser(tokens, lazy).parse()
+    # Imported here, concurrent.futures isn't available in Brython
+    from lox import parallel
+    return parallel.parse(tokens, jobs)
 
 
 def error(line: int, message: str) -> None:
@@ -101,6 +231,10 @@ def report(line: int, where: str, message: str) -> None:
 __all__ = [
     'run_prompt',
     'run_file',
+    'watch_file',
     'run',
+    'run_tokens',
+    'run_cached',
+    'parse',
     'error',
 ]
@@ -0,0 +1,261 @@
+"""Optimizer of resolved programs
+
+Simplifies the tree between resolving and interpreting a program, without
+changing what it prints or the errors it fails with:
+
+- Binary, Unary, Logical and Conditional expressions of literals are folded
+  into literals, by evaluating them with the interpreter so the results are
+  exactly what they'd be at run time. Those that fail are left to fail at
+  run time.
+- Groupings are replaced by the expressions in them.
+- Branches of ifs whose condition is a literal are pruned, and so are loops
+  that never run and expression statements of literals. Loops whose
+  condition is always true don't evaluate it.
+- Statements following a return or break in the same block are removed.
+- Calls to small global functions are inlined, see Optimizer.inline.
+
+Errors are reported by the resolver before any code is removed, so they're
+the same with and without optimizing. Declarations only ever get removed
+together with all the code using them, so the slots the resolver gave
+locals stay valid. Bodies that haven't been parsed yet (see --lazy) are left
+as they are.
+"""
+import copy
+from typing import Dict, List, Optional, Union
+
+import lox
+import lox.expr as expr
+import lox.stmt as stmt
+from lox.inference import children, node_types, postorder
+from lox.token import TokenType as TT
+
+Node = Union[expr.Expr, stmt.Stmt]
+
+# Nodes in the largest value a function can return to be inlined
+INLINE_SIZE = 16
+
+
+class Optimizer:
+    """Simplifies resolved statements and expressions in place
+
+    changes counts what was changed, see report.
+    """
+
+    def __init__(self):
+        self.changes: Dict[str, int] = dict.fromkeys(
+            ('folded', 'groupings', 'branches', 'statements', 'inlined'), 0)
+        # Evaluates constant expressions
+        self.interpreter = lox.Interpreter()
+        # Functions that can be inlined by name, and the frame each call to
+        # them is in
+        self.inlinable: Dict[str, stmt.Function] = {}
+        self.frames: Dict[expr.Call, Union[stmt.Function, stmt.Block]] = {}
+        # Size of the frames before slots were added for inlined calls
+        self.sizes: Dict[Union[stmt.Function, stmt.Block], int] = {}
+
+    def optimize(self, root: Union[List[stmt.Stmt], expr.Expr]
+                 ) -> Union[List[stmt.Stmt], expr.Expr]:
+        """Returns root optimized"""
+        if type(root) is list:
+            self.find_inlinable(root)
+        # Nodes are simplified after the nodes in them, so what they're
+        # replaced with is known by then
+        replaced: Dict[Node, Optional[Node]] = {}
+        for node in postorder(root):
+            for name in children[type(node)]:
+                value = getattr(node, name)
+                if type(value) is list:
+                    self.replace_items(value, replaced)
+                elif type(value) in node_types and value in replaced:
+                    value = replaced[value]
+                    if value is None and name != 'else_branch' \
+                            and name != 'initializer':
+                        value = stmt.Block([])
+                    setattr(node, name, value)
+            simple = self.simplify(node)
+            if simple is not node:
+                replaced[node] = simple
+
+        self.inlinable = {}
+        self.frames = {}
+        self.sizes = {}
+        if type(root) is list:
+            self.replace_items(root, replaced)
+            return root
+        return replaced.get(root, root)
+
+    def find_inlinable(self, statements: List[stmt.Stmt]) -> None:
+        """Finds the functions declared in statements that can be inlined,
+        and the frames of the calls to them"""
+        for s in statements:
+            if type(s) is not stmt.Function or type(s.body) is not list \
+                    or len(s.body) != 1 or type(s.body[0]) is not stmt.Return:
+                continue
+            value = s.body[0].value
+            if value is None:
+                continue
+            nodes = postorder(value)
+            if len(nodes) <= INLINE_SIZE and not any(
+                    type(i) is expr.Call or type(i) is expr.Inline
+                    for i in nodes):
+                self.inlinable[s.name.lexeme] = s
+        if not self.inlinable:
+            return
+
+        # Calls run in the frame of the function they're in, or of the
+        # outermost block of top-level code. Top-level code outside of
+        # blocks has no frame.
+        stack = [(statements, None)]
+        while stack:
+            node, frame = stack.pop()
+            if type(node) is list:
+                stack.extend((i, frame) for i in node
+                             if type(i) in node_types)
+                continue
+            kind = type(node)
+            if kind is stmt.Function or frame is None \
+                    and (kind is stmt.Block or kind is stmt.For):
+                frame = node
+            elif kind is expr.Call and node.checked and frame is not None \
+                    and node.callee.name.lexeme in self.inlinable:
+                self.frames[node] = frame
+            for name in children[kind]:
+                value = getattr(node, name)
+                if type(value) in node_types or type(value) is list:
+                    stack.append((value, frame))
+
+    def replace_items(self, items: list,
+                      replaced: Dict[Node, Optional[Node]]) -> None:
+        """Replaces the nodes in items, removing the statements that were
+        removed and the ones that can't be reached"""
+        result = []
+        for i, item in enumerate(items):
+            if type(item) in node_types and item in replaced:
+                item = replaced[item]
+                if item is None:
+                    continue
+            result.append(item)
+            if type(item) is stmt.Return or type(item) is stmt.Break:
+                self.changes['statements'] += len(items) - i - 1
+                break
+        items[:] = result
+
+    def simplify(self, node: Node) -> Optional[Node]:
+        """What node can be replaced with, given the nodes in it are
+        already simplified"""
+        kind = type(node)
+        if kind is expr.Grouping:
+            self.changes['groupings'] += 1
+            return node.expression
+        if kind is expr.Binary:
+            if type(node.left) is expr.Literal:
+                if type(node.right) is expr.Literal:
+                    return self.fold(node)
+                if node.operator.type is TT.COMMA:
+                    self.changes['folded'] += 1
+                    return node.right
+            return node
+        if kind is expr.Unary:
+            if type(node.right) is expr.Literal:
+                return self.fold(node)
+            return node
+        if kind is expr.Call:
+            if node in self.frames:
+                return self.inline(node)
+            return node
+        if kind is expr.Logical:
+            left = node.left
+            if type(left) is expr.Literal:
+                self.changes['folded'] += 1
+                truthy = self.interpreter.is_truthy(left.value)
+                if truthy == (node.operator.type is TT.OR):
+                    return left
+                return node.right
+            return node
+        if kind is expr.Conditional:
+            if type(node.condition) is expr.Literal:
+                self.changes['folded'] += 1
+                if self.interpreter.is_truthy(node.condition.value):
+                    return node.then_branch
+                return node.else_branch
+            return node
+        if kind is stmt.If:
+            if type(node.condition) is expr.Literal:
+                self.changes['branches'] += 1
+                if self.interpreter.is_truthy(node.condition.value):
+                    return node.then_branch
+                return node.else_branch
+            return node
+        if kind is stmt.While:
+            condition = node.condition
+            if type(condition) is expr.Literal \
+                    and not self.interpreter.is_truthy(condition.value):
+                self.changes['branches'] += 1
+                return None
+            return node
+        if kind is stmt.For:
+            condition = node.condition
+            if type(condition) is expr.Literal:
+                if self.interpreter.is_truthy(condition.value):
+                    self.changes['folded'] += 1
+                    node.condition = None
+                elif node.initializer is None:
+                    self.changes['branches'] += 1
+                    return None
+            return node
+        if kind is stmt.Expression:
+            if type(node.expression) is expr.Literal:
+                self.changes['statements'] += 1
+                return None
+            return node
+        return node
+
+    def inline(self, call: expr.Call) -> expr.Inline:
+        """The call inlined
+
+        Functions are inlined if they're declared once at the top level
+        and never assigned (see lox.Resolver), so the call always calls the
+        same function, and only return the value of a small expression
+        without calls, so they're never recursive. The value is copied into
+        the call, reading the parameters from new slots added at the end of
+        the caller's frame. All calls inlined into a frame share the new
+        slots: they're only used while the value is being evaluated, which
+        can't run another inlined call in the same frame.
+        """
+        function = self.inlinable[call.callee.name.lexeme]
+        frame = self.frames[call]
+        size = self.sizes.get(frame)
+        if size is None:
+            size = self.sizes[frame] = frame.frame_size or 0
+        frame.frame_size = max(frame.frame_size or 0,
+                               size + len(function.params))
+
+        body = copy.deepcopy(function.body[0].value)
+        for node in postorder(body):
+            if (type(node) is expr.Variable or type(node) is expr.Assign) \
+                    and node.depth == 0:
+                # A parameter, the function has no other locals
+                node.slot += size
+        self.changes['inlined'] += 1
+        return expr.Inline(call.callee, call.arguments, size, body)
+
+    def fold(self, e: Union[expr.Binary, expr.Unary]) -> expr.Expr:
+        """e evaluated into a literal, or e if it fails"""
+        try:
+            value = self.interpreter.evaluate(e)
+        except lox.LoxRuntimeError:
+            return e
+        self.changes['folded'] += 1
+        return expr.Literal(value)
+
+    def report(self) -> str:
+        """What the optimizer changed, in a line"""
+        changes = self.changes
+        return (f"folded {changes['folded']} expressions, "
+                f"removed {changes['groupings']} groupings, "
+                f"pruned {changes['branches']} branches and "
+                f"{changes['statements']} statements, "
+                f"inlined {changes['inlined']} calls")
+
+
+__all__ = ['Optimizer']
@@ -1,15 +1,96 @@
-from typing import Union, List, Type, Tuple
+from collections import deque
+from collections.abc import Sequence
+import enum
+from types import GeneratorType
+from typing import Generator, Iterable, NamedTuple, Optional, Union, List
 
 import lox.expr as expr
 import lox.lox as lox
 import lox.stmt as stmt
-from lox.token import Token, TokenType as TT
+from lox.token import Token, TokenBuffer, TokenList, TokenType as TT
 
 
 class ParseError(ValueError):
     pass
 
 
+# Generator of a grammar rule, see Parser.run
+Steps = Generator['Steps', object, object]
+
+
+class Precedence(enum.IntEnum):
+    """Binding power of infix operators, loosest first"""
+    COMMA = 1
+    ASSIGNMENT = 2
+    CONDITIONAL = 3
+    OR = 4
+    AND = 5
+    EQUALITY = 6
+    COMPARISON = 7
+    TERM = 8
+    FACTOR = 9
+    UNARY = 10
+    CALL = 11
+
+
+class InfixRule(NamedTuple):
+    precedence: Precedence
+    # Node class built from the operator, see Parser.parse_precedence
+    node: type
+
+
+class TokenWindow:
+    """Indexable view of a token iterator
+
+    Tokens are pulled from the iterator as the parser reaches them and only
+    the last few are kept, which is all the lookbehind the parser needs.
+    """
+
+    def __init__(self, tokens: Iterable[Token], size: int = 2):
+        self.tokens = iter(tokens)
+        self.window = deque(maxlen=size)
+        # Index of the oldest token still in the window
+        self.start = 0
+
+    def __getitem__(self, index: int) -> Token:
+        window = self.window
+        while index >= self.start + len(window):
+            if len(window) == window.maxlen:
+                self.start += 1
+            window.append(next(self.tokens))
+        return window[index - self.start]
+
+    def type_at(self, index: int) -> TT:
+        return self[index].type
+
+
+class LazyBody:
+    """Body of a function that is parsed and resolved on its first call
+
+    Only the braces are matched when the function is declared. The tokens
+    are kept until the body is parsed (see LoxFunction.parse_body), and the
+    resolver notes what kind of function it belongs to.
+    """
+    __slots__ = ('tokens', 'start', 'type', 'is_method')
+
+    def __init__(self, tokens: Sequence[Token], start: int):
+        self.tokens = tokens
+        self.start = start
+        self.type = None
+        self.is_method = False
+
+    def __repr__(self):
+        return f'LazyBody(start={self.start})'
+
+    def parse(self) -> Optional[List[stmt.Stmt]]:
+        parser = Parser(self.tokens)
+        parser.current = self.start
+        try:
+            return parser.run(parser.block())
+        except ParseError:
+            return None
+
+
 class Parser:
     syncpoints = {
         TT.CLASS,
@@ -21,9 +102,20 @@ class Parser:
         TT.RETURN,
     }
 
-    def __init__(self, tokens: List[Token]):
+    def __init__(self, tokens: Union[List[Token], Iterable[Token]],
+                 lazy: bool = False):
+        if not isinstance(tokens, Sequence):
+            tokens = TokenWindow(tokens)
+            # The window forgets tokens, they can't be parsed later
+            lazy = False
+        elif not isinstance(tokens, (TokenList, TokenBuffer)):
+            tokens = TokenList(tokens)
         self.tokens = tokens
         self.current = 0
+        # Whether to skip bodies of top-level functions and methods, see
+        # LazyBody
+        self.lazy = lazy
+        self.nesting = 0
         # Took a look into answers - I couldn't implement it myself 😅
         self.allow_expressions = False
         self.found_expression = False
@@ -32,7 +124,7 @@ class Parser:
         """Parses tokens and returns Statement list"""
         statements = []
         while not self.is_at_end:
-            statements.append(self.declaration())
+            statements.append(self.run(self.declaration()))
 
         return statements
 
@@ -40,7 +132,7 @@ class Parser:
         self.allow_expressions = True
         statements = []
         while not self.is_at_end:
-            statements.append(self.declaration())
+            statements.append(self.run(self.declaration()))
 
             if self.found_expression:
                 e: stmt.Expression = statements[-1]  # noqa
@@ -49,19 +141,70 @@ class Parser:
 
         return statements
 
-    def declaration(self) -> stmt.Stmt:
+    def run(self, steps: Union[Steps, stmt.Stmt]) -> object:
+        """Runs a grammar rule's generator and returns what it parsed
+
+        Statements that contain other statements are parsed by generators.
+        They yield what the rules of the nested statements return and are
+        sent back the parsed statement: a plain result is sent back as is, a
+        generator is run first. Running them here from an explicit stack
+        instead of recursing keeps the Python stack flat however deeply
+        statements are nested.
+        """
+        if type(steps) is not GeneratorType:
+            return steps
+        stack = []
+        value = None
+        error = None
+        while True:
+            try:
+                if error is None:
+                    step = steps.send(value)
+                else:
+                    step, error = steps.throw(error), None
+            except StopIteration as e:
+                if not stack:
+                    return e.value
+                steps = stack.pop()
+                value, error = e.value, None
+            except ParseError as e:
+                if not stack:
+                    raise
+                steps = stack.pop()
+                value, error = None, e
+            else:
+                if type(step) is GeneratorType:
+                    stack.append(steps)
+                    steps = step
+                    value = None
+                else:
+                    value = step
+
+    def declaration(self) -> Union[Steps, stmt.Stmt]:
         try:
             if self.match(TT.CLASS):
-                return self.class_declaration()
+                return self.recover(self.class_declaration())
             if self.match(TT.FUN):
-                return self.fun_declaration(kind='function')
+                return self.recover(self.fun_declaration(kind='function'))
             if self.match(TT.VAR):
                 return self.var_declaration()
-            return self.statement()
+            result = self.statement()
+        except ParseError:
+            self.synchronize()
+            return None
+        if type(result) is GeneratorType:
+            return self.recover(result)
+        return result
+
+    def recover(self, steps: Steps) -> Steps:
+        # Like declaration's own error handling, for errors that happen
+        # while the steps are run
+        try:
+            return (yield steps)
         except ParseError:
             self.synchronize()
 
-    def class_declaration(self):
+    def class_declaration(self) -> Steps:
         name = self.consume(TT.IDENTIFIER, 'Expect class name.')
         self.consume(TT.LEFT_BRACE, "Expect '{' after class name.")
 
@@ -69,15 +212,15 @@ class Parser:
         class_methods = []
         setters = []
         class_setters = []
-        while not self.is_at_end and self.peek().type != TT.RIGHT_BRACE:
+        while not self.is_at_end and self.peek_type() != TT.RIGHT_BRACE:
             if self.match(TT.CLASS):
-                result: stmt.Function = self.fun_declaration('method')  # noqa
+                result: stmt.Function = yield self.fun_declaration('method')  # noqa
                 if result.is_setter:
                     class_setters.append(result)
                 else:
                     class_methods.append(result)
             else:
-                result: stmt.Function = self.fun_declaration('method') # noqa
+                result: stmt.Function = yield self.fun_declaration('method')  # noqa
                 if result.is_setter:
                     setters.append(result)
                 else:
@@ -86,7 +229,7 @@ class Parser:
         self.consume(TT.RIGHT_BRACE, "Expect '}' after class body.")
         return stmt.Class(name, methods, setters, class_methods, class_setters)  # noqa
 
-    def fun_declaration(self, kind: str) -> stmt.Stmt:
+    def fun_declaration(self, kind: str) -> Steps:
         parameters = []
         is_setter = kind == 'method' and self.match(TT.SET)
         name = self.consume(TT.IDENTIFIER, f'Expect {kind} name.')
@@ -96,7 +239,7 @@ class Parser:
             parameters = [Token(
                 TT.IDENTIFIER, 'value', None, self.previous().line
             )]
-            if self.peek().type is TT.LEFT_PAREN:
+            if self.peek_type() is TT.LEFT_PAREN:
                 self.error(
                     self.peek(),
                     "Setter doesn't have parameter list. The variable 'value' "
@@ -104,7 +247,7 @@ class Parser:
 
         is_getter = (not is_setter
                      and kind == 'method'
-                     and self.peek().type is TT.LEFT_BRACE)
+                     and self.peek_type() is TT.LEFT_BRACE)
 
         if is_getter:
             kind = 'getter'
@@ -113,7 +256,7 @@ class Parser:
             self.consume(TT.LEFT_PAREN, f"Expect '(' after {kind} name.")
             parameters = []
 
-            if not self.is_at_end and self.peek().type != TT.RIGHT_PAREN:
+            if not self.is_at_end and self.peek_type() != TT.RIGHT_PAREN:
                 first = True
                 while first or self.match(TT.COMMA):
                     first = False
@@ -126,7 +269,10 @@ class Parser:
             self.consume(TT.RIGHT_PAREN, "Expect ')' after parameters")
 
         self.consume(TT.LEFT_BRACE, f"Expect '{{' before {kind} body.")
-        body = self.block()
+        if self.lazy and not self.nesting:
+            body = self.skip_body()
+        else:
+            body = yield self.block()
         return stmt.Function(name, parameters, body, is_getter, is_setter)
 
     def var_declaration(self) -> stmt.Stmt:
@@ -135,7 +281,7 @@ class Parser:
         self.consume(TT.SEMICOLON, "Expect ';' after variable declaration.")
         return stmt.Var(name, initializer)
 
-    def statement(self) -> stmt.Stmt:
+    def statement(self) -> Union[Steps, stmt.Stmt]:
         if self.match(TT.BREAK):
             return self.break_statement()
         if self.match(TT.FOR):
@@ -149,7 +295,7 @@ class Parser:
         if self.match(TT.WHILE):
             return self.while_statement()
         if self.match(TT.LEFT_BRACE):
-            return stmt.Block(self.block())
+            return self.block_statement()
         return self.expression_statement()
 
     def break_statement(self) -> stmt.Stmt:
@@ -157,7 +303,7 @@ class Parser:
         self.consume(TT.SEMICOLON, "Expect ';' after 'break'.")
         return stmt.Break(keyword)
 
-    def for_statement(self) -> stmt.Stmt:
+    def for_statement(self) -> Steps:
         self.consume(TT.LEFT_PAREN, "Expect '(' after 'for'.")
 
         if self.match(TT.SEMICOLON):
@@ -168,33 +314,26 @@ class Parser:
             initializer = self.expression_statement()
 
         condition = None
-        if not self.is_at_end and self.peek().type != TT.SEMICOLON:
+        if not self.is_at_end and self.peek_type() != TT.SEMICOLON:
             condition = self.expression()
         self.consume(TT.SEMICOLON, "Expect ';' after loop condition.")
 
         increment = None
-        if not self.is_at_end and self.peek().type != TT.RIGHT_PAREN:
+        if not self.is_at_end and self.peek_type() != TT.RIGHT_PAREN:
             increment = self.expression()
         self.consume(TT.RIGHT_PAREN, "Expect ')' after for clauses.")
 
-        body = self.statement()
-
-        if increment:
-            body = stmt.Block([body, stmt.Expression(increment)])
-
-        body = stmt.While(condition or expr.Literal(True), body)
-
-        if initializer:
-            body = stmt.Block([initializer, body])
+        body = yield self.statement()
+        return stmt.For(initializer, condition, increment, body)
 
-        return body
-
-    def if_statement(self) -> stmt.If:
+    def if_statement(self) -> Steps:
         self.consume(TT.LEFT_PAREN, "Expect '(' after 'if'.")
         condition = self.expression()
         self.consume(TT.RIGHT_PAREN, "Expect ')' after 'if'")
-        then_branch = self.statement()
-        else_branch = self.statement() if self.match(TT.ELSE) else None
+        then_branch = yield self.statement()
+        else_branch = None
+        if self.match(TT.ELSE):
+            else_branch = yield self.statement()
         return stmt.If(condition, then_branch, else_branch)
 
     def print_statement(self) -> stmt.Stmt:
@@ -205,16 +344,16 @@ class Parser:
     def return_statement(self) -> stmt.Stmt:
         keyword = self.previous()
         value = None
-        if not self.is_at_end and self.peek().type != TT.SEMICOLON:
+        if not self.is_at_end and self.peek_type() != TT.SEMICOLON:
             value = self.expression()
         self.consume(TT.SEMICOLON, "Expect ';' after return value.")
         return stmt.Return(keyword, value)
 
-    def while_statement(self) -> stmt.Stmt:
+    def while_statement(self) -> Steps:
         self.consume(TT.LEFT_PAREN, "Expect '(' after 'while'.")
         condition = self.expression()
         self.consume(TT.RIGHT_PAREN, "Expect ')' after condition.")
-        body = self.statement()
+        body = yield self.statement()
         return stmt.While(condition, body)
 
     def expression_statement(self) -> stmt.Stmt:
@@ -225,168 +364,229 @@ class Parser:
             self.consume(TT.SEMICOLON, "Expect ';' after expression.")
         return stmt.Expression(e)
 
-    def block(self):
+    def block_statement(self) -> Steps:
+        return stmt.Block((yield self.block()))
+
+    def block(self) -> Steps:
         statements = []
-        while not self.is_at_end and self.peek().type != TT.RIGHT_BRACE:
-            statements.append(self.declaration())
+        self.nesting += 1
+        try:
+            while not self.is_at_end and self.peek_type() != TT.RIGHT_BRACE:
+                statements.append((yield self.declaration()))
+        finally:
+            self.nesting -= 1
 
         self.consume(TT.RIGHT_BRACE, "Expect '}' after block.")
         return statements
 
-    def binary_left(
-        self, upnext, types: Tuple[TT, ...],
-        expr_class: Type[Union[expr.Binary, expr.Logical]] = expr.Binary
-    ) -> expr.Expr:
-        # A helper for parsing left-associative binary expression
-        e = upnext()
-
-        while self.match(*types):
-            operator = self.previous()
-            right = upnext()
-            e = expr_class(e, operator, right)  # noqa
-
-        return e
+    def skip_body(self) -> LazyBody:
+        body = LazyBody(self.tokens, self.current)
+        type_at = self.tokens.type_at
+        depth = 1
+        while depth:
+            type = type_at(self.current)
+            if type is TT.LEFT_BRACE:
+                depth += 1
+            elif type is TT.RIGHT_BRACE:
+                depth -= 1
+            elif type is TT.EOF:
+                raise self.error(self.peek(), "Expect '}' after block.")
+            self.current += 1
+        return body
 
-    def expression(self):
-        return self.comma()
+    # Expressions are parsed with a Pratt parser: an operand is parsed, then
+    # infix operators are applied as long as they bind at least as tightly
+    # as the current precedence level. Instead of recursing for operands,
+    # the parser keeps the nodes waiting for one on an explicit stack, so
+    # nesting depth is only limited by memory.
 
-    def comma(self):
-        return self.binary_left(self.assignment, (TT.COMMA,))
+    def expression(self) -> expr.Expr:
+        return self.parse_precedence(Precedence.COMMA)
 
     def assignment(self) -> expr.Expr:
-        e = self.conditional()
-
-        if self.match(TT.EQUAL):
-            equals = self.previous()
-            value = self.assignment()
-
-            if isinstance(e, expr.Variable):
-                return expr.Assign(e.name, value)
-
-            if isinstance(e, expr.Get):
-                return expr.Set(e.object, e.name, value)
-
-            self.error(equals, 'Invalid assignment target.')
-
-        return e
-
-    def conditional(self) -> expr.Expr:
-        e = self.logic_or()
-
-        if self.match(TT.QUESTION):
-            then_branch = self.expression()
-            self.consume(
-                TT.COLON,
-                "Expect ':' after then branch of conditional expression")
-            else_branch = self.conditional()
-            e = expr.Conditional(e, then_branch, else_branch)
-
-        return e
-
-    def logic_or(self) -> expr.Expr:
-        return self.binary_left(self.logic_and, (TT.OR,), expr.Logical)
-
-    def logic_and(self) -> expr.Expr:
-        return self.binary_left(self.equality, (TT.AND,), expr.Logical)
-
-    def equality(self):
-        return self.binary_left(self.comparison,
-                                (TT.BANG_EQUAL, TT.EQUAL_EQUAL))
-
-    def comparison(self):
-        return self.binary_left(
-            self.term, (TT.GREATER, TT.GREATER_EQUAL, TT.LESS, TT.LESS_EQUAL))
-
-    def term(self):
-        return self.binary_left(self.factor, (TT.MINUS, TT.PLUS))
-
-    def factor(self):
-        return self.binary_left(self.unary, (TT.SLASH, TT.STAR))
-
-    def unary(self) -> expr.Expr:
-        if self.match(TT.BANG, TT.MINUS):
-            operator = self.previous()
-            right = self.unary()
-            return expr.Unary(operator, right)
+        return self.parse_precedence(Precedence.ASSIGNMENT)
+
+    # Node built from the token starting an operand
+    prefix_rules = {
+        TT.FALSE: expr.Literal,
+        TT.TRUE: expr.Literal,
+        TT.NIL: expr.Literal,
+        TT.NUMBER: expr.Literal,
+        TT.STRING: expr.Literal,
+        TT.THIS: expr.This,
+        TT.IDENTIFIER: expr.Variable,
+        TT.LEFT_PAREN: expr.Grouping,
+        TT.BANG: expr.Unary,
+        TT.MINUS: expr.Unary,
+    }
 
-        return self.call()
+    infix_rules = {
+        TT.COMMA: InfixRule(Precedence.COMMA, expr.Binary),
+        TT.EQUAL: InfixRule(Precedence.ASSIGNMENT, expr.Assign),
+        TT.QUESTION: InfixRule(Precedence.CONDITIONAL, expr.Conditional),
+        TT.OR: InfixRule(Precedence.OR, expr.Logical),
+        TT.AND: InfixRule(Precedence.AND, expr.Logical),
+        TT.BANG_EQUAL: InfixRule(Precedence.EQUALITY, expr.Binary),
+        TT.EQUAL_EQUAL: InfixRule(Precedence.EQUALITY, expr.Binary),
+        TT.GREATER: InfixRule(Precedence.COMPARISON, expr.Binary),
+        TT.GREATER_EQUAL: InfixRule(Precedence.COMPARISON, expr.Binary),
+        TT.LESS: InfixRule(Precedence.COMPARISON, expr.Binary),
+        TT.LESS_EQUAL: InfixRule(Precedence.COMPARISON, expr.Binary),
+        TT.MINUS: InfixRule(Precedence.TERM, expr.Binary),
+        TT.PLUS: InfixRule(Precedence.TERM, expr.Binary),
+        TT.SLASH: InfixRule(Precedence.FACTOR, expr.Binary),
+        TT.STAR: InfixRule(Precedence.FACTOR, expr.Binary),
+        TT.LEFT_PAREN: InfixRule(Precedence.CALL, expr.Call),
+        TT.DOT: InfixRule(Precedence.CALL, expr.Get),
+    }
 
-    def call(self) -> expr.Expr:
-        e = self.primary()
+    def parse_precedence(self, precedence: Precedence) -> expr.Expr:
+        tokens = self.tokens
+        type_at = tokens.type_at
+        prefix_rules = self.prefix_rules
+        infix_rules = self.infix_rules
+        # Nodes waiting for an operand, as (node class, precedence level to
+        # return to, and two node specific values)
+        stack = []
         while True:
-            if self.match(TT.LEFT_PAREN):
-                e = self.finish_call(e)
-            elif self.match(TT.DOT):
-                name = self.consume(
-                    TT.IDENTIFIER, "Expect property name after '.'.")
-                e = expr.Get(e, name)
-            else:
-                break  # pragma: no cover
-        return e
-
-    def finish_call(self, callee: expr.Expr):
-        arguments = []
-        if not self.is_at_end and self.peek().type != TT.RIGHT_PAREN:
-            while not arguments or self.match(TT.COMMA):
-                if len(arguments) >= 255:
-                    self.error(self.peek(),
-                               "Can't have more than 255 arguments")
-                arguments.append(self.assignment())
-
-        paren = self.consume(TT.RIGHT_PAREN, "Expect ')' after arguments.")
-        return expr.Call(callee, paren, arguments)
-
-    def primary(self) -> expr.Expr:
-        if self.match(TT.FALSE):
-            return expr.Literal(False)
-        if self.match(TT.TRUE):
-            return expr.Literal(True)
-        if self.match(TT.NIL):
-            return expr.Literal(None)
-
-        if self.match(TT.NUMBER, TT.STRING):
-            return expr.Literal(self.previous().literal)
-
-        if self.match(TT.THIS):
-            return expr.This(self.previous())
-
-        if self.match(TT.IDENTIFIER):
-            return expr.Variable(self.previous())
-
-        if self.match(TT.LEFT_PAREN):
-            e = self.expression()
-            self.consume(TT.RIGHT_PAREN, "Expect ')' after expression.")
-            return expr.Grouping(e)
+            type = type_at(self.current)
+            node = prefix_rules.get(type)
+            if node is None:
+                raise self.error(self.peek(), 'Unexpected expression.')
+            self.current += 1
 
-        raise self.error(self.peek(), 'Unexpected expression.')
+            if node is expr.Literal:
+                if type is TT.TRUE:
+                    e = expr.Literal(True)
+                elif type is TT.FALSE:
+                    e = expr.Literal(False)
+                else:
+                    e = expr.Literal(tokens[self.current - 1].literal)
+            elif node is expr.Variable or node is expr.This:
+                e = node(tokens[self.current - 1])
+            elif node is expr.Unary:
+                operator = tokens[self.current - 1]
+                stack.append((node, precedence, operator, None))
+                precedence = Precedence.UNARY
+                continue
+            else:
+                stack.append((node, precedence, None, None))
+                precedence = Precedence.COMMA
+                continue
+
+            while True:
+                rule = infix_rules.get(type_at(self.current))
+                if rule is not None and rule.precedence >= precedence:
+                    self.current += 1
+                    node = rule.node
+                    if node is expr.Binary or node is expr.Logical:
+                        # Left-associative: the right operand only takes
+                        # tighter operators
+                        operator = tokens[self.current - 1]
+                        stack.append((node, precedence, e, operator))
+                        precedence = rule.precedence + 1
+                        break
+                    if node is expr.Get:
+                        name = self.consume(
+                            TT.IDENTIFIER, "Expect property name after '.'.")
+                        e = expr.Get(e, name)
+                        continue
+                    if node is expr.Call:
+                        type = type_at(self.current)
+                        if type is not TT.RIGHT_PAREN and type is not TT.EOF:
+                            stack.append((node, precedence, e, []))
+                            precedence = Precedence.ASSIGNMENT
+                            break
+                        paren = self.consume(
+                            TT.RIGHT_PAREN, "Expect ')' after arguments.")
+                        e = expr.Call(e, paren, [])
+                        continue
+                    if node is expr.Assign:
+                        operator = tokens[self.current - 1]
+                        stack.append((node, precedence, e, operator))
+                        precedence = Precedence.ASSIGNMENT
+                        break
+                    # The then branch of a conditional
+                    stack.append((node, precedence, e, None))
+                    precedence = Precedence.COMMA
+                    break
+
+                # The operand is complete, finish the node waiting for it
+                if not stack:
+                    return e
+                node, precedence, a, b = stack.pop()
+                if node is expr.Binary or node is expr.Logical:
+                    e = node(a, b, e)
+                elif node is expr.Unary:
+                    e = expr.Unary(a, e)
+                elif node is expr.Grouping:
+                    self.consume(
+                        TT.RIGHT_PAREN, "Expect ')' after expression.")
+                    e = expr.Grouping(e)
+                elif node is expr.Call:
+                    b.append(e)
+                    if self.match(TT.COMMA):
+                        if len(b) >= 255:
+                            self.error(self.peek(),
+                                       "Can't have more than 255 arguments")
+                        stack.append((node, precedence, a, b))
+                        precedence = Precedence.ASSIGNMENT
+                        break
+                    paren = self.consume(
+                        TT.RIGHT_PAREN, "Expect ')' after arguments.")
+                    e = expr.Call(a, paren, b)
+                elif node is expr.Assign:
+                    if isinstance(a, expr.Variable):
+                        e = expr.Assign(a.name, e)
+                    elif isinstance(a, expr.Get):
+                        e = expr.Set(a.object, a.name, e)
+                    else:
+                        self.error(b, 'Invalid assignment target.')
+                        e = a
+                elif b is None:
+                    self.consume(
+                        TT.COLON,
+                        "Expect ':' after then branch of conditional "
+                        "expression")
+                    stack.append((node, precedence, a, e))
+                    precedence = Precedence.CONDITIONAL
+                    break
+                else:
+                    e = expr.Conditional(a, b, e)
 
     @property
     def is_at_end(self) -> bool:
-        return self.peek().type == TT.EOF
+        return self.tokens.type_at(self.current) is TT.EOF
 
     def advance(self) -> Token:
-        if not self.is_at_end:
-            self.current += 1
-        return self.previous()
+        current = self.current
+        if self.tokens.type_at(current) is not TT.EOF:
+            self.current = current + 1
+            return self.tokens[current]
+        return self.tokens[current - 1]
 
     def peek(self) -> Token:
         return self.tokens[self.current]
 
+    def peek_type(self) -> TT:
+        return self.tokens.type_at(self.current)
+
     def previous(self) -> Token:
         return self.tokens[self.current - 1]
 
     def match(self, *types: TT) -> bool:
-        if self.is_at_end:
-            return False
-
-        if self.peek().type in types:
-            self.advance()
+        # EOF is never asked for, so this doesn't match past the end
+        if self.tokens.type_at(self.current) in types:
+            self.current += 1
             return True
         return False
 
     def consume(self, type: TT, message: str) -> Token:
-        if self.peek().type == type:
-            return self.advance()
+        current = self.current
+        if self.tokens.type_at(current) is type:
+            # Only ever called with types other than EOF
+            self.current = current + 1
+            return self.tokens[current]
         raise self.error(self.peek(), message)
 
     def error(self, token: Token, message: str) -> ParseError:
@@ -396,10 +596,10 @@ class Parser:
     def synchronize(self) -> None:  # pragma: no cover
         self.advance()
         while not self.is_at_end:
-            if (self.previous().type == TT.SEMICOLON
-               or self.peek().type in self.syncpoints):
+            if (self.tokens.type_at(self.current - 1) is TT.SEMICOLON
+               or self.peek_type() in self.syncpoints):
                 return
             self.advance()
 
 
-__all__ = ['Parser', 'ParseError']
+__all__ = ['Parser', 'ParseError', 'TokenWindow', 'LazyBody']
@@ -0,0 +1,358 @@
+"""Self-specializing nodes of the tree walking interpreter
+
+Working out what a Binary, Unary or Get expression does takes going over
+its operator and the types of its operands, or looking a property up in
+an instance's fields and then in its class, each time it's evaluated.
+Instead, the first time lox.Interpreter evaluates one of them, it does
+that with the values it got, and stores a variant of the node specialized
+for them in its variant slot: a function of the interpreter and the node
+evaluating it from then on, like add_numbers for a '+' of two numbers, or
+get_method for a method of a given class.
+
+A variant checks the values it gets are like the ones it was specialized
+for, which is much cheaper than working it out again. If they aren't,
+the node is rewritten into its generic variant for good, which does what
+the interpreter did before, and the values are handed to it. Nodes
+lox.infer_types typed get variants without guards instead, since their
+operands can only be of the types they're typed for.
+"""
+import operator
+from typing import Callable, Dict, List, Union
+
+import lox
+import lox.expr as expr
+import lox.stmt as stmt
+from lox.class_ import LoxInstance
+from lox.inference import postorder
+from lox.token import TokenType as TT
+
+Variant = Callable[['lox.Interpreter', expr.Expr], object]
+
+
+def divide(a: float, b: float) -> float:
+    return a / b if b else float('nan')
+
+
+# Binary operators on operands of known types, see lox.infer_types
+typed_operations: Dict[TT, Callable[[object, object], object]] = {
+    TT.PLUS: operator.add,
+    TT.MINUS: operator.sub,
+    TT.STAR: operator.mul,
+    TT.SLASH: divide,
+    TT.GREATER: operator.gt,
+    TT.GREATER_EQUAL: operator.ge,
+    TT.LESS: operator.lt,
+    TT.LESS_EQUAL: operator.le,
+}
+
+
+def binary(e: expr.Binary, a: object, b: object) -> object:
+    """Value of e with operands a and b"""
+    o = e.operator.type
+
+    if o == TT.PLUS:
+        _ = isinstance
+        if _(a, str) and _(b, float) or _(a, float) and _(b, str):
+            return str(a) + str(b)
+        try:
+            return a + b
+        except TypeError:
+            raise lox.LoxRuntimeError(
+                e.operator,
+                'Operands must be two numbers or two strings'
+            )
+
+    if o == TT.EQUAL_EQUAL:
+        return a == b
+    if o == TT.BANG_EQUAL:
+        return a != b
+    if o == TT.COMMA:
+        return b
+
+    # Number only expressions
+    if not (isinstance(a, float) and isinstance(b, float)):
+        raise lox.LoxRuntimeError(e.operator, 'Operands must be numbers')
+
+    if o == TT.MINUS:
+        return a - b
+    if o == TT.STAR:
+        return a * b
+    if o == TT.SLASH:
+        try:
+            return a / b
+        except ZeroDivisionError:
+            return float('nan')
+    if o == TT.GREATER:
+        return a > b
+    if o == TT.GREATER_EQUAL:
+        return a >= b
+    if o == TT.LESS:
+        return a < b
+    if o == TT.LESS_EQUAL:
+        return a <= b
+    # unreachable
+
+
+def generic_binary(interpreter: 'lox.Interpreter', e: expr.Binary):
+    return binary(e, e.left.accept(interpreter), e.right.accept(interpreter))
+
+
+def generalize_binary(e: expr.Binary, a: object, b: object) -> object:
+    """Rewrites e into its generic variant, whose value with a and b it
+    returns"""
+    e.variant = generic_binary
+    return binary(e, a, b)
+
+
+def add_numbers(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is float and type(b) is float:
+        return a + b
+    return generalize_binary(e, a, b)
+
+
+def concatenate(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is str and type(b) is str:
+        return a + b
+    return generalize_binary(e, a, b)
+
+
+def subtract(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is float and type(b) is float:
+        return a - b
+    return generalize_binary(e, a, b)
+
+
+def multiply(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is float and type(b) is float:
+        return a * b
+    return generalize_binary(e, a, b)
+
+
+def divide_numbers(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is float and type(b) is float:
+        return a / b if b else float('nan')
+    return generalize_binary(e, a, b)
+
+
+def greater(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is float and type(b) is float:
+        return a > b
+    return generalize_binary(e, a, b)
+
+
+def greater_equal(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is float and type(b) is float:
+        return a >= b
+    return generalize_binary(e, a, b)
+
+
+def less(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is float and type(b) is float:
+        return a < b
+    return generalize_binary(e, a, b)
+
+
+def less_equal(interpreter: 'lox.Interpreter', e: expr.Binary):
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    if type(a) is float and type(b) is float:
+        return a <= b
+    return generalize_binary(e, a, b)
+
+
+# Any values are compared the same way
+def equal(interpreter: 'lox.Interpreter', e: expr.Binary):
+    return e.left.accept(interpreter) == e.right.accept(interpreter)
+
+
+def not_equal(interpreter: 'lox.Interpreter', e: expr.Binary):
+    return e.left.accept(interpreter) != e.right.accept(interpreter)
+
+
+def typed(operation: Callable[[object, object], object]) -> Variant:
+    """Variant of typed Binary expressions doing operation"""
+    def variant(interpreter: 'lox.Interpreter', e: expr.Binary):
+        return operation(e.left.accept(interpreter),
+                         e.right.accept(interpreter))
+    return variant
+
+
+# Variants of typed Binary expressions by operator
+typed_variants = {o: typed(operation)
+                  for o, operation in typed_operations.items()}
+# and of the others, for two numbers
+number_variants = {
+    TT.PLUS: add_numbers,
+    TT.MINUS: subtract,
+    TT.STAR: multiply,
+    TT.SLASH: divide_numbers,
+    TT.GREATER: greater,
+    TT.GREATER_EQUAL: greater_equal,
+    TT.LESS: less,
+    TT.LESS_EQUAL: less_equal,
+}
+# and for any values
+any_variants = {
+    TT.EQUAL_EQUAL: equal,
+    TT.BANG_EQUAL: not_equal,
+}
+
+
+def specialize_binary(interpreter: 'lox.Interpreter', e: expr.Binary):
+    """Evaluates e for the first time, rewriting it into its variant for
+    the values of its operands"""
+    a, b = e.left.accept(interpreter), e.right.accept(interpreter)
+    o = e.operator.type
+    variant = None
+    if e.typed:
+        variant = typed_variants[o]
+    elif type(a) is float and type(b) is float:
+        variant = number_variants.get(o)
+    elif type(a) is str and type(b) is str and o is TT.PLUS:
+        variant = concatenate
+    e.variant = variant or any_variants.get(o, generic_binary)
+    return binary(e, a, b)
+
+
+def unary(interpreter: 'lox.Interpreter', e: expr.Unary, a: object):
+    """Value of e with operand a"""
+    o = e.operator.type
+    if o == TT.BANG:
+        return not interpreter.is_truthy(a)
+    if o == TT.MINUS:
+        if not isinstance(a, float):
+            raise lox.LoxRuntimeError(
+                e.operator, "Operand must be a number.")
+        return -a
+    # unreachable
+
+
+def generic_unary(interpreter: 'lox.Interpreter', e: expr.Unary):
+    return unary(interpreter, e, e.right.accept(interpreter))
+
+
+def negate(interpreter: 'lox.Interpreter', e: expr.Unary):
+    a = e.right.accept(interpreter)
+    if type(a) is float:
+        return -a
+    e.variant = generic_unary
+    return unary(interpreter, e, a)
+
+
+def negate_typed(interpreter: 'lox.Interpreter', e: expr.Unary):
+    return -e.right.accept(interpreter)
+
+
+def logical_not(interpreter: 'lox.Interpreter', e: expr.Unary):
+    return not interpreter.is_truthy(e.right.accept(interpreter))
+
+
+def specialize_unary(interpreter: 'lox.Interpreter', e: expr.Unary):
+    """Evaluates e for the first time, rewriting it into its variant for
+    the value of its operand"""
+    a = e.right.accept(interpreter)
+    o = e.operator.type
+    if o is TT.BANG:
+        e.variant = logical_not
+    elif e.typed:
+        e.variant = negate_typed
+    elif o is TT.MINUS and type(a) is float:
+        e.variant = negate
+    else:
+        e.variant = generic_unary
+    return unary(interpreter, e, a)
+
+
+def get(interpreter: 'lox.Interpreter', e: expr.Get, instance: object):
+    """Value of e on instance"""
+    if isinstance(instance, LoxInstance):
+        return instance.get(e.name, interpreter)
+
+    raise lox.LoxRuntimeError(
+        e.name, 'Can only access properties on instances and classes.')
+
+
+def generic_get(interpreter: 'lox.Interpreter', e: expr.Get):
+    return get(interpreter, e, e.object.accept(interpreter))
+
+
+def generalize_get(interpreter: 'lox.Interpreter', e: expr.Get,
+                   instance: object) -> object:
+    """Rewrites e into its generic variant, whose value on instance it
+    returns"""
+    e.variant = generic_get
+    return get(interpreter, e, instance)
+
+
+def get_field(kind: type, name: str) -> Variant:
+    """Variant of Get expressions of the field name of instances of kind,
+    LoxInstance or LoxClass
+
+    Each instance has fields of its own, so its class doesn't tell if it
+    has one by that name, which is checked instead.
+    """
+    def variant(interpreter: 'lox.Interpreter', e: expr.Get):
+        instance = e.object.accept(interpreter)
+        if type(instance) is kind:
+            fields = instance.fields
+            if name in fields:
+                return fields[name]
+        return generalize_get(interpreter, e, instance)
+    return variant
+
+
+def get_method(kind: type, class_: 'lox.LoxClass', name: str,
+               method: 'lox.LoxFunction') -> Variant:
+    """Variant of Get expressions of the method name of instances of
+    class_, which are of kind, that have no field shadowing it
+
+    Methods of classes don't change, so it's looked up once.
+    """
+    is_getter = method.is_getter
+
+    def variant(interpreter: 'lox.Interpreter', e: expr.Get):
+        instance = e.object.accept(interpreter)
+        if type(instance) is kind and instance.class_ is class_ \
+                and name not in instance.fields:
+            if is_getter:
+                return method.bind(instance).call(interpreter, [])
+            return method.bind(instance)
+        return generalize_get(interpreter, e, instance)
+    return variant
+
+
+def specialize_get(interpreter: 'lox.Interpreter', e: expr.Get):
+    """Evaluates e for the first time, rewriting it into its variant for
+    the instance it's on"""
+    instance = e.object.accept(interpreter)
+    e.variant = generic_get
+    if isinstance(instance, LoxInstance):
+        name = e.name.lexeme
+        if name in instance.fields:
+            e.variant = get_field(type(instance), name)
+        else:
+            method = instance.class_.find_method(name)
+            if method:
+                e.variant = get_method(type(instance), instance.class_,
+                                       name, method)
+    return get(interpreter, e, instance)
+
+
+def unspecialize(roots: List[Union[expr.Expr, stmt.Stmt]]) -> None:
+    """Rewrites the nodes in roots back into how they were before they were
+    first evaluated, for running them again from scratch"""
+    for node in postorder(roots):
+        kind = type(node)
+        if kind is expr.Binary or kind is expr.Unary or kind is expr.Get:
+            node.variant = None
+
+
+__all__ = ['specialize_binary', 'specialize_get', 'specialize_unary',
+           'unspecialize']
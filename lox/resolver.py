@@ -1,23 +1,12 @@
 from enum import Enum
 from itertools import chain
-from typing import List, Dict, Union, Optional
+from typing import Callable, List, Dict, Set, Tuple, Union, Optional
 
 import lox
 import lox.expr as expr
 import lox.stmt as stmt
 
 
-class _ResolverMakeScope:
-    def __init__(self, resolver: 'Resolver'):
-        self.resolver = resolver
-
-    def __enter__(self):
-        return self.resolver.begin_scope()
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.resolver.end_scope()
-
-
 class FunctionType(Enum):
     NONE = 0
     FUNCTION = 1
@@ -32,50 +21,248 @@ class ClassType(Enum):
 
 
 class VarState:
-    def __init__(self, name: Optional['lox.Token'], defined=False):
+    used = False
+    assigned = False
+    captured = False
+    # Whether it's being defined, and was captured then
+    defining = False
+    early = False
+
+    def __init__(self, name: Optional['lox.Token'], slot: int,
+                 declaration: Optional[stmt.Stmt] = None, defined=False):
         self.name = name
+        # Index in the function's frame
+        self.slot = slot
+        self.declaration = declaration
         self.defined = defined
-        self.used = False
+        # Variables and assignments resolved to it
+        self.nodes: List[Union[expr.Variable, expr.Assign, expr.This]] = []
+
+
+class FunctionState:
+    """A function being resolved, or the top-level code
+
+    At run time, all the scopes of a function call are in one frame. For
+    methods, it's enclosed by the frame of the bound instance. Then comes
+    the frame of captures.
+    """
+    __slots__ = ('node', 'boundary', 'enclosing', 'this_scope',
+                 'captures_depth', 'captures', 'next', 'size')
+
+    def __init__(self, node: Optional[stmt.Function], boundary: int,
+                 enclosing: Optional['FunctionState'], method=False):
+        self.node = node
+        # Index of the function's outermost scope, the class scope for
+        # methods
+        self.boundary = boundary
+        self.enclosing = enclosing
+        self.this_scope = boundary if method else -1
+        self.captures_depth = 2 if method else 1
+        # Slots in the node's captures, by variable
+        self.captures: Dict[VarState, int] = {}
+        # The next free slot in the frame, slots of ended scopes are reused
+        self.next = 0
+        self.size = 0
+
+
+# Something to call once the nodes pushed after it are resolved
+Action = Tuple[Callable[..., None], ...]
 
 
 class Resolver(expr.Visitor[None], stmt.Visitor[None]):
-    def __init__(self, interpreter: 'lox.Interpreter'):
-        self.interpreter = interpreter
+    """Resolves variables to the scopes declaring them
+
+    The tree is walked with an explicit stack instead of recursion, so that
+    nesting depth isn't limited by the Python stack. Visit methods push the
+    children of a node in reverse order, so they're popped and resolved in
+    source order, and anything to be done after them (like ending a scope)
+    is pushed below them as an action.
+
+    The locals of a function, in all of its scopes, are given slots in one
+    frame (see FunctionState). Variables of enclosing functions are captured
+    into a frame of their own when the function is declared. Captured
+    variables that are assigned somewhere, or captured before
+    they're defined, are turned into cells when their scope ends.
+
+    Globals are given slots in table. With constants, the whole program is
+    expected to be resolved in one call, and calls to global functions and
+    classes that are never reassigned have their arity checked statically.
+    With types, the operations whose operands have known types are marked
+    after each call, see lox.infer_types.
+    """
+    def __init__(self, table: Optional['lox.GlobalTable'] = None,
+                 constants: bool = False, types: bool = False):
+        self.table = lox.GlobalTable() if table is None else table
+        self.constants = constants
+        # Locals whose scopes have ended, with types
+        self.variables: Optional[List[VarState]] = [] if types else None
+        # Top-level declarations, global assignments and calls to globals
+        # seen so far, with constants
+        self.declarations: Dict[str, List[stmt.Stmt]] = {}
+        self.assigned: Set[str] = set()
+        self.calls: List[expr.Call] = []
         self.scopes: List[Dict[str, VarState]] = []
+        self.function = FunctionState(None, 0, None)
         self.current_function = FunctionType.NONE
         self.current_class = FunctionType.NONE
         self.loop_depth = 0
-
-    def resolve(self, obj: Union[List[stmt.Stmt], stmt.Stmt, expr.Expr]):
-        if isinstance(obj, list):
-            for i in obj:
-                i.accept(self)
+        self.stack: List[Union[stmt.Stmt, expr.Expr, Action]] = []
+        # Visit methods by node class, which saves going through accept
+        self.visits = {
+            cls: getattr(self, f'visit_{cls.__name__.lower()}_{suffix}')
+            for base, suffix in ((expr.Expr, 'expr'), (stmt.Stmt, 'stmt'))
+            for cls in base.__subclasses__()
+        }
+
+    def resolve(self, obj: Union[List[stmt.Stmt], stmt.Stmt, expr.Expr,
+                                 Action]):
+        enclosing = self.stack
+        self.stack = stack = []
+        self.push(obj)
+        pop = stack.pop
+        visits = self.visits
+        while stack:
+            item = pop()
+            if type(item) is tuple:
+                item[0](*item[1:])
+            else:
+                visits[type(item)](item)
+        self.stack = enclosing
+        if enclosing:
+            return
+        if self.constants:
+            self.check_calls()
+        if self.variables is not None:
+            # Lazy bodies are resolved as an action, see resolve_lazy
+            lox.infer_types(obj[1] if type(obj) is tuple else obj,
+                            self.variables)
+            self.variables = []
+
+    def check_calls(self):
+        """Marks the calls to constant globals that pass as many arguments
+        as they take
+
+        A global is constant if it's declared once, by a function or class
+        declaration, and never assigned, or if it's a native that's never
+        declared or assigned. Calls passing the wrong number of arguments
+        are left to fail at run time.
+        """
+        arities = {}
+        for name, declarations in self.declarations.items():
+            declaration = declarations[0]
+            if len(declarations) > 1 or name in self.assigned:
+                continue
+            if isinstance(declaration, stmt.Function):
+                arities[name] = len(declaration.params)
+            elif isinstance(declaration, stmt.Class):
+                arities[name] = next(
+                    (len(method.params) for method in declaration.methods
+                     if method.name.lexeme == 'init'), 0)
+        for name, native in lox.natives.items():
+            if name not in self.declarations and name not in self.assigned:
+                arities[name] = native.arity()
+
+        for call in self.calls:
+            callee = call.callee
+            if callee.depth is None \
+                    and arities.get(callee.name.lexeme) == len(call.arguments):
+                call.checked = True
+        self.calls = []
+
+    def push(self, obj: Union[List[stmt.Stmt], stmt.Stmt, expr.Expr,
+                              Action]):
+        if type(obj) is list:
+            self.stack.extend(reversed(obj))
         else:
-            obj.accept(self)
-
-    def resolve_local(self, e: expr.Expr, name: 'lox.Token', used=True):
-        i = len(self.scopes) - 1
-        while i >= 0:
-            if name.lexeme in self.scopes[i]:
-                self.interpreter.resolve(e, len(self.scopes) - 1 - i)
+            self.stack.append(obj)
+
+    def resolve_local(self, e: Union[expr.Variable, expr.Assign, expr.This],
+                      name: 'lox.Token', used=True):
+        lexeme = name.lexeme
+        scopes = self.scopes
+        depth = 0
+        for scope in reversed(scopes):
+            state = scope.get(lexeme)
+            if state is not None:
                 if used:
-                    self.scopes[i][name.lexeme].used = True
-                break
-            i -= 1
+                    state.used = True
+                else:
+                    state.assigned = True
+                state.nodes.append(e)
+                function = self.function
+                index = len(scopes) - 1 - depth
+                if index >= function.boundary:
+                    e.depth = 1 if index == function.this_scope else 0
+                    e.slot = state.slot
+                else:
+                    e.depth = function.captures_depth
+                    e.slot = self.capture(function, state, index)
+                return
+            depth += 1
+        if type(e) is not expr.This:
+            e.slot = self.table.slot(lexeme)
+
+    def capture(self, function: FunctionState, state: VarState,
+                index: int) -> int:
+        """Slot of the variable declared in scopes[index] in the captures of
+        function, which is nested in the function declaring it"""
+        slot = function.captures.get(state)
+        if slot is None:
+            enclosing = function.enclosing
+            # Captured when the function is declared, in the enclosing one
+            if index >= enclosing.boundary:
+                capture = (1 if index == enclosing.this_scope else 0,
+                           state.slot)
+                state.captured = True
+                if state.defining:
+                    state.early = True
+            else:
+                capture = (enclosing.captures_depth,
+                           self.capture(enclosing, state, index))
+            captures = function.node.captures
+            slot = function.captures[state] = len(captures)
+            captures.append(capture)
+        return slot
 
     def resolve_function(self, function: stmt.Function, type: FunctionType):
-        enclosing_function = self.current_function
+        if isinstance(function.body, lox.LazyBody):
+            # Resolved with resolve_lazy when it's parsed
+            function.body.type = type
+            function.body.is_method = bool(self.scopes)
+            return
+
+        self.stack.append((self.end_function, self.current_function,
+                           self.loop_depth))
+        self.push(function.body)
         self.current_function = type
-        enclosing_loop_depth = self.loop_depth
         self.loop_depth = 0
-        with self.make_scope():
-            for param in function.params:
-                self.declare(param)
-                self.define(param)
-            self.resolve(function.body)
+        function.captures = []
+        if type is FunctionType.FUNCTION:
+            self.function = FunctionState(function, len(self.scopes),
+                                          self.function)
+        else:
+            self.function = FunctionState(function, len(self.scopes) - 1,
+                                          self.function, True)
+        self.begin_scope()
+        for param in function.params:
+            self.declare(param, function)
+            self.define(param)
+
+    def end_function(self, enclosing_function: FunctionType,
+                     enclosing_loop_depth: int):
+        self.end_scope()
+        function = self.function
+        function.node.frame_size = function.size
+        self.function = function.enclosing
         self.current_function = enclosing_function
         self.loop_depth = enclosing_loop_depth
 
+    def resolve_lazy(self, function: stmt.Function, body: 'lox.LazyBody'):
+        """Resolves a top-level function or method that was parsed lazily"""
+        if body.is_method:
+            self.scopes = [{'this': VarState(None, 0, None, True)}]
+        self.resolve((self.resolve_function, function, body.type))
+
     def begin_scope(self):
         self.scopes.append({})
         return self.scopes[-1]
@@ -85,24 +272,61 @@ class Resolver(expr.Visitor[None], stmt.Visitor[None]):
             if var_state.name and not var_state.used:
                 lox.lox.error_token(
                     var_state.name, f"Unused local variable '{name}'.")
-
-    def make_scope(self):
-        return _ResolverMakeScope(self)
-
-    def declare(self, name: 'lox.Token'):
-        if self.scopes:
-            if name.lexeme in self.scopes[-1]:
-                lox.lox.error_token(
-                    name, 'Already a variable with this name in this scope.')
-            self.scopes[-1][name.lexeme] = VarState(name)
+            if var_state.captured and (var_state.assigned
+                                       or var_state.early):
+                self.make_cell(var_state)
+            if self.variables is not None and var_state.name:
+                self.variables.append(var_state)
+
+    def make_cell(self, state: VarState):
+        """Keeps a captured variable in a cell shared by the closures"""
+        for node in state.nodes:
+            node.cell = True
+        declaration = state.declaration
+        if isinstance(declaration, stmt.Function) \
+                and state.name is not declaration.name:
+            if declaration.cells is None:
+                declaration.cells = []
+            declaration.cells.append(state.slot)
+        else:
+            declaration.cell = True
+
+    def declare(self, name: 'lox.Token',
+                declaration: stmt.Stmt) -> Optional[VarState]:
+        if not self.scopes:
+            if self.constants:
+                self.declarations.setdefault(name.lexeme, []) \
+                    .append(declaration)
+            return None
+        if name.lexeme in self.scopes[-1]:
+            lox.lox.error_token(
+                name, 'Already a variable with this name in this scope.')
+        function = self.function
+        slot = function.next
+        function.next += 1
+        if function.next > function.size:
+            function.size = function.next
+        state = self.scopes[-1][name.lexeme] = VarState(name, slot,
+                                                        declaration)
+        return state
 
     def define(self, name: 'lox.Token'):
         if self.scopes:
             self.scopes[-1][name.lexeme].defined = True
 
     def visit_block_stmt(self, s: stmt.Block) -> None:
-        with self.make_scope():
-            self.resolve(s.statements)
+        self.begin_scope()
+        self.stack.append((self.end_block, s, self.function.next))
+        self.push(s.statements)
+
+    def end_block(self, block: Union[stmt.Block, stmt.For], next: int):
+        self.end_scope()
+        function = self.function
+        function.next = next
+        if function.node is None and not self.scopes:
+            # The outermost block or loop of top-level code
+            block.frame_size = function.size or None
+            function.size = 0
 
     def visit_break_stmt(self, s: stmt.Break) -> None:
         if not self.loop_depth:
@@ -112,41 +336,79 @@ class Resolver(expr.Visitor[None], stmt.Visitor[None]):
         enclosing_class = self.current_function
         self.current_class = ClassType.CLASS
 
-        self.declare(s.name)
+        state = self.declare(s.name, s)
+        if state:
+            s.slot = state.slot
         self.define(s.name)
+        self.begin_definition(s.name)
+
+        scope = self.begin_scope()
+        scope['this'] = VarState(None, 0, None, True)
+        methods: List[Action] = []
+        for method in s.methods:
+            declaration = FunctionType.INIT \
+                if method.name.lexeme == 'init' \
+                else FunctionType.METHOD
+            methods.append((self.resolve_function, method, declaration))
+
+        for method in s.class_methods:
+            methods.append(
+                (self.resolve_function, method, FunctionType.METHOD))
+
+        for method in chain(s.setters, s.class_setters):
+            methods.append(
+                (self.resolve_function, method, FunctionType.SETTER))
+
+        self.stack.append((self.end_class, enclosing_class))
+        self.stack.append((self.end_scope,))
+        self.stack.extend(reversed(methods))
+
+    def end_class(self, enclosing_class: ClassType):
+        self.current_class = enclosing_class
 
-        with self.make_scope() as scope:
-            scope['this'] = VarState(None, True)
-            for method in s.methods:
-                declaration = FunctionType.INIT \
-                    if method.name.lexeme == 'init' \
-                    else FunctionType.METHOD
-                self.resolve_function(method, declaration)
-
-            for method in s.class_methods:
-                self.resolve_function(method, FunctionType.METHOD)
-
-            for method in chain(s.setters, s.class_setters):
-                self.resolve_function(method, FunctionType.SETTER)
+    def begin_definition(self, name: 'lox.Token'):
+        """Marks a local function or class as being defined until the
+        actions pushed after this are done"""
+        if self.scopes:
+            state = self.scopes[-1][name.lexeme]
+            state.defining = True
+            self.stack.append((self.end_definition, state))
 
-        self.current_class = enclosing_class
+    def end_definition(self, state: VarState):
+        state.defining = False
 
     def visit_expression_stmt(self, s: stmt.Expression) -> None:
-        self.resolve(s.expression)
+        self.stack.append(s.expression)
+
+    def visit_for_stmt(self, s: stmt.For) -> None:
+        self.begin_scope()
+        self.loop_depth += 1
+        self.stack.append((self.end_block, s, self.function.next))
+        self.stack.append((self.end_loop,))
+        if s.increment:
+            self.stack.append(s.increment)
+        self.stack.append(s.body)
+        if s.condition:
+            self.stack.append(s.condition)
+        if s.initializer:
+            self.stack.append(s.initializer)
 
     def visit_function_stmt(self, s: stmt.Function) -> None:
-        self.declare(s.name)
+        state = self.declare(s.name, s)
+        if state:
+            s.slot = state.slot
         self.define(s.name)
+        self.begin_definition(s.name)
         self.resolve_function(s, FunctionType.FUNCTION)
 
     def visit_if_stmt(self, s: stmt.If) -> None:
-        self.resolve(s.condition)
-        self.resolve(s.then_branch)
         if s.else_branch:
-            self.resolve(s.else_branch)
+            self.stack.append(s.else_branch)
+        self.stack.append(s.then_branch)
+        self.stack.append(s.condition)
 
     def visit_print_stmt(self, s: stmt.Print) -> None:
-        self.resolve(s.expression)
+        self.stack.append(s.expression)
 
     def visit_return_stmt(self, s: stmt.Return) -> None:
         if self.current_function is FunctionType.NONE:
@@ -158,54 +420,70 @@ class Resolver(expr.Visitor[None], stmt.Visitor[None]):
             elif self.current_function is FunctionType.SETTER:
                 lox.lox.error_token(
                     s.keyword, "Can't return a value from a setter.")
-            self.resolve(s.value)
+            self.stack.append(s.value)
 
     def visit_var_stmt(self, s: stmt.Var) -> None:
-        self.declare(s.name)
+        state = self.declare(s.name, s)
+        if state:
+            s.slot = state.slot
         if s.initializer:
-            self.resolve(s.initializer)
-        self.define(s.name)
+            self.stack.append((self.define, s.name))
+            self.stack.append(s.initializer)
+        else:
+            self.define(s.name)
 
     def visit_while_stmt(self, s: stmt.While) -> None:
         self.loop_depth += 1
-        self.resolve(s.condition)
-        self.resolve(s.body)
+        self.stack.append((self.end_loop,))
+        self.stack.append(s.body)
+        self.stack.append(s.condition)
+
+    def end_loop(self):
         self.loop_depth -= 1
 
     def visit_assign_expr(self, e: expr.Assign) -> None:
-        self.resolve(e.value)
+        # No expression declares anything, so the scopes are the same after
+        # resolving the value
         self.resolve_local(e, e.name, False)
+        if self.constants and e.depth is None:
+            self.assigned.add(e.name.lexeme)
+        self.stack.append(e.value)
 
     def visit_binary_expr(self, e: expr.Binary) -> None:
-        self.resolve(e.left)
-        self.resolve(e.right)
+        self.stack.append(e.right)
+        self.stack.append(e.left)
 
     def visit_call_expr(self, e: expr.Call) -> None:
-        self.resolve(e.callee)
-        for arg in e.arguments:
-            self.resolve(arg)
+        if self.constants and type(e.callee) is expr.Variable:
+            self.calls.append(e)
+        self.stack.extend(reversed(e.arguments))
+        self.stack.append(e.callee)
 
     def visit_conditional_expr(self, e: expr.Conditional) -> None:
-        self.resolve(e.condition)
-        self.resolve(e.else_branch)
-        self.resolve(e.then_branch)
+        self.stack.append(e.then_branch)
+        self.stack.append(e.else_branch)
+        self.stack.append(e.condition)
 
     def visit_get_expr(self, e: expr.Get) -> None:
-        self.resolve(e.object)
+        self.stack.append(e.object)
 
     def visit_grouping_expr(self, e: expr.Grouping) -> None:
-        self.resolve(e.expression)
+        self.stack.append(e.expression)
+
+    def visit_inline_expr(self, e: expr.Inline) -> None:
+        # Only made by lox.Optimizer, out of resolved calls
+        pass
 
     def visit_literal_expr(self, e: expr.Literal) -> None:
         pass
 
     def visit_logical_expr(self, e: expr.Logical) -> None:
-        self.resolve(e.left)
-        self.resolve(e.right)
+        self.stack.append(e.right)
+        self.stack.append(e.left)
 
     def visit_set_expr(self, e: expr.Set) -> None:
-        self.resolve(e.object)
-        self.resolve(e.value)
+        self.stack.append(e.value)
+        self.stack.append(e.object)
 
     def visit_this_expr(self, e: expr.This) -> None:
         if self.current_function is FunctionType.NONE:
@@ -214,7 +492,7 @@ class Resolver(expr.Visitor[None], stmt.Visitor[None]):
         self.resolve_local(e, e.keyword)
 
     def visit_unary_expr(self, e: expr.Unary) -> None:
-        self.resolve(e.right)
+        self.stack.append(e.right)
 
     def visit_variable_expr(self, e: expr.Variable) -> None:
         if self.scopes:
@@ -1,8 +1,17 @@
-from typing import Any, List
-
-from lox.token import Token, TokenType
+import codecs
+import contextlib
+import gc
+import io
+import re
+from typing import (Any, IO, Iterator, List, Optional, Tuple, Union,
+                    TYPE_CHECKING)
+
+from lox.token import Token, TokenBuffer, TokenList, TokenType
 from lox import lox
 
+if TYPE_CHECKING:
+    import mmap
+
 
 class Scanner:
     single_char = {
@@ -61,7 +70,7 @@ class Scanner:
 
     def __init__(self, source: str):
         self.source = source
-        self.tokens = []
+        self.tokens = TokenList()
         self.start = 0
         self.current = 0
         self.line = 1
@@ -203,6 +212,346 @@ class Scanner:
         self.tokens.append(Token(type, text, literal, self.line))
 
 
+class RegexScanner(Scanner):
+    """Scanner driven by compiled master patterns instead of per-character
+    method calls.
+
+    Source is scanned in stretches of lines with a single findall() over
+    each, which returns the lexeme of each token and newline. Lines with a
+    string that doesn't end or a block comment that nests more than once or
+    doesn't end are handed to a slower path, which walks the master pattern
+    match by match. Either way the tokens, line numbers and errors are
+    exactly the same as Scanner's.
+    """
+    # Comments match nothing, except block comments spanning lines, which
+    # have newlines Scanner doesn't count. Block comments that nest more than
+    # once or don't end match '/*' on their own, as unterminated strings
+    # match '"'
+    source_pattern = re.compile(r"""
+        [ \r\t\f\v]*(?:
+            //[^\n]*
+          | /\*(?:[^*/\n]|\*(?!/)|/(?!\*)
+               | /\*(?:[^*/\n]|\*(?!/)|/(?!\*))*\*/)*\*/
+          | ( [A-Za-z_][A-Za-z0-9_]*|[!=<>]=?|[(){},.\-+;*?:]
+            | [0-9]+(?:\.[0-9]+)?
+            | "[^"]*"
+            | /\*(?:[^*/]|\*(?!/)|/(?!\*))*\*/
+            | /\*?
+            | [^ \r\t\f\v]
+            )
+        )
+    """, re.VERBOSE)
+    pattern = re.compile(r"""
+        (?P<space>[ \r\t\f\v\n]+)
+      | (?P<word>[A-Za-z_][A-Za-z0-9_]*|[!=<>]=?|[(){},.\-+;*?:])
+      | (?P<number>[0-9]+(?:\.[0-9]+)?)
+      | (?P<string>"[^"]*")
+      | (?P<comment>//[^\n]*)
+      | (?P<block_comment>/\*)
+      | (?P<slash>/)
+      | (?P<unterminated_string>"[^"]*)
+      | (?P<unexpected>.)
+    """, re.VERBOSE | re.DOTALL)
+    block_comment_pattern = re.compile(r'/\*|\*/')
+    # Keywords and operators are looked up together, anything else matched by
+    # the word group is an identifier
+    words = {
+        **Scanner.keywords,
+        **Scanner.single_char,
+        **{c + k: v
+           for c, m in Scanner.double_char.items()
+           for k, v in m.items()},
+        '/': TokenType.SLASH,
+    }
+    # Largest stretch of source scanned with one findall(). After a string or
+    # block comment that scan_source can't scan the stretch starts small and
+    # doubles again, so that little is scanned twice
+    block_size = 1 << 16
+    min_block_size = 1 << 10
+    identifier_start = frozenset(
+        'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_')
+
+    def scan_tokens(self) -> List[Token]:
+        with paused_gc():
+            self.scan_lines(len(self.source), True)
+        self.tokens.append(Token(TokenType.EOF, '', None, self.line))
+        return self.tokens
+
+    def scan_lines(self, end: int, final: bool) -> None:
+        """Scans source from current position up to end
+
+        Unless the scan is final, end must be right after a newline and a
+        string or block comment reaching past the end stops the scan at the
+        start of its line, so it can be retried once there's more source.
+        """
+        source = self.source
+        size = self.block_size
+        while self.current < end:
+            stop = source.find('\n', self.current + size, end) + 1 or end
+            if self.scan_source(stop):
+                size = min(size * 2, self.block_size)
+                continue
+            spanned = self.scan_spanning(self.current, self.line, final)
+            if spanned is None:
+                # Stopped short of a string or block comment
+                return
+            self.current, self.line = spanned
+            size = self.min_block_size
+
+    def scan_source(self, end: int) -> bool:
+        """Scans source from current position up to end with one findall(),
+        and returns whether it got there
+
+        A string or block comment in the way that only scan_spanning can scan
+        stops the scan at the start of its line instead.
+        """
+        tokens = self.tokens
+        append = tokens.append
+        word_type = self.words.get
+        identifier_start = self.identifier_start
+        new = tuple.__new__
+        identifier = TokenType.IDENTIFIER
+        number = TokenType.NUMBER
+        string = TokenType.STRING
+        line = start_line = self.line
+        unexpected = []
+        # Newlines in block comments
+        uncounted = 0
+        # Tokens, errors and newlines up to the start of the current line
+        mark = len(tokens)
+        mark_line = line
+        mark_unexpected = 0
+        mark_uncounted = 0
+
+        for lexeme in self.source_pattern.findall(self.source, self.current,
+                                                  end):
+            type = word_type(lexeme)
+            if type is not None:
+                append(new(Token, (type, lexeme, None, line)))
+            elif lexeme == '\n':
+                line += 1
+                mark = len(tokens)
+                mark_line = line
+                mark_unexpected = len(unexpected)
+                mark_uncounted = uncounted
+            elif not lexeme:
+                # A comment
+                pass
+            elif lexeme[0] in identifier_start:
+                append(new(Token, (identifier, lexeme, None, line)))
+            elif lexeme[0] == '"':
+                if lexeme == '"':
+                    break
+                line += lexeme.count('\n')
+                append(new(Token, (string, lexeme, lexeme[1:-1], line)))
+            elif '0' <= lexeme[0] <= '9':
+                append(new(Token, (number, lexeme, float(lexeme), line)))
+            elif lexeme == '/*':
+                break
+            elif lexeme[0] == '/':
+                # Newlines inside block comments aren't counted, see
+                # Scanner.scan_token
+                uncounted += lexeme.count('\n')
+            else:
+                unexpected.append(line)
+        else:
+            for error_line in unexpected:
+                lox.error(error_line, 'Unexpected character.')
+            self.current, self.line = end, line
+            return True
+
+        del tokens[mark:]
+        for error_line in unexpected[:mark_unexpected]:
+            lox.error(error_line, 'Unexpected character.')
+        source = self.source
+        pos = self.current
+        for _ in range(mark_line - start_line + mark_uncounted):
+            pos = source.index('\n', pos) + 1
+        self.current, self.line = pos, mark_line
+        return False
+
+    def scan_spanning(self, pos: int, line: int,
+                      final: bool) -> Optional[Tuple[int, int]]:
+        """Scans from pos until the end of the line on which the scan lands
+        and returns the position and line number of the next line, or None
+        if source ran out before that and the scan isn't final"""
+        source = self.source
+        mark = len(self.tokens)
+        add = self.add_match
+        # Reported only once we know the scan won't be retried
+        errors = []
+        incomplete = False
+        restart = pos
+
+        while restart is not None:
+            start, restart = restart, None
+            for m in self.pattern.finditer(source, start):
+                kind = m.lastgroup
+                text = m.group()
+                if kind == 'space':
+                    if '\n' in text:
+                        pos = m.start() + text.index('\n') + 1
+                        line += 1
+                        break
+                elif kind == 'word':
+                    add(self.words.get(text, TokenType.IDENTIFIER), m, None,
+                        line)
+                elif kind == 'number':
+                    add(TokenType.NUMBER, m, float(text), line)
+                elif kind == 'string':
+                    line += text.count('\n')
+                    add(TokenType.STRING, m, text[1:-1], line)
+                elif kind == 'comment':
+                    pass
+                elif kind == 'block_comment':
+                    # Newlines inside block comments aren't counted, see
+                    # Scanner.scan_token
+                    restart = self.skip_block_comment(m.end())
+                    if restart is None:
+                        if not final:
+                            incomplete = True
+                            break
+                        errors.append((line, 'Unterminated block comment.'))
+                        restart = len(source)
+                    break
+                elif kind == 'slash':
+                    add(TokenType.SLASH, m, None, line)
+                elif kind == 'unterminated_string':
+                    if not final:
+                        incomplete = True
+                        break
+                    line += text.count('\n')
+                    errors.append((line, 'Unterminated string.'))
+                else:
+                    errors.append((line, 'Unexpected character.'))
+            else:
+                pos = len(source)
+                incomplete = not final
+
+        if incomplete:
+            del self.tokens[mark:]
+            return None
+        for e in errors:
+            lox.error(*e)
+        return pos, line
+
+    def add_match(self, type: TokenType, m: 're.Match', literal: Any,
+                  line: int) -> None:
+        self.tokens.append(Token(type, m.group(), literal, line))
+
+    def skip_block_comment(self, pos: int) -> Optional[int]:
+        """Returns the position right after the block comment whose opening
+        ends at pos, or None if the comment is unterminated"""
+        level = 1
+        for m in self.block_comment_pattern.finditer(self.source, pos):
+            level += 1 if m.group() == '/*' else -1
+            if not level:
+                return m.end()
+        return None
+
+
+class StreamScanner(RegexScanner):
+    """Scanner reading source lazily from a file object or an mmap.
+
+    Iterating over it yields tokens as they're scanned. Only about a chunk of
+    source and the tokens scanned from it are held in memory at a time, so
+    scanning huge files takes bounded memory as long as the consumer doesn't
+    keep the tokens around.
+    """
+
+    def __init__(self, file: Union[IO, 'mmap.mmap'],
+                 chunk_size: int = 1 << 16):
+        super().__init__('')
+        self.file = file
+        self.chunk_size = chunk_size
+        # Only needed for binary sources. Newlines are translated the same
+        # way as for files opened in text mode.
+        self.decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder('utf-8')(), True)
+
+    def __iter__(self) -> Iterator[Token]:
+        final = False
+        while not final:
+            chunk, final = self.read()
+            self.source = self.source[self.current:] + chunk
+            self.current = 0
+            end = len(self.source) if final else self.source.rfind('\n') + 1
+            with paused_gc():
+                self.scan_lines(end, final)
+            yield from self.tokens
+            self.tokens.clear()
+        yield Token(TokenType.EOF, '', None, self.line)
+
+    def scan_tokens(self) -> List[Token]:
+        return list(self)
+
+    def read(self) -> Tuple[str, bool]:
+        """Reads the next chunk of source, returns it and whether the end of
+        the file was reached"""
+        data = self.file.read(self.chunk_size)
+        if isinstance(data, bytes):
+            return self.decoder.decode(data, not data), not data
+        return data, not data
+
+
+class BufferScanner(RegexScanner):
+    """Scanner producing a TokenBuffer instead of a list of Token objects
+
+    The parser only materializes the tokens it keeps in the syntax tree, so
+    a buffer takes several times less memory than the token list for large
+    sources. The tree keeps many of them though, and building them on
+    demand is slower than building them all while scanning. Scanning and
+    parsing a large source both take about 2.5 times as long as with
+    RegexScanner and a token list, for a third less memory overall. So
+    this scanner is only used when asked for, with --scanner=buffer.
+    """
+
+    def __init__(self, source: str):
+        super().__init__(source)
+        self.tokens = TokenBuffer(source)
+
+    def scan_tokens(self) -> TokenBuffer:
+        source = self.source
+        pos, line = self.current, self.line
+        # Token positions are needed, so every line takes the match by match
+        # path of RegexScanner
+        while pos < len(source):
+            pos, line = self.scan_spanning(pos, line, True)
+        self.current, self.line = pos, line
+        self.tokens.append(TokenType.EOF, len(source), 0, line)
+        return self.tokens
+
+    def add_match(self, type: TokenType, m: 're.Match', literal: Any,
+                  line: int) -> None:
+        start, end = m.span()
+        self.tokens.append(type, start, end - start, line)
+
+
+@contextlib.contextmanager
+def paused_gc():
+    # Tokens are plain tuples of atoms, so they can never form reference
+    # cycles. Letting the cyclic collector walk the growing token list over
+    # and over again while scanning only costs time.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+scanners = {
+    'char': Scanner,
+    'regex': RegexScanner,
+    'buffer': BufferScanner,
+}
+
+
 __all__ = [
     'Scanner',
+    'RegexScanner',
+    'StreamScanner',
+    'BufferScanner',
+    'scanners',
 ]
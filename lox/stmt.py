@@ -1,89 +1,219 @@
 """AUTOGENERATED! DO NOT EDIT! Make changes to tool/generate_ast.py instead"""
 from abc import ABC, abstractmethod
-from typing import Any, Generic, List, Optional, TypeVar
-from collections import namedtuple
+from typing import Any, Generic, List, Optional, Tuple, TypeVar
 from lox.token import Token
 from lox.expr import Expr
 
 T = TypeVar('T')
 
 class Stmt:
+    __slots__ = ()
+    kind: int
     def accept(self, visitor: 'Visitor[T]') -> T: ...
-    def __hash__(self): return id(self)
 
-class Block(Stmt, namedtuple('Block', 'statements')):
-    statements: List[Stmt]
+class Block(Stmt):
+    __slots__ = ('statements', 'frame_size')
+    kind = 0
+
+    def __init__(self, statements: List[Stmt], frame_size: Optional[int] = None):
+        self.statements = statements
+        self.frame_size = frame_size
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_block_stmt(self)
 
-class Break(Stmt, namedtuple('Break', 'keyword')):
-    keyword: Token
+    def __repr__(self):
+        return f'Block(statements={self.statements!r}, frame_size={self.frame_size!r})'
+
+    def __reduce__(self):
+        return Block, (self.statements, self.frame_size)
+
+class Break(Stmt):
+    __slots__ = ('keyword',)
+    kind = 1
+
+    def __init__(self, keyword: Token):
+        self.keyword = keyword
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_break_stmt(self)
 
-class Class(Stmt, namedtuple('Class', 'name methods setters class_methods class_setters')):
-    name: Token
-    methods: List['Function']
-    setters: List['Function']
-    class_methods: List['Function']
-    class_setters: List['Function']
+    def __repr__(self):
+        return f'Break(keyword={self.keyword!r})'
+
+    def __reduce__(self):
+        return Break, (self.keyword,)
+
+class Class(Stmt):
+    __slots__ = ('name', 'methods', 'setters', 'class_methods', 'class_setters', 'slot', 'cell')
+    kind = 2
+
+    def __init__(self, name: Token, methods: List['Function'], setters: List['Function'], class_methods: List['Function'], class_setters: List['Function'], slot: Optional[int] = None, cell: bool = False):
+        self.name = name
+        self.methods = methods
+        self.setters = setters
+        self.class_methods = class_methods
+        self.class_setters = class_setters
+        self.slot = slot
+        self.cell = cell
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_class_stmt(self)
 
-class Expression(Stmt, namedtuple('Expression', 'expression')):
-    expression: Expr
+    def __repr__(self):
+        return f'Class(name={self.name!r}, methods={self.methods!r}, setters={self.setters!r}, class_methods={self.class_methods!r}, class_setters={self.class_setters!r}, slot={self.slot!r}, cell={self.cell!r})'
+
+    def __reduce__(self):
+        return Class, (self.name, self.methods, self.setters, self.class_methods, self.class_setters, self.slot, self.cell)
+
+class Expression(Stmt):
+    __slots__ = ('expression',)
+    kind = 3
+
+    def __init__(self, expression: Expr):
+        self.expression = expression
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_expression_stmt(self)
 
-class Function(Stmt, namedtuple('Function', 'name params body is_getter is_setter')):
-    name: Token
-    params: List[Token]
-    body: List[Stmt]
-    is_getter: bool
-    is_setter: bool
+    def __repr__(self):
+        return f'Expression(expression={self.expression!r})'
+
+    def __reduce__(self):
+        return Expression, (self.expression,)
+
+class For(Stmt):
+    __slots__ = ('initializer', 'condition', 'increment', 'body', 'frame_size')
+    kind = 4
+
+    def __init__(self, initializer: Optional[Stmt], condition: Optional[Expr], increment: Optional[Expr], body: Stmt, frame_size: Optional[int] = None):
+        self.initializer = initializer
+        self.condition = condition
+        self.increment = increment
+        self.body = body
+        self.frame_size = frame_size
+
+    def accept(self, visitor: 'Visitor[T]') -> T:
+        return visitor.visit_for_stmt(self)
+
+    def __repr__(self):
+        return f'For(initializer={self.initializer!r}, condition={self.condition!r}, increment={self.increment!r}, body={self.body!r}, frame_size={self.frame_size!r})'
+
+    def __reduce__(self):
+        return For, (self.initializer, self.condition, self.increment, self.body, self.frame_size)
+
+class Function(Stmt):
+    __slots__ = ('name', 'params', 'body', 'is_getter', 'is_setter', 'slot', 'captures', 'cell', 'cells', 'frame_size')
+    kind = 5
+
+    def __init__(self, name: Token, params: List[Token], body: List[Stmt], is_getter: bool, is_setter: bool, slot: Optional[int] = None, captures: Optional[List[Tuple[int, int]]] = None, cell: bool = False, cells: Optional[List[int]] = None, frame_size: Optional[int] = None):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.is_getter = is_getter
+        self.is_setter = is_setter
+        self.slot = slot
+        self.captures = captures
+        self.cell = cell
+        self.cells = cells
+        self.frame_size = frame_size
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_function_stmt(self)
 
-class If(Stmt, namedtuple('If', 'condition then_branch else_branch')):
-    condition: Expr
-    then_branch: Stmt
-    else_branch: Stmt
+    def __repr__(self):
+        return f'Function(name={self.name!r}, params={self.params!r}, body={self.body!r}, is_getter={self.is_getter!r}, is_setter={self.is_setter!r}, slot={self.slot!r}, captures={self.captures!r}, cell={self.cell!r}, cells={self.cells!r}, frame_size={self.frame_size!r})'
+
+    def __reduce__(self):
+        return Function, (self.name, self.params, self.body, self.is_getter, self.is_setter, self.slot, self.captures, self.cell, self.cells, self.frame_size)
+
+class If(Stmt):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+    kind = 6
+
+    def __init__(self, condition: Expr, then_branch: Stmt, else_branch: Stmt):
+        self.condition = condition
+        self.then_branch = then_branch
+        self.else_branch = else_branch
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_if_stmt(self)
 
-class Print(Stmt, namedtuple('Print', 'expression')):
-    expression: Expr
+    def __repr__(self):
+        return f'If(condition={self.condition!r}, then_branch={self.then_branch!r}, else_branch={self.else_branch!r})'
+
+    def __reduce__(self):
+        return If, (self.condition, self.then_branch, self.else_branch)
+
+class Print(Stmt):
+    __slots__ = ('expression',)
+    kind = 7
+
+    def __init__(self, expression: Expr):
+        self.expression = expression
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_print_stmt(self)
 
-class Return(Stmt, namedtuple('Return', 'keyword value')):
-    keyword: Token
-    value: Expr
+    def __repr__(self):
+        return f'Print(expression={self.expression!r})'
+
+    def __reduce__(self):
+        return Print, (self.expression,)
+
+class Return(Stmt):
+    __slots__ = ('keyword', 'value')
+    kind = 8
+
+    def __init__(self, keyword: Token, value: Expr):
+        self.keyword = keyword
+        self.value = value
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_return_stmt(self)
 
-class Var(Stmt, namedtuple('Var', 'name initializer')):
-    name: Token
-    initializer: Optional[Expr]
+    def __repr__(self):
+        return f'Return(keyword={self.keyword!r}, value={self.value!r})'
+
+    def __reduce__(self):
+        return Return, (self.keyword, self.value)
+
+class Var(Stmt):
+    __slots__ = ('name', 'initializer', 'slot', 'cell')
+    kind = 9
+
+    def __init__(self, name: Token, initializer: Optional[Expr], slot: Optional[int] = None, cell: bool = False):
+        self.name = name
+        self.initializer = initializer
+        self.slot = slot
+        self.cell = cell
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_var_stmt(self)
 
-class While(Stmt, namedtuple('While', 'condition body')):
-    condition: Expr
-    body: Stmt
+    def __repr__(self):
+        return f'Var(name={self.name!r}, initializer={self.initializer!r}, slot={self.slot!r}, cell={self.cell!r})'
+
+    def __reduce__(self):
+        return Var, (self.name, self.initializer, self.slot, self.cell)
+
+class While(Stmt):
+    __slots__ = ('condition', 'body')
+    kind = 10
+
+    def __init__(self, condition: Expr, body: Stmt):
+        self.condition = condition
+        self.body = body
 
     def accept(self, visitor: 'Visitor[T]') -> T:
         return visitor.visit_while_stmt(self)
 
+    def __repr__(self):
+        return f'While(condition={self.condition!r}, body={self.body!r})'
+
+    def __reduce__(self):
+        return While, (self.condition, self.body)
+
 R = TypeVar('R')
 
 class Visitor(Generic[R], ABC):
@@ -96,6 +226,8 @@ class Visitor(Generic[R], ABC):
     @abstractmethod
     def visit_expression_stmt(self, s: Expression) -> R: ...
     @abstractmethod
+    def visit_for_stmt(self, s: For) -> R: ...
+    @abstractmethod
     def visit_function_stmt(self, s: Function) -> R: ...
     @abstractmethod
     def visit_if_stmt(self, s: If) -> R: ...
@@ -1,4 +1,7 @@
 import enum
+import sys
+from array import array
+from collections.abc import Sequence
 from typing import Optional, NamedTuple
 
 
@@ -51,6 +54,10 @@ class TokenType(enum.Enum):
 
     EOF                 = 0
 
+    # Members are singletons, so identity hashing is enough, and it's done
+    # in C instead of Enum's hashing of the member name
+    __hash__ = object.__hash__
+
 
 # HACK: setting eq to True breaks this program:
 #     for ( var i = 0; i < 10; i = i + 1 ) {
@@ -81,7 +88,80 @@ class Token(NamedTuple):
         return f'{self.type} {self.lexeme} {self.literal}'
 
 
+class TokenList(list):
+    """List of tokens, as produced by the scanners"""
+
+    def type_at(self, index: int) -> TokenType:
+        return self[index].type
+
+
+class TokenBuffer(Sequence):
+    """Columnar store for the tokens of one source string
+
+    Instead of a Token object per token, only the type, start offset, length
+    and line of each are kept, in parallel arrays. Token objects are built on
+    indexing, with the lexeme sliced out of the source. Lexemes other than
+    strings and numbers are interned, so all occurrences of a name share one
+    string. Use type_at to look at a token's type without materializing it.
+    """
+    # Indexed by TokenType value, a list lookup is cheaper than TokenType()
+    types_by_value = [None] * (max(i.value for i in TokenType) + 1)
+    for i in TokenType:
+        types_by_value[i.value] = i
+    del i
+
+    def __init__(self, source: str):
+        self.source = source
+        self.types = array('B')
+        self.starts = array('I')
+        self.lengths = array('I')
+        self.lines = array('I')
+        # Line of the token last built, see __getitem__
+        self.line = 0
+
+    def append(self, type: TokenType, start: int, length: int,
+               line: int) -> None:
+        self.types.append(type.value)
+        self.starts.append(start)
+        self.lengths.append(length)
+        self.lines.append(line)
+
+    def type_at(self, index: int) -> TokenType:
+        return self.types_by_value[self.types[index]]
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __getitem__(self, index: int) -> Token:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        type = self.types_by_value[self.types[index]]
+        start = self.starts[index]
+        lexeme = self.source[start:start + self.lengths[index]]
+        literal = None
+        if type is TokenType.NUMBER:
+            literal = float(lexeme)
+        elif type is TokenType.STRING:
+            literal = lexeme[1:-1]
+        else:
+            lexeme = sys.intern(lexeme)
+        # Tokens are mostly built in order, so this shares one int object
+        # between the tokens of a line, like a list of tokens does
+        line = self.lines[index]
+        if line == self.line:
+            line = self.line
+        else:
+            self.line = line
+        return tuple.__new__(Token, (type, lexeme, literal, line))
+
+    def __delitem__(self, index: slice) -> None:
+        for column in self.types, self.starts, self.lengths, self.lines:
+            del column[index]
+
+
 __all__ = [
     'TokenType',
     'Token',
+    'TokenList',
+    'TokenBuffer',
 ]
@@ -0,0 +1,734 @@
+"""Python transpiling backend
+
+Translates resolved programs into Python source, which CPython compiles
+into its own bytecode and runs. Every Lox function becomes a Python
+function of the frame of its captured variables followed by its
+parameters, and its locals become Python locals named by slot, 'v0', 'v1'
+and so on. Functions are defined once at the top of the module, and made
+into PythonFunction objects where they're declared, capturing the same way
+lox.Interpreter does, so classes and instances are lox.LoxClass and
+lox.LoxInstance like with the other backends.
+
+Python expressions can't run statements, so expressions needing any, like
+the type checks of operators whose operand types aren't known, or 'and'
+and 'or', which are short-circuiting on Lox truthiness, have those emitted
+before the statement using them, storing values in temporaries 't0', 't1'
+and so on. Operands are stored in temporaries first when statements
+emitted for a later operand would otherwise run before they're evaluated.
+Runtime errors are raised with the tokens of the nodes they come from, so
+they're reported on the same lines as by the other backends.
+
+Programs too deeply nested for CPython to compile run with lox.Interpreter.
+"""
+from functools import partial
+from typing import Dict, List, Optional, Sequence, Union
+
+import lox
+import lox.expr as expr
+import lox.stmt as stmt
+from lox.token import TokenType as TT
+
+# Python operators of the Lox binary operators translated into them
+operators: Dict[TT, str] = {
+    TT.PLUS: '+',
+    TT.MINUS: '-',
+    TT.STAR: '*',
+    TT.SLASH: '/',
+    TT.GREATER: '>',
+    TT.GREATER_EQUAL: '>=',
+    TT.LESS: '<',
+    TT.LESS_EQUAL: '<=',
+    TT.EQUAL_EQUAL: '==',
+    TT.BANG_EQUAL: '!=',
+}
+
+# Operators that evaluate to booleans, or fail
+comparisons = {TT.GREATER, TT.GREATER_EQUAL, TT.LESS, TT.LESS_EQUAL,
+               TT.EQUAL_EQUAL, TT.BANG_EQUAL}
+
+
+def literal(value: object) -> str:
+    """Python expression evaluating to value"""
+    if type(value) is float:
+        if value != value:
+            return 'nan'
+        if value in (float('inf'), float('-inf')):
+            return 'inf' if value > 0 else '(-inf)'
+        if value < 0 or str(value).startswith('-'):
+            return f'({value!r})'
+    return repr(value)
+
+
+def is_boolean(e: expr.Expr) -> bool:
+    """Whether e always evaluates to True or False"""
+    while type(e) is expr.Grouping:
+        e = e.expression
+    if type(e) is expr.Binary:
+        return e.operator.type in comparisons
+    if type(e) is expr.Unary:
+        return e.operator.type is TT.BANG
+    return type(e) is expr.Literal and type(e.value) is bool
+
+
+def literal_value(e: expr.Expr) -> Optional[expr.Literal]:
+    """The literal e is, if it is one"""
+    while type(e) is expr.Grouping:
+        e = e.expression
+    return e if type(e) is expr.Literal else None
+
+
+def is_number(e: expr.Expr) -> bool:
+    e = literal_value(e)
+    return e is not None and type(e.value) is float
+
+
+class Body:
+    """Source of the Python function being transpiled"""
+    __slots__ = ('lines', 'indent', 'temps', 'is_init')
+
+    def __init__(self, is_init: bool = False):
+        self.lines: List[str] = []
+        self.indent = 0
+        self.temps = 0
+        self.is_init = is_init
+
+
+class Transpiler(expr.Visitor[str], stmt.Visitor[None]):
+    """Translates code to run in interpreter into Python source
+
+    Expressions are translated into Python expressions, and statements
+    are emitted into the function being transpiled.
+    """
+
+    def __init__(self, interpreter: 'PythonInterpreter'):
+        self.interpreter = interpreter
+        # Tokens of the errors raised and declarations of the functions
+        # made by the code, read from the lists 'k' and 'd' by index
+        self.tokens: List['lox.Token'] = []
+        self.declarations: List[stmt.Function] = []
+        self.indices: Dict[int, int] = {}
+        # Names of the Python functions of global functions, by slot,
+        # called directly where calls are checked (see lox.Resolver)
+        self.known: Dict[int, str] = {}
+        # Python functions of the module being transpiled, and the names of
+        # all transpiled so far
+        self.functions: List[str] = []
+        self.names: Dict[stmt.Function, str] = {}
+        # Values the code emitted can't change, literals and temporaries
+        self.stable = set()
+        self.body = Body()
+
+    def transpile(self, statements: List[stmt.Stmt]) -> str:
+        """Module defining 'main', a function of None running
+        statements"""
+        for s in statements:
+            if type(s) is stmt.Function and s.slot is None \
+                    and type(s.body) is list:
+                self.known[self.global_slot(s.name)] = self.name(s)
+        return self.module('main', statements)
+
+    def transpile_expression(self, expression: expr.Expr) -> str:
+        """Module defining 'main', a function of None returning the value
+        of expression"""
+        return self.module('main', [stmt.Return(None, expression)])
+
+    def transpile_function(self, declaration: stmt.Function,
+                           is_init: bool) -> str:
+        """Module defining the function of declaration, see name"""
+        self.functions = []
+        self.function_body(declaration, is_init)
+        return '\n\n'.join(self.functions) + '\n'
+
+    def module(self, name: str, statements: List[stmt.Stmt]) -> str:
+        self.functions = []
+        self.body = Body()
+        self.emit(f'def {name}(c):')
+        self.suite(statements)
+        return '\n\n'.join(self.functions + ['\n'.join(self.body.lines)]) \
+            + '\n'
+
+    def name(self, declaration: stmt.Function) -> str:
+        """Name of the Python function of declaration"""
+        name = self.names.get(declaration)
+        if name is None:
+            name = self.names[declaration] = \
+                f'{declaration.name.lexeme}_{len(self.names)}'
+        return name
+
+    def emit(self, line: str) -> None:
+        self.body.lines.append('    ' * self.body.indent + line)
+
+    def suite(self, statements: Sequence[stmt.Stmt]) -> None:
+        """Emits statements indented, or 'pass' if that emits nothing"""
+        body = self.body
+        body.indent += 1
+        mark = len(body.lines)
+        for s in statements:
+            s.accept(self)
+        if len(body.lines) == mark:
+            self.emit('pass')
+        body.indent -= 1
+
+    def temp(self, value: Optional[str] = None) -> str:
+        """A new temporary, storing value if given"""
+        name = f't{self.body.temps}'
+        self.body.temps += 1
+        self.stable.add(name)
+        if value is not None:
+            self.emit(f'{name} = {value}')
+        return name
+
+    def atom(self, value: str) -> str:
+        """value, stored in a temporary if evaluating it more than once
+        could do more than evaluating it once"""
+        if value in self.stable or value.isidentifier():
+            return value
+        return self.temp(value)
+
+    def fix(self, value: str) -> str:
+        """value, stored in a temporary if code emitted later could change
+        it"""
+        if value in self.stable:
+            return value
+        return self.temp(value)
+
+    def token(self, token: 'lox.Token') -> str:
+        return f'k[{self.index(token, self.tokens)}]'
+
+    def declaration(self, declaration: stmt.Function) -> str:
+        return f'd[{self.index(declaration, self.declarations)}]'
+
+    def index(self, value: object, values: list) -> int:
+        index = self.indices.get(id(value))
+        if index is None or index >= len(values) \
+                or values[index] is not value:
+            index = self.indices[id(value)] = len(values)
+            values.append(value)
+        return index
+
+    def global_slot(self, name: 'lox.Token') -> int:
+        globals = self.interpreter.globals
+        slot = globals.table.slot(name.lexeme)
+        globals.grow()
+        return slot
+
+    def expression(self, e: expr.Expr) -> str:
+        return e.accept(self)
+
+    def operands(self, expressions: Sequence[expr.Expr],
+                 values: Sequence[str] = ()) -> List[str]:
+        """Python expressions evaluating expressions in order, after
+        values"""
+        body = self.body
+        values = list(values)
+        for e in expressions:
+            mark = len(body.lines)
+            value = e.accept(self)
+            if len(body.lines) != mark:
+                # What was just emitted runs before the earlier values
+                # would be evaluated, so they are first
+                lines = body.lines[mark:]
+                del body.lines[mark:]
+                values = [self.fix(i) for i in values]
+                body.lines += lines
+            values.append(value)
+        return values
+
+    def condition(self, e: expr.Expr) -> str:
+        """Python expression of whether e is truthy"""
+        constant = literal_value(e)
+        if constant is not None:
+            return repr(self.interpreter.is_truthy(constant.value))
+        if is_boolean(e):
+            return self.expression(e)
+        return self.truthy(self.atom(self.expression(e)))
+
+    def truthy(self, value: str, negate: bool = False) -> str:
+        """Python expression of whether the atom value is truthy, or falsey
+        if negate"""
+        if not value.isidentifier():
+            # Atoms other than names are number and string literals, which
+            # are truthy, and which Python warns about comparing with 'is'
+            return repr(not negate)
+        if negate:
+            return f'{value} is None or {value} is False'
+        return f'{value} is not None and {value} is not False'
+
+    def local(self, depth: int, slot: int, cell: bool) -> str:
+        if depth == 0:
+            value = f'v{slot}'
+        elif depth == 1:
+            value = f'c.values[{slot}]'
+        elif depth == 2:
+            value = f'c.enclosing.values[{slot}]'
+        else:
+            value = f'c.ancestor({depth - 1}).values[{slot}]'
+        return value + '.value' if cell else value
+
+    def define(self, s: Union[stmt.Var, stmt.Function, stmt.Class],
+               value: str) -> None:
+        """Emits defining the variable s declares"""
+        if s.slot is None:
+            self.emit(f'g[{self.global_slot(s.name)}] = {value}')
+        else:
+            self.emit(f'v{s.slot} = {value}')
+
+    def function(self, declaration: stmt.Function,
+                 is_init: bool = False) -> str:
+        """Python expression making a function where it's declared
+
+        The body of a function parsed lazily is transpiled on its first
+        call, see PythonFunction.
+        """
+        code = 'None'
+        if type(declaration.body) is list:
+            code = self.function_body(declaration, is_init)
+        captures = declaration.captures
+        closure = 'None'
+        if captures:
+            values = ', '.join(self.local(depth, slot, False)
+                               for depth, slot in captures)
+            closure = f'Frame(None, [{values}])'
+        return (f'Function({self.declaration(declaration)}, {closure}, '
+                f'{is_init}, {code})')
+
+    def function_body(self, declaration: stmt.Function,
+                      is_init: bool) -> str:
+        """Transpiles the Python function of declaration, returns its
+        name"""
+        name = self.name(declaration)
+        body, self.body = self.body, Body(is_init)
+        parameters = ''.join(f', v{i}' for i in range(len(declaration.params)))
+        self.emit(f'def {name}(c{parameters}):')
+        self.body.indent += 1
+        for slot in declaration.cells or ():
+            if slot < len(declaration.params):
+                self.emit(f'v{slot} = Cell(v{slot})')
+        self.body.indent -= 1
+        self.suite(declaration.body)
+        if is_init:
+            self.body.indent += 1
+            self.emit('return c.values[0]')
+        self.functions.append('\n'.join(self.body.lines))
+        self.body = body
+        return name
+
+    def visit_block_stmt(self, s: stmt.Block) -> None:
+        # Locals of blocks are locals of the Python function
+        for statement in s.statements:
+            statement.accept(self)
+
+    def visit_break_stmt(self, s: stmt.Break) -> None:
+        self.emit('break')
+
+    def visit_class_stmt(self, s: stmt.Class) -> None:
+        if s.cell:
+            # Captured by its own methods
+            self.define(s, 'Cell()')
+
+        def functions(declarations: List[stmt.Function], methods=False):
+            items = ', '.join(
+                f'{i.name.lexeme!r}: ' + self.function(
+                    i, methods and i.name.lexeme == 'init')
+                for i in declarations)
+            return f'{{{items}}}'
+        methods = functions(s.methods, True)
+        class_methods = functions(s.class_methods)
+        setters = functions(s.setters)
+        class_setters = functions(s.class_setters)
+
+        name = s.name.lexeme
+        meta = self.temp(f"LoxClass(None, '{name} metaclass', "
+                         f"{class_methods}, {class_setters})")
+        class_ = f"LoxClass({meta}, '{name}', {methods}, {setters})"
+        if s.cell:
+            self.emit(f'v{s.slot}.value = {class_}')
+        else:
+            self.define(s, class_)
+
+    def visit_expression_stmt(self, s: stmt.Expression) -> None:
+        value = self.expression(s.expression)
+        if value not in self.stable and not value.isidentifier():
+            self.emit(value)
+
+    def visit_for_stmt(self, s: stmt.For) -> None:
+        # Locals of the loop are locals of the Python function
+        if s.initializer is not None:
+            s.initializer.accept(self)
+        body = [s.body]
+        if s.increment is not None:
+            body.append(stmt.Expression(s.increment))
+        self.loop(s.condition, body)
+
+    def loop(self, condition: Optional[expr.Expr],
+             body: List[stmt.Stmt]) -> None:
+        """Emits a while loop, testing condition at the start of the body
+        if it needs statements"""
+        lines = self.body.lines
+        header = len(lines)
+        self.emit('while True:')
+        self.body.indent += 1
+        mark = len(lines)
+        if condition is not None:
+            value = self.condition(condition)
+            if len(lines) == mark:
+                lines[header] = lines[header].replace('True', value, 1)
+            else:
+                self.emit(f'if not ({value}):')
+                self.emit('    break')
+        for s in body:
+            s.accept(self)
+        if len(lines) == mark:
+            self.emit('pass')
+        self.body.indent -= 1
+
+    def visit_function_stmt(self, s: stmt.Function) -> None:
+        function = self.function(s)
+        if s.cell:
+            # Captured by itself
+            self.define(s, 'Cell()')
+            self.emit(f'v{s.slot}.value = {function}')
+        else:
+            self.define(s, function)
+
+    def visit_if_stmt(self, s: stmt.If) -> None:
+        self.emit(f'if {self.condition(s.condition)}:')
+        self.suite([s.then_branch])
+        if s.else_branch is not None:
+            self.emit('else:')
+            self.suite([s.else_branch])
+
+    def visit_print_stmt(self, s: stmt.Print) -> None:
+        self.emit(f'print(stringify({self.expression(s.expression)}))')
+
+    def visit_return_stmt(self, s: stmt.Return) -> None:
+        if self.body.is_init:
+            self.emit('return c.values[0]')
+        elif s.value is None:
+            self.emit('return None')
+        else:
+            self.emit(f'return {self.expression(s.value)}')
+
+    def visit_var_stmt(self, s: stmt.Var) -> None:
+        value = 'None'
+        if s.initializer is not None:
+            value = self.expression(s.initializer)
+        self.define(s, f'Cell({value})' if s.cell else value)
+
+    def visit_while_stmt(self, s: stmt.While) -> None:
+        self.loop(s.condition, [s.body])
+
+    def visit_assign_expr(self, e: expr.Assign) -> str:
+        value = self.expression(e.value)
+        if e.depth is None:
+            value = self.atom(value)
+            self.emit(f'if g[{e.slot}] is U: '
+                      f'raise undefined({self.token(e.name)})')
+            self.emit(f'g[{e.slot}] = {value}')
+        else:
+            self.emit(f'{self.local(e.depth, e.slot, e.cell)} = {value}')
+        self.stable.add('None')
+        return 'None'
+
+    def visit_binary_expr(self, e: expr.Binary) -> str:
+        o = e.operator.type
+        if o is TT.COMMA:
+            self.visit_expression_stmt(stmt.Expression(e.left))
+            return self.expression(e.right)
+        a, b = self.operands([e.left, e.right])
+        if o is TT.EQUAL_EQUAL or o is TT.BANG_EQUAL:
+            return f'({a} {operators[o]} {b})'
+        typed = self.is_typed(e)
+        if o is TT.SLASH or not typed:
+            a = self.atom(a)
+            b = self.atom(b)
+        if o is TT.SLASH:
+            value = f'({a} / {b} if {b} else nan)'
+        else:
+            value = f'({a} {operators[o]} {b})'
+        if typed:
+            return value
+
+        checks = ' and '.join(f'type({value}) is float'
+                              for value, operand in ((a, e.left),
+                                                     (b, e.right))
+                              if not is_number(operand))
+        token = self.token(e.operator)
+        if o is TT.PLUS:
+            return f'({value} if {checks} else add({token}, {a}, {b}))'
+        if not checks:
+            return value
+        return (f"({value} if {checks} else "
+                f"fail({token}, 'Operands must be numbers'))")
+
+    def is_typed(self, e: Union[expr.Binary, expr.Unary]) -> bool:
+        """Whether the operands of e are known to be numbers, or strings
+        for '+'"""
+        return e.typed
+
+    def visit_call_expr(self, e: expr.Call) -> str:
+        if e.checked:
+            # A global function or class taking these many arguments
+            slot = e.callee.slot
+            self.emit(f'if g[{slot}] is U: '
+                      f'raise undefined({self.token(e.callee.name)})')
+            arguments = self.operands(e.arguments)
+            function = self.known.get(slot)
+            if function is not None:
+                return f"{function}({', '.join(['None'] + arguments)})"
+            return f"g[{slot}].call(interpreter, [{', '.join(arguments)}])"
+        values = self.operands([e.callee] + e.arguments)
+        return f"call({', '.join([self.token(e.paren)] + values)})"
+
+    def visit_conditional_expr(self, e: expr.Conditional) -> str:
+        self.emit(f'if {self.condition(e.condition)}:')
+        value = self.temp()
+        self.body.indent += 1
+        self.emit(f'{value} = {self.expression(e.then_branch)}')
+        self.body.indent -= 1
+        self.emit('else:')
+        self.body.indent += 1
+        self.emit(f'{value} = {self.expression(e.else_branch)}')
+        self.body.indent -= 1
+        return value
+
+    def visit_get_expr(self, e: expr.Get) -> str:
+        instance = self.atom(self.expression(e.object))
+        name = repr(e.name.lexeme)
+        return (f'({instance}.fields[{name}] '
+                f'if type({instance}) is LoxInstance '
+                f'and {name} in {instance}.fields '
+                f'else get({self.token(e.name)}, {instance}))')
+
+    def visit_grouping_expr(self, e: expr.Grouping) -> str:
+        return self.expression(e.expression)
+
+    def visit_inline_expr(self, e: expr.Inline) -> str:
+        self.emit(f'if g[{e.callee.slot}] is U: '
+                  f'raise undefined({self.token(e.callee.name)})')
+        arguments = self.operands(e.arguments)
+        if arguments:
+            # Stored once all are evaluated, since they may be inlined
+            # calls storing theirs in the same slots
+            slots = ', '.join(f'v{e.slot + i}' for i in range(len(arguments)))
+            self.emit(f"{slots} = {', '.join(arguments)}")
+        return self.expression(e.body)
+
+    def visit_literal_expr(self, e: expr.Literal) -> str:
+        value = literal(e.value)
+        self.stable.add(value)
+        return value
+
+    def visit_logical_expr(self, e: expr.Logical) -> str:
+        value = self.temp(self.expression(e.left))
+        if e.operator.type is TT.OR:
+            if is_boolean(e.left):
+                self.emit(f'if not {value}:')
+            else:
+                self.emit(f'if {self.truthy(value, True)}:')
+        elif is_boolean(e.left):
+            self.emit(f'if {value}:')
+        else:
+            self.emit(f'if {self.truthy(value)}:')
+        self.body.indent += 1
+        self.emit(f'{value} = {self.expression(e.right)}')
+        self.body.indent -= 1
+        return value
+
+    def visit_set_expr(self, e: expr.Set) -> str:
+        instance = self.fix(self.expression(e.object))
+        self.emit(f'if not isinstance({instance}, LoxInstance): '
+                  f'fail({self.token(e.name)}, '
+                  f"'Can only set properties on instances.')")
+        value = self.fix(self.expression(e.value))
+        self.emit(f'{instance}.set({self.token(e.name)}, {value}, '
+                  f'interpreter)')
+        return value
+
+    def visit_this_expr(self, e: expr.This) -> str:
+        return self.local(e.depth, e.slot, False)
+
+    def visit_unary_expr(self, e: expr.Unary) -> str:
+        value = self.expression(e.right)
+        if self.is_typed(e):
+            return f'(-{value})'
+        if e.operator.type is TT.BANG:
+            constant = literal_value(e.right)
+            if constant is not None:
+                return repr(not self.interpreter.is_truthy(constant.value))
+            if is_boolean(e.right):
+                return f'(not {value})'
+            return f'({self.truthy(self.atom(value), True)})'
+        value = self.atom(value)
+        return (f'(-{value} if type({value}) is float else '
+                f'fail({self.token(e.operator)}, '
+                f'"Operand must be a number."))')
+
+    def visit_variable_expr(self, e: expr.Variable) -> str:
+        if e.depth is None:
+            value = self.temp(f'g[{e.slot}]')
+            self.emit(f'if {value} is U: '
+                      f'raise undefined({self.token(e.name)})')
+            return value
+        return self.local(e.depth, e.slot, e.cell)
+
+
+def add(token: 'lox.Token', a: object, b: object) -> object:
+    """a + b, for operands that aren't both numbers"""
+    _ = isinstance
+    if _(a, str) and _(b, float) or _(a, float) and _(b, str):
+        return str(a) + str(b)
+    try:
+        return a + b
+    except TypeError:
+        raise lox.LoxRuntimeError(
+            token, 'Operands must be two numbers or two strings')
+
+
+def fail(token: 'lox.Token', message: str):
+    raise lox.LoxRuntimeError(token, message)
+
+
+class PythonFunction(lox.LoxFunction):
+    """A function transpiled into the Python function code, see Transpiler
+
+    The body of a function parsed lazily is transpiled on its first call,
+    or run by lox.Interpreter if CPython can't compile it.
+    """
+
+    def __init__(self, declaration: stmt.Function,
+                 closure: Optional['lox.Frame'],
+                 is_init: bool,
+                 code=None):
+        super().__init__(declaration, closure, is_init)
+        self.code = code
+
+    def call(self, interpreter: 'lox.Interpreter', arguments: list) -> object:
+        code = self.code
+        if code is None:
+            code = self.code = interpreter.compile_function(self)
+            if code is None:
+                return super().call(interpreter, arguments)
+        return code(self.closure, *arguments)
+
+    def bind(self, instance):
+        environment = lox.Frame(self.closure, [instance])
+        return PythonFunction(self.declaration, environment, self.is_init,
+                              self.code)
+
+
+def call(interpreter: 'lox.Interpreter', paren: 'lox.Token', callee: object,
+         *arguments) -> object:
+    """Calls callee the way a call expression does"""
+    if type(callee) is PythonFunction:
+        if len(arguments) == len(callee.declaration.params):
+            code = callee.code
+            if code is not None:
+                return code(callee.closure, *arguments)
+            return callee.call(interpreter, list(arguments))
+    elif not isinstance(callee, lox.LoxCallable):
+        raise lox.LoxRuntimeError(
+            paren, 'Can only call functions and classes.')
+    if len(arguments) != callee.arity():
+        raise lox.LoxRuntimeError(
+            paren,
+            f'Expected {callee.arity()} '
+            f'arguments but got {len(arguments)}.')
+    return callee.call(interpreter, list(arguments))
+
+
+def get(interpreter: 'lox.Interpreter', name: 'lox.Token',
+        instance: object) -> object:
+    """Gets a property the way a get expression does"""
+    if isinstance(instance, lox.LoxInstance):
+        return instance.get(name, interpreter)
+    raise lox.LoxRuntimeError(
+        name, 'Can only access properties on instances and classes.')
+
+
+def namespace(interpreter: 'lox.Interpreter',
+              transpiler: Transpiler) -> Dict[str, object]:
+    """Globals of the Python code transpiler emits to run in interpreter"""
+    return {
+        'g': interpreter.globals.values,
+        'k': transpiler.tokens,
+        'd': transpiler.declarations,
+        'U': lox.UNDEFINED,
+        'Cell': lox.Cell,
+        'Frame': lox.Frame,
+        'Function': PythonFunction,
+        'LoxClass': lox.LoxClass,
+        'LoxInstance': lox.LoxInstance,
+        'nan': float('nan'),
+        'inf': float('inf'),
+        'interpreter': interpreter,
+        'stringify': interpreter.stringify,
+        'undefined': interpreter.globals.undefined,
+        'add': add,
+        'fail': fail,
+        'call': partial(call, interpreter),
+        'get': partial(get, interpreter),
+    }
+
+
+class PythonInterpreter(lox.Interpreter):
+    """Interpreter running code transpiled by Transpiler"""
+
+    def __init__(self, table: Optional['lox.GlobalTable'] = None):
+        super().__init__(table)
+        self.transpiler = Transpiler(self)
+        # Python functions of the functions parsed lazily, or None for the
+        # ones CPython couldn't compile
+        self.codes: Dict[stmt.Function, Optional[object]] = {}
+        self.namespace = namespace(self, self.transpiler)
+
+    def load(self, source: str, name: str = 'main'):
+        """The Python function name defined by source"""
+        exec(compile(source, '<lox>', 'exec'), self.namespace)
+        return self.namespace[name]
+
+    def interpret(self, statements: List[stmt.Stmt]) -> None:
+        self.globals.grow()
+        try:
+            main = self.load(self.transpiler.transpile(statements))
+        except (SyntaxError, RecursionError, MemoryError):
+            # Nested too deeply
+            self.transpiler.known.clear()
+            super().interpret(statements)
+            return
+        try:
+            main(None)
+        except lox.LoxRuntimeError as e:
+            lox.lox.runtime_error(e)
+
+    def interpret_expression(self, expression: expr.Expr) -> Optional[str]:
+        self.globals.grow()
+        try:
+            main = self.load(
+                self.transpiler.transpile_expression(expression))
+        except (SyntaxError, RecursionError, MemoryError):
+            return super().interpret_expression(expression)
+        try:
+            return self.stringify(main(None))
+        except lox.LoxRuntimeError as e:
+            lox.lox.runtime_error(e)
+            return None
+
+    def compile_function(self, function: PythonFunction) -> Optional[object]:
+        """Python function of a function parsed lazily"""
+        declaration = function.declaration
+        if declaration in self.codes:
+            return self.codes[declaration]
+        if isinstance(declaration.body, lox.LazyBody):
+            function.parse_body(self, declaration.body)
+        try:
+            source = self.transpiler.transpile_function(declaration,
+                                                        function.is_init)
+            code = self.load(source, self.transpiler.name(declaration))
+        except (SyntaxError, RecursionError, MemoryError):
+            code = None
+        self.codes[declaration] = code
+        return code
+
+
+__all__ = ['Transpiler', 'PythonFunction', 'PythonInterpreter']
@@ -0,0 +1,453 @@
+"""Virtual machine running bytecode
+
+Runs the Code objects lox.BytecodeCompiler makes, with the same output and
+runtime errors as lox.Interpreter. The lines runtime errors are reported
+at come from the line tables of the code objects.
+"""
+from typing import List, Optional
+
+import lox
+import lox.stmt as stmt
+from lox.bytecode import Code, Op
+from lox.token import TokenType as TT
+
+# Calls a program can be nested in, past which the VM fails like the other
+# interpreters fail when Python runs out of stack
+MAX_CALLS = 10000
+
+NAN = float('nan')
+
+# The opcodes as ints, which are much faster to compare than Op members
+(CONSTANT, NIL, POP, GET_LOCAL, SET_LOCAL, GET_CELL, SET_CELL, NEW_CELL,
+ MAKE_CELL, GET_ENCLOSING, SET_ENCLOSING, GET_ENCLOSING_CELL,
+ SET_ENCLOSING_CELL, GET_GLOBAL, SET_GLOBAL, DEFINE_GLOBAL, CHECK_GLOBAL,
+ GET_PROPERTY, CHECK_INSTANCE, SET_PROPERTY, ADD, SUBTRACT, MULTIPLY, DIVIDE,
+ GREATER, GREATER_EQUAL, LESS, LESS_EQUAL, EQUAL, NOT_EQUAL, NOT, NEGATE,
+ ADD_TYPED, SUBTRACT_TYPED, MULTIPLY_TYPED, DIVIDE_TYPED, GREATER_TYPED,
+ GREATER_EQUAL_TYPED, LESS_TYPED, LESS_EQUAL_TYPED, NEGATE_TYPED, JUMP,
+ JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP, CALL, CALL_CHECKED,
+ STORE_ARGUMENTS, CLOSURE, CLASS, PRINT, RETURN) = (op.value for op in Op)
+
+
+class VMFunction(lox.LoxCallable):
+    """A function compiled to a Code object
+
+    Works like lox.LoxFunction: methods are bound by enclosing the frame of
+    what they capture in a frame with the instance.
+    """
+
+    def __init__(self, code: Code, closure: Optional['lox.Frame']):
+        self.code = code
+        self.closure = closure
+
+    def __str__(self):
+        return f'<fun {self.code.name}>'
+
+    @property
+    def is_init(self):
+        return self.code.is_init
+
+    @property
+    def is_getter(self):
+        return self.code.is_getter
+
+    def call(self, interpreter: 'VM', arguments: list) -> object:
+        return interpreter.call_function(self, arguments)
+
+    def arity(self) -> int:
+        return self.code.arity
+
+    def bind(self, instance):
+        return VMFunction(self.code, lox.Frame(self.closure, [instance]))
+
+
+class VM(lox.Interpreter):
+    """Interpreter compiling statements to bytecode and running it"""
+
+    def __init__(self, table: Optional['lox.GlobalTable'] = None):
+        super().__init__(table)
+        self.compiler = lox.BytecodeCompiler(self.globals.table)
+
+    def interpret(self, statements: List[stmt.Stmt]) -> None:
+        self.run(self.compiler.compile(statements))
+
+    def interpret_expression(self, expression: 'lox.expr.Expr'
+                             ) -> Optional[str]:
+        self.globals.grow()
+        code = self.compiler.compile_expression(expression)
+        try:
+            return self.stringify(self.execute(code, self.top_frame, None))
+        except lox.LoxRuntimeError as e:
+            lox.lox.runtime_error(e)
+            return None
+
+    def run(self, code: Code) -> None:
+        """Runs the top-level code of a program, compiled with the slots of
+        this interpreter's globals, and reports if runtime error occured"""
+        self.globals.grow()
+        self.grow_top_frame(code.frame_size)
+        try:
+            self.execute(code, self.top_frame, None)
+        except lox.LoxRuntimeError as e:
+            lox.lox.runtime_error(e)
+
+    def call_function(self, function: VMFunction, arguments: list) -> object:
+        """Calls function from outside of the VM, by natives, classes and
+        instances"""
+        return self.execute(function.code, self.frame(function, arguments),
+                            function)
+
+    def frame(self, function: VMFunction, arguments: list) -> 'lox.Frame':
+        """Frame of a call to function, same as lox.LoxFunction makes"""
+        code = function.code
+        if code.instructions is None:
+            self.compile_body(code)
+        locals = code.frame_size - len(arguments)
+        if locals:
+            arguments += [None] * locals
+        for slot in code.cells:
+            arguments[slot] = lox.Cell(arguments[slot])
+        return lox.Frame(function.closure, arguments)
+
+    def compile_body(self, code: Code) -> None:
+        """Compiles the body of a function parsed lazily"""
+        declaration = code.declaration
+        if isinstance(declaration.body, lox.LazyBody):
+            lox.LoxFunction(declaration, None).parse_body(
+                self, declaration.body)
+        self.compiler.compile_function(declaration, code.is_init, code)
+
+    def error(self, code: Code, offset: int,
+              message: str) -> 'lox.LoxRuntimeError':
+        """Error in the instruction at offset"""
+        return lox.LoxRuntimeError(
+            lox.Token(TT.IDENTIFIER, '', None, code.line(offset)), message)
+
+    def undefined(self, code: Code, offset: int,
+                  slot: int) -> 'lox.LoxRuntimeError':
+        name = self.globals.table.names[slot]
+        return self.globals.undefined(
+            lox.Token(TT.IDENTIFIER, name, None, code.line(offset)))
+
+    def capture(self, code: Code, frame: 'lox.Frame') -> Optional[lox.Frame]:
+        """Frame of the variables the function of code captures"""
+        captures = code.captures
+        if not captures:
+            return None
+        values = []
+        for depth, slot in captures:
+            enclosing = frame
+            while depth:
+                enclosing = enclosing.enclosing
+                depth -= 1
+            values.append(enclosing.values[slot])
+        return lox.Frame(None, values)
+
+    def make_class(self, name: str, functions: List[VMFunction],
+                   counts: List[int]) -> 'lox.LoxClass':
+        groups = []
+        for count in counts:
+            groups.append({i.code.name: i for i in functions[:count]})
+            functions = functions[count:]
+        methods, class_methods, setters, class_setters = groups
+        meta = lox.LoxClass(
+            metaclass=None,
+            name=f'{name} metaclass',
+            methods=class_methods,
+            setters=class_setters
+        )
+        return lox.LoxClass(meta, name, methods, setters)
+
+    def execute(self, code: Code, frame: 'lox.Frame',
+                function: Optional[VMFunction]) -> object:
+        """Runs code in frame until it returns, and returns the value
+
+        Calls from it to other functions compiled for the VM run in the same
+        loop, keeping the code, position, stack, frame and function of the
+        callers in calls.
+        """
+        calls = []
+        instructions = code.instructions
+        constants = code.constants
+        values = frame.values
+        stack = []
+        globals = self.globals.values
+        UNDEFINED = lox.UNDEFINED
+        ip = 0
+
+        while True:
+            op = instructions[ip]
+            if op == GET_LOCAL:
+                stack.append(values[instructions[ip + 1]])
+                ip += 2
+            elif op == CONSTANT:
+                stack.append(constants[instructions[ip + 1]])
+                ip += 2
+            elif op == SET_LOCAL:
+                values[instructions[ip + 1]] = stack.pop()
+                ip += 2
+            elif op == GET_GLOBAL:
+                value = globals[instructions[ip + 1]]
+                if value is UNDEFINED:
+                    raise self.undefined(code, ip, instructions[ip + 1])
+                stack.append(value)
+                ip += 2
+            elif op == JUMP_IF_FALSE:
+                value = stack.pop()
+                if value is None or value is False:
+                    ip = instructions[ip + 1]
+                else:
+                    ip += 2
+            elif op == JUMP:
+                ip = instructions[ip + 1]
+            elif op == ADD_TYPED:
+                b = stack.pop()
+                stack[-1] += b
+                ip += 1
+            elif op == SUBTRACT_TYPED:
+                b = stack.pop()
+                stack[-1] -= b
+                ip += 1
+            elif op == LESS_TYPED:
+                b = stack.pop()
+                stack[-1] = stack[-1] < b
+                ip += 1
+            elif op == CALL_CHECKED or op == CALL:
+                count = instructions[ip + 1]
+                callee = stack[-count - 1]
+                if type(callee) is VMFunction:
+                    if op != CALL_CHECKED and count != callee.code.arity:
+                        raise self.error(
+                            code, ip, f'Expected {callee.code.arity} '
+                                      f'arguments but got {count}.')
+                    arguments = stack[-count:] if count else []
+                    del stack[-count - 1:]
+                    if len(calls) == MAX_CALLS:
+                        raise RecursionError('maximum recursion depth '
+                                             'exceeded in lox code')
+                    calls.append((code, ip + 2, stack, frame, function))
+                    frame = self.frame(callee, arguments)
+                    function = callee
+                    code = callee.code
+                    instructions = code.instructions
+                    constants = code.constants
+                    values = frame.values
+                    stack = []
+                    ip = 0
+                    continue
+                if op != CALL_CHECKED:
+                    if not isinstance(callee, lox.LoxCallable):
+                        raise self.error(
+                            code, ip, 'Can only call functions and classes.')
+                    if count != callee.arity():
+                        raise self.error(
+                            code, ip, f'Expected {callee.arity()} '
+                                      f'arguments but got {count}.')
+                arguments = stack[-count:] if count else []
+                del stack[-count - 1:]
+                stack.append(callee.call(self, arguments))
+                ip += 2
+            elif op == RETURN:
+                value = stack.pop()
+                if function is not None and function.code.is_init:
+                    value = function.closure.values[0]
+                if not calls:
+                    return value
+                code, ip, stack, frame, function = calls.pop()
+                instructions = code.instructions
+                constants = code.constants
+                values = frame.values
+                stack.append(value)
+            elif op == POP:
+                stack.pop()
+                ip += 1
+            elif op == NIL:
+                stack.append(None)
+                ip += 1
+            elif op == GET_CELL:
+                stack.append(values[instructions[ip + 1]].value)
+                ip += 2
+            elif op == SET_CELL:
+                values[instructions[ip + 1]].value = stack.pop()
+                ip += 2
+            elif op == GET_ENCLOSING or op == GET_ENCLOSING_CELL:
+                enclosing = frame.enclosing
+                depth = instructions[ip + 1] - 1
+                while depth:
+                    enclosing = enclosing.enclosing
+                    depth -= 1
+                value = enclosing.values[instructions[ip + 2]]
+                if op == GET_ENCLOSING_CELL:
+                    value = value.value
+                stack.append(value)
+                ip += 3
+            elif op == SET_ENCLOSING or op == SET_ENCLOSING_CELL:
+                enclosing = frame.enclosing
+                depth = instructions[ip + 1] - 1
+                while depth:
+                    enclosing = enclosing.enclosing
+                    depth -= 1
+                if op == SET_ENCLOSING_CELL:
+                    enclosing.values[instructions[ip + 2]].value = \
+                        stack.pop()
+                else:
+                    enclosing.values[instructions[ip + 2]] = stack.pop()
+                ip += 3
+            elif op == SET_GLOBAL:
+                slot = instructions[ip + 1]
+                if globals[slot] is UNDEFINED:
+                    raise self.undefined(code, ip, slot)
+                globals[slot] = stack.pop()
+                ip += 2
+            elif op == DEFINE_GLOBAL:
+                globals[instructions[ip + 1]] = stack.pop()
+                ip += 2
+            elif op == CHECK_GLOBAL:
+                if globals[instructions[ip + 1]] is UNDEFINED:
+                    raise self.undefined(code, ip, instructions[ip + 1])
+                ip += 2
+            elif op == NEW_CELL:
+                values[instructions[ip + 1]] = lox.Cell()
+                ip += 2
+            elif op == MAKE_CELL:
+                values[instructions[ip + 1]] = lox.Cell(stack.pop())
+                ip += 2
+            elif op == MULTIPLY_TYPED:
+                b = stack.pop()
+                stack[-1] *= b
+                ip += 1
+            elif op == DIVIDE_TYPED:
+                b = stack.pop()
+                stack[-1] = stack[-1] / b if b else NAN
+                ip += 1
+            elif op == GREATER_TYPED:
+                b = stack.pop()
+                stack[-1] = stack[-1] > b
+                ip += 1
+            elif op == GREATER_EQUAL_TYPED:
+                b = stack.pop()
+                stack[-1] = stack[-1] >= b
+                ip += 1
+            elif op == LESS_EQUAL_TYPED:
+                b = stack.pop()
+                stack[-1] = stack[-1] <= b
+                ip += 1
+            elif op == NEGATE_TYPED:
+                stack[-1] = -stack[-1]
+                ip += 1
+            elif op == ADD:
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    stack[-1] = a + b
+                elif isinstance(a, str) and isinstance(b, float) \
+                        or isinstance(a, float) and isinstance(b, str):
+                    stack[-1] = str(a) + str(b)
+                else:
+                    try:
+                        stack[-1] = a + b
+                    except TypeError:
+                        raise self.error(
+                            code, ip,
+                            'Operands must be two numbers or two strings')
+                ip += 1
+            elif op == EQUAL:
+                b = stack.pop()
+                stack[-1] = stack[-1] == b
+                ip += 1
+            elif op == NOT_EQUAL:
+                b = stack.pop()
+                stack[-1] = stack[-1] != b
+                ip += 1
+            elif SUBTRACT <= op <= LESS_EQUAL:
+                # Number only operators
+                b = stack.pop()
+                a = stack[-1]
+                if type(a) is not float or type(b) is not float:
+                    raise self.error(code, ip, 'Operands must be numbers')
+                if op == SUBTRACT:
+                    stack[-1] = a - b
+                elif op == MULTIPLY:
+                    stack[-1] = a * b
+                elif op == DIVIDE:
+                    stack[-1] = a / b if b else NAN
+                elif op == GREATER:
+                    stack[-1] = a > b
+                elif op == GREATER_EQUAL:
+                    stack[-1] = a >= b
+                elif op == LESS:
+                    stack[-1] = a < b
+                else:
+                    stack[-1] = a <= b
+                ip += 1
+            elif op == NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+                ip += 1
+            elif op == NEGATE:
+                value = stack[-1]
+                if type(value) is not float:
+                    raise self.error(code, ip, 'Operand must be a number.')
+                stack[-1] = -value
+                ip += 1
+            elif op == JUMP_IF_FALSE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip = instructions[ip + 1]
+                else:
+                    stack.pop()
+                    ip += 2
+            elif op == JUMP_IF_TRUE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    stack.pop()
+                    ip += 2
+                else:
+                    ip = instructions[ip + 1]
+            elif op == GET_PROPERTY:
+                name = constants[instructions[ip + 1]]
+                instance = stack[-1]
+                if not isinstance(instance, lox.LoxInstance):
+                    raise lox.LoxRuntimeError(
+                        name, 'Can only access properties on instances and '
+                              'classes.')
+                stack[-1] = instance.get(name, self)
+                ip += 2
+            elif op == CHECK_INSTANCE:
+                if not isinstance(stack[-1], lox.LoxInstance):
+                    raise lox.LoxRuntimeError(
+                        constants[instructions[ip + 1]],
+                        'Can only set properties on instances.')
+                ip += 2
+            elif op == SET_PROPERTY:
+                value = stack.pop()
+                stack[-1].set(constants[instructions[ip + 1]], value, self)
+                stack[-1] = value
+                ip += 2
+            elif op == STORE_ARGUMENTS:
+                slot, count = instructions[ip + 1], instructions[ip + 2]
+                if count:
+                    values[slot:slot + count] = stack[-count:]
+                    del stack[-count:]
+                ip += 3
+            elif op == CLOSURE:
+                function_code = constants[instructions[ip + 1]]
+                stack.append(VMFunction(function_code,
+                                        self.capture(function_code, frame)))
+                ip += 2
+            elif op == CLASS:
+                counts = instructions[ip + 2:ip + 6]
+                total = sum(counts)
+                functions = stack[len(stack) - total:]
+                del stack[len(stack) - total:]
+                stack.append(self.make_class(
+                    constants[instructions[ip + 1]], functions, counts))
+                ip += 6
+            elif op == PRINT:
+                print(self.stringify(stack.pop()))
+                ip += 1
+            else:  # pragma: no cover
+                raise AssertionError(f'unknown opcode {op}')
+
+
+__all__ = ['VM', 'VMFunction']
@@ -1,16 +1,60 @@
 #!/usr/bin/env python3
+import argparse
 import sys
 
 import lox
 
-def main(file = None, *rest):
-    if rest:
-        print('Usage: python lox.py [script]')
+
+class ArgumentParser(argparse.ArgumentParser):
+    def error(self, message):
+        self.print_usage(sys.stderr)
+        print(f'{self.prog}: error: {message}', file=sys.stderr)
         sys.exit(64)
-    elif file:
-        lox.run_file(file)
+
+
+def main(*argv):
+    parser = ArgumentParser(prog='lox.py')
+    parser.add_argument('script', nargs='?')
+    parser.add_argument('--scanner', choices=sorted(lox.scanners),
+                        default='char',
+                        help='scanner backend to tokenize source with')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the script lazily instead of loading it '
+                             'into memory at once')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="don't read or write the script's .loxc cache")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='parse in this many processes, 0 for one per '
+                             'core')
+    parser.add_argument('--lazy', action='store_true',
+                        help='parse and resolve function bodies on their '
+                             'first call; errors in functions that are '
+                             'never called go unreported')
+    parser.add_argument('--no-optimize', dest='optimize',
+                        action='store_false',
+                        help="don't fold constants and remove dead code "
+                             'before running')
+    parser.add_argument('--backend', choices=sorted(lox.backends),
+                        default='ast',
+                        help='run the program by walking its tree, '
+                             'compiled into closures, compiled to '
+                             'bytecode, or transpiled to Python')
+    parser.add_argument('--watch', action='store_true',
+                        help='run the script again whenever it changes, '
+                             'only going over the changed parts of it')
+    args = parser.parse_args(argv)
+    if args.watch and not args.script:
+        parser.error('--watch needs a script')
+
+    scanner = lox.scanners[args.scanner]
+    backend = lox.backends[args.backend]
+    if args.watch:
+        lox.watch_file(args.script, optimize=args.optimize, backend=backend)
+    elif args.script:
+        lox.run_file(args.script, scanner, args.stream, args.cache,
+                     args.jobs or None, args.lazy, args.optimize, backend)
     else:
-        lox.run_prompt()
+        lox.run_prompt(scanner, args.optimize, backend)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,31 @@
+import pytest
+
+from lox import Interpreter, Parser, Resolver, Scanner, lox
+
+
+@pytest.fixture(autouse=True)
+def reset_errors():
+    """Clears the errors reported by the last test, and by this one"""
+    lox.had_error = False
+    lox.had_runtime_error = False
+    yield
+    lox.had_error = False
+    lox.had_runtime_error = False
+
+
+def resolve(source, backend=Interpreter, lazy=False, **options):
+    """New interpreter of backend and the statements of source, resolved
+    for it with the resolver's options"""
+    statements = Parser(Scanner(source).scan_tokens(), lazy=lazy).parse()
+    assert not lox.had_error
+    interpreter = backend()
+    Resolver(interpreter.globals.table, **options).resolve(statements)
+    assert not lox.had_error
+    return interpreter, statements
+
+
+def run(source, backend=Interpreter, lazy=False, **options):
+    """Like resolve, running the statements"""
+    interpreter, statements = resolve(source, backend, lazy, **options)
+    interpreter.interpret(statements)
+    return interpreter, statements
@@ -0,0 +1,110 @@
+import pytest
+
+import lox.vm as machine
+from lox import Code, Op, Optimizer, Parser, Resolver, Scanner, VM, \
+    disassemble, lox
+from lox.bytecode import dumps, loads
+from test.conftest import resolve
+
+
+def compile(source, optimize=False):
+    vm, statements = resolve(source, VM, constants=True, types=True)
+    if optimize:
+        statements = Optimizer().optimize(statements)
+    return vm, vm.compiler.compile(statements)
+
+
+PROGRAM = '''
+class Counter {
+  init(start) { this.count = start; }
+  class zero { return Counter(0); }
+  next { this.count = this.count + 1; return this.count; }
+  set to { this.count = value; }
+}
+fun twice(f) {
+  fun call() { f(); return f(); }
+  return call;
+}
+var counter = Counter.zero;
+counter.to = 10;
+fun next() { return counter.next; }
+print twice(next)();
+for (var i = 0; i < 10; i = i + 1) {
+  if (i > 2) break;
+  print i == 1 ? "one" : i;
+}
+'''
+
+
+def test_opcodes_as_ints():
+    for op in Op:
+        assert getattr(machine, op.name) == op.value
+
+
+def test_code_objects(capsys):
+    vm, code = compile(PROGRAM)
+    assert code.name == 'script'
+    assert code.frame_size == 1
+    init, next, zero, to, twice, _ = [i for i in code.constants
+                                      if type(i) is Code]
+    assert [init.name, zero.name, twice.name] == ['init', 'zero', 'twice']
+    assert init.is_init and init.arity == 1 and next.is_getter
+    assert not to.is_init and not to.is_getter and to.arity == 1
+    # Functions declared in functions are in their constants
+    assert twice.captures == [] and twice.constants[0].captures == [(0, 0)]
+    vm.run(code)
+    assert capsys.readouterr().out == '12\n0\none\n2\n'
+
+
+def test_disassemble():
+    _, code = compile('fun f(a) {\n  return -a;\n}\nprint f(1);')
+    assert disassemble(code).splitlines() == [
+        'script:',
+        "     0    1 CLOSURE 0 (<code f>)",
+        '     2    1 DEFINE_GLOBAL 1',
+        '     4    4 GET_GLOBAL 1',
+        "     6    4 CONSTANT 1 (1.0)",
+        '     8    4 CALL_CHECKED 1',
+        '    10    4 PRINT',
+        '    11    4 NIL',
+        '    12    4 RETURN',
+        'f:',
+        '     0    2 GET_LOCAL 0',
+        '     2    2 NEGATE',
+        '     3    2 RETURN',
+        '     4    2 NIL',
+        '     5    2 RETURN',
+    ]
+
+
+def test_constants_are_shared():
+    _, code = compile('print 1; print "1"; print 1; print true; print -0;',
+                      optimize=True)
+    assert code.constants == [1.0, '1', True, -0.0]
+    assert str(code.constants[3]) == '-0.0'
+
+
+def test_runtime_errors_have_lines(capsys):
+    vm, code = compile('var a = 1;\nprint a\n  +\n  nil;')
+    vm.run(code)
+    assert capsys.readouterr().out == \
+        '[line 3] Operands must be two numbers or two strings\n'
+    assert lox.had_runtime_error
+
+
+def test_dumps_and_loads(capsys):
+    vm, code = compile(PROGRAM)
+    data = dumps(vm.globals.table, code)
+    table, loaded = loads(data)
+    VM(table).run(loaded)
+    assert capsys.readouterr().out == '12\n0\none\n2\n'
+    with pytest.raises(ValueError):
+        loads(data[1:])
+
+
+def test_interpret_expression():
+    vm, code = compile('var a = 2;')
+    vm.run(code)
+    expression = Parser(Scanner('a * 3').scan_tokens()).parse_repl()
+    Resolver(vm.globals.table).resolve(expression)
+    assert vm.interpret_expression(expression) == '6'
@@ -0,0 +1,90 @@
+from lox import Cell, lox
+from test.conftest import run
+
+
+def global_value(interpreter, name):
+    globals = interpreter.globals
+    return globals.values[globals.table.slots[name]]
+
+
+def test_only_captured_variables_are_kept():
+    interpreter, statements = run('''
+    fun outer() {
+      var kept = 1;
+      var big = "not kept";
+      {
+        var inner = 2;
+        fun closure() { return kept + inner; }
+        print big;
+        return closure;
+      }
+    }
+    var closure = outer();
+    ''')
+    assert not lox.had_runtime_error
+    closure = global_value(interpreter, 'closure')
+    assert closure.closure.values == [1.0, 2.0]
+    assert closure.closure.enclosing is None
+    # All the scopes of outer share its frame
+    assert statements[0].body[2].statements[1].captures == [(0, 0), (0, 2)]
+
+
+def test_assigned_variables_are_shared_in_cells():
+    interpreter, statements = run('''
+    fun outer(count, step) {
+      fun add() { count = count + step; return count; }
+      return add;
+    }
+    var add = outer(0, 1);
+    ''')
+    assert not lox.had_runtime_error
+    outer = statements[0]
+    assert outer.cells == [0]
+    add = global_value(interpreter, 'add')
+    cell, step = add.closure.values
+    assert type(cell) is Cell and cell.value == 0.0
+    assert step == 1.0
+    assert add.call(interpreter, []) == 1.0
+    assert cell.value == 1.0
+
+
+def test_captured_through_functions():
+    interpreter, statements = run('''
+    fun outer() {
+      var a = 1;
+      fun middle() {
+        fun inner() { return a; }
+        return inner;
+      }
+      return middle;
+    }
+    var inner = outer()();
+    ''')
+    assert not lox.had_runtime_error
+    middle = statements[0].body[1]
+    inner = middle.body[0]
+    assert middle.captures == [(0, 0)]
+    # In the captures of middle, past its frame
+    assert inner.captures == [(1, 0)]
+    assert global_value(interpreter, 'inner').closure.values == [1.0]
+
+
+def test_functions_capturing_themselves_are_cells():
+    _, statements = run('''
+    {
+      fun count(n) { if (n > 0) count(n - 1); }
+      class Node { next() { return Node(); } }
+      count(1);
+      Node().next();
+    }
+    ''')
+    assert not lox.had_runtime_error
+    block = statements[0].statements
+    assert block[0].cell and block[1].cell
+
+
+def test_nothing_captured_at_top_level():
+    interpreter, statements = run('var a = 1; fun f() { return a; }')
+    assert not lox.had_runtime_error
+    assert statements[1].captures == []
+    assert global_value(interpreter, 'f').closure is None
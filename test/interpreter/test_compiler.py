@@ -0,0 +1,114 @@
+from functools import partial
+
+import pytest
+
+from lox import CompiledFunction, CompiledInterpreter, Parser, Resolver, \
+    Scanner, lox
+from test import conftest
+
+run = partial(conftest.run, backend=CompiledInterpreter, constants=True,
+              types=True)
+
+
+@pytest.mark.parametrize('source,error', [
+    ('var a = 1;\nprint a\n  +\n  nil;',
+     '[line 3] Operands must be two numbers or two strings'),
+    ('fun f(a) {\n  return -a;\n}\nprint f("a");',
+     '[line 2] Operand must be a number.'),
+    ('var a = 1;\n{\n  a.b;\n}',
+     '[line 3] Can only access properties on instances and classes.'),
+    ('fun f() {\n  return g;\n}\nf();', "[line 2] Undefined variable 'g'."),
+    ('var f = clock;\nf = 1;\n{\n  f();\n}',
+     '[line 4] Can only call functions and classes.'),
+])
+def test_runtime_errors_have_lines(source, error, capsys):
+    run(source)
+    assert capsys.readouterr().out == error + '\n'
+    assert lox.had_runtime_error
+
+
+def test_break_and_return_through_closures(capsys):
+    run('''
+fun find(n) {
+  var found;
+  for (var i = 0; i < 10; i = i + 1) {
+    fun check() {
+      while (true) {
+        if (i == n) return i;
+        break;
+      }
+      return nil;
+    }
+    var result = check();
+    if (result != nil) {
+      found = result;
+      break;
+    }
+  }
+  return found;
+}
+print find(3);
+print find(20);
+fun counter() {
+  var count = 0;
+  fun next() {
+    count = count + 1;
+    return count;
+  }
+  return next;
+}
+var next = counter();
+next();
+print next();
+''')
+    assert capsys.readouterr().out == '3\nnil\n2\n'
+    assert not lox.had_runtime_error
+
+
+def test_classes(capsys):
+    run('''
+class Point {
+  init(x, y) {
+    this.x = x;
+    this.y = y;
+    if (x == 0) return;
+    this.scaled = false;
+  }
+  class origin { return Point(0, 0); }
+  sum { return this.x + this.y; }
+  set both { this.x = value; this.y = value; }
+  scale(by) {
+    this.x = this.x * by;
+    this.y = this.y * by;
+    this.scaled = true;
+    return this;
+  }
+}
+var p = Point(1, 2);
+print p.sum;
+p.both = 3;
+print p.scale(2).sum;
+var scale = p.scale;
+print scale(2).x;
+print p.init(5, 5) == p;
+print Point.origin.sum;
+print p.scaled;
+''')
+    assert capsys.readouterr().out == '3\n12\n12\ntrue\n0\nfalse\n'
+    assert not lox.had_runtime_error
+
+
+def test_lazy_functions_are_compiled_once(capsys):
+    interpreter, statements = run(
+        'fun f(n) { return n * 2; }\nprint f(2);\nprint f(3);', lazy=True)
+    assert capsys.readouterr().out == '4\n6\n'
+    function = interpreter.globals.values[1]
+    assert type(function) is CompiledFunction and function.body is not None
+    assert list(interpreter.compiler.bodies) == [statements[0]]
+
+
+def test_interpret_expression():
+    interpreter, _ = run('var a = 2;')
+    expression = Parser(Scanner('a * 3').scan_tokens()).parse_repl()
+    Resolver(interpreter.globals.table).resolve(expression)
+    assert interpreter.interpret_expression(expression) == '6'
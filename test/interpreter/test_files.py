@@ -4,18 +4,14 @@ from typing import Tuple, List
 
 import pytest
 
-from lox import Parser, Interpreter, Scanner, lox, Resolver
+from lox import Parser, Interpreter, Optimizer, lox, Resolver, backends, \
+    scanners
 
 expect_error = object()
 expect_resolve_error = object()
 expect_runtime_error = object()
 
 
-@pytest.fixture(autouse=True)
-def reset_had_error():
-    lox.had_error = False
-    lox.had_runtime_error = False
-
 def removeprefix(p: str, s: str) -> str:
     return (s, s[len(p):])[s.startswith(p)]
 
@@ -46,16 +42,25 @@ def gather_tests() -> Tuple[List[Tuple[str, object]], List[str]]:
 
 tests = gather_tests()
 
+# Keyword arguments of the Resolver: its defaults, inferred types as in the
+# REPL and lazily parsed programs, and checked constants too as when running
+# a file
+@pytest.mark.parametrize('options', [
+    {},
+    {'types': True},
+    {'constants': True, 'types': True},
+], ids=['default', 'types', 'constants'])
+@pytest.mark.parametrize('scanner', scanners.values(), ids=scanners.keys())
 @pytest.mark.parametrize('s,expect', tests[0], ids=tests[1])
-def test_interpreter(s, expect, capsys):
-    statements = Parser(Scanner(s).scan_tokens()).parse()
+def test_interpreter(s, expect, scanner, options, capsys):
+    statements = Parser(scanner(s).scan_tokens()).parse()
     if expect is expect_error:
         assert lox.had_error
         return
 
     assert not lox.had_error
     interpreter = Interpreter()
-    Resolver(interpreter).resolve(statements)
+    Resolver(interpreter.globals.table, **options).resolve(statements)
     if expect is expect_resolve_error:
         assert lox.had_error
         return
@@ -68,3 +73,64 @@ def test_interpreter(s, expect, capsys):
         assert capsys.readouterr().out == expect
 
 
+
+
+@pytest.mark.parametrize('s,expect', tests[0], ids=tests[1])
+def test_interpreter_lazy(s, expect, capsys):
+    if not isinstance(expect, str):
+        pytest.skip('errors in bodies are reported on the first call')
+    statements = Parser(scanners['regex'](s).scan_tokens(), lazy=True).parse()
+    interpreter = Interpreter()
+    Resolver(interpreter.globals.table).resolve(statements)
+    interpreter.interpret(statements)
+    assert not lox.had_error and not lox.had_runtime_error
+    assert capsys.readouterr().out == expect
+
+
+@pytest.mark.parametrize('s,expect', tests[0], ids=tests[1])
+def test_interpreter_optimized(s, expect, capsys):
+    if expect is expect_error or expect is expect_resolve_error:
+        pytest.skip('the optimizer only sees programs without errors')
+    statements = Parser(scanners['regex'](s).scan_tokens()).parse()
+    interpreter = Interpreter()
+    Resolver(interpreter.globals.table, constants=True,
+             types=True).resolve(statements)
+    statements = Optimizer().optimize(statements)
+    interpreter.interpret(statements)
+    assert not lox.had_error
+    if expect is expect_runtime_error:
+        assert lox.had_runtime_error
+    else:
+        assert not lox.had_runtime_error
+        assert capsys.readouterr().out == expect
+
+
+@pytest.mark.parametrize('optimize', [False, True],
+                         ids=['unoptimized', 'optimized'])
+@pytest.mark.parametrize('backend', backends.values(), ids=backends.keys())
+@pytest.mark.parametrize('s,expect', tests[0], ids=tests[1])
+def test_backends(s, expect, backend, optimize, capsys):
+    if expect is expect_error or expect is expect_resolve_error:
+        pytest.skip('backends only run programs without errors')
+    statements = Parser(scanners['regex'](s).scan_tokens()).parse()
+    interpreter = backend()
+    Resolver(interpreter.globals.table, constants=True,
+             types=True).resolve(statements)
+    if optimize:
+        statements = Optimizer().optimize(statements)
+    interpreter.interpret(statements)
+    assert not lox.had_error
+    if expect is expect_runtime_error:
+        # Reported the same as by the tree walking interpreter
+        assert lox.had_runtime_error
+        out = capsys.readouterr().out
+        lox.had_runtime_error = False
+        statements = Parser(scanners['regex'](s).scan_tokens()).parse()
+        interpreter = Interpreter()
+        Resolver(interpreter.globals.table, constants=True,
+                 types=True).resolve(statements)
+        interpreter.interpret(statements)
+        assert capsys.readouterr().out == out
+    else:
+        assert not lox.had_runtime_error
+        assert capsys.readouterr().out == expect
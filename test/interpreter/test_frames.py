@@ -0,0 +1,145 @@
+import lox as lox_package
+from lox import lox
+from test.conftest import resolve, run
+
+
+def test_shadowing_in_nested_blocks(capsys):
+    _, statements = run('''
+    var a = "global";
+    {
+      var a = "outer";
+      {
+        var a = "inner";
+        print a;
+      }
+      print a;
+    }
+    fun f(a) {
+      var b = a + 1;
+      { var a = b; { var a = b + 1; print a; } print a; }
+      print a;
+    }
+    f(1);
+    print a;
+    ''')
+    assert capsys.readouterr().out == \
+        'inner\nouter\n3\n2\n1\nglobal\n'
+    assert not lox.had_runtime_error
+    outer = statements[1].statements[0]
+    inner = statements[1].statements[1].statements[0]
+    assert (outer.slot, inner.slot) == (0, 1)
+
+
+def test_slots_reused_after_blocks_end(capsys):
+    _, statements = run('''
+    fun f() {
+      { var a = "a"; print a; }
+      { var b; print b; }
+      { var c = "c"; print c; { var d; print d; } }
+    }
+    f();
+    ''')
+    assert capsys.readouterr().out == 'a\nnil\nc\nnil\n'
+    assert not lox.had_runtime_error
+    body = statements[0].body
+    # Declared without an initializer, b and d are nil, not what was in
+    # their slots before
+    assert body[0].statements[0].slot == body[1].statements[0].slot
+    assert body[2].statements[2].statements[0].slot == 1
+
+
+def test_closures_capture_block_locals(capsys):
+    run('''
+    fun make() {
+      var get;
+      {
+        var x = "x";
+        fun f() { return x; }
+        get = f;
+      }
+      { var y = "y"; print get() + y; }
+      return get;
+    }
+    print make()();
+    var first;
+    var second;
+    for (var i = 0; i < 2; i = i + 1) {
+      var j = i;
+      fun g() { return j; }
+      if (i == 0) first = g; else second = g;
+    }
+    print first();
+    print second();
+    ''')
+    assert capsys.readouterr().out == 'xy\nx\n0\n1\n'
+    assert not lox.had_runtime_error
+
+
+def test_scopes_of_a_function_share_its_frame():
+    _, statements = resolve('''
+    fun f(a) {
+      var b = a;
+      { var c = b; print c; }
+      { var d = b; { var e = d; print e; } }
+      return b;
+    }
+    ''')
+    f = statements[0]
+    # Sibling blocks reuse slots
+    assert f.frame_size == 4
+    assert f.body[0].slot == 1
+    assert f.body[1].statements[0].slot == 2
+    assert f.body[2].statements[0].slot == 2
+    assert f.body[2].statements[1].statements[0].slot == 3
+    assert f.body[1].frame_size is None
+
+
+def test_outermost_top_level_blocks_have_frames():
+    _, statements = resolve('''
+    { var a = 1; { var b = a; print b; } }
+    { print 1; }
+    { var c = 1; print c; }
+    ''')
+    assert [s.frame_size for s in statements] == [2, None, 1]
+    assert statements[0].statements[1].frame_size is None
+    assert statements[2].statements[0].slot == 0
+
+
+def test_top_level_loops_have_frames():
+    _, statements = resolve('''
+    for (var i = 0; i < 1; i = i + 1) { var j = i; print j; }
+    var k;
+    for (k = 0; k < 1; k = k + 1) print k;
+    ''')
+    loop = statements[0]
+    assert loop.frame_size == 2
+    assert loop.initializer.slot == 0
+    assert loop.body.frame_size is None
+    assert loop.body.statements[0].slot == 1
+    assert statements[2].frame_size is None
+
+
+def test_loops_allocate_no_frames(capsys, monkeypatch):
+    interpreter, statements = resolve('''
+    fun sum(n) {
+      var total = 0;
+      for (var i = 0; i < n; i = i + 1) {
+        var twice = i * 2;
+        if (twice > 2) { var half = twice / 2; total = total + half; }
+      }
+      return total;
+    }
+    for (var i = 0; i < 3; i = i + 1) { var s = sum(i + 3); print s; }
+    ''')
+    frames = []
+
+    class Frame(lox_package.Frame):
+        def __init__(self, *args):
+            super().__init__(*args)
+            frames.append(self)
+
+    monkeypatch.setattr(lox_package, 'Frame', Frame)
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '2\n5\n9\n'
+    # One per call
+    assert len(frames) == 3
@@ -0,0 +1,73 @@
+import pytest
+
+from lox import lox
+from test.conftest import resolve
+
+
+def checked(source):
+    """Whether the call in the last statement was checked statically"""
+    _, statements = resolve(source, constants=True)
+    return statements[-1].expression.checked
+
+
+def test_constants_are_checked():
+    assert checked('fun f(a, b) { a + b; } f(1, 2);')
+    assert checked('class A {} A();')
+    assert checked('class A { init(a) { a; } } A(1);')
+    assert checked('clock();')
+    assert checked('fun clock() {} clock();')
+
+
+@pytest.mark.parametrize('source', [
+    'fun f(a) { a; } f();',
+    'class A { init(a) { a; } } A();',
+    'fun f() {} f = nil; f();',
+    'fun f() {} { f = nil; } f();',
+    'fun f() {} fun f() {} f();',
+    'var f; f();',
+    'var clock; clock();',
+    'clock = nil; clock();',
+    'undefined();',
+])
+def test_others_are_not(source):
+    assert not checked(source)
+
+
+def test_locals_are_not():
+    _, statements = resolve('fun f() {} { fun f(a) { a; } f(1); }',
+                            constants=True)
+    assert not statements[1].statements[1].expression.checked
+
+
+def test_not_checked_without_constants():
+    _, statements = resolve('fun f() {} f();', constants=False)
+    assert not statements[1].expression.checked
+
+
+def test_globals_have_slots():
+    interpreter, statements = resolve('var a = 1; { print a; b = a; }',
+                                      constants=True)
+    table = interpreter.globals.table
+    block = statements[1].statements
+    assert block[0].expression.slot == table.slots['a']
+    assert block[1].expression.slot == table.slots['b']
+    assert table.names[table.slots['clock']] == 'clock'
+
+
+def test_checked_call_runs(capsys):
+    interpreter, statements = resolve('''
+    fun add(a, b) { return a + b; }
+    class Pair { init(a, b) { this.sum = add(a, b); } }
+    print add(1, 2);
+    print Pair(3, 4).sum;
+    ''', constants=True)
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '3\n7\n'
+    assert not lox.had_runtime_error
+
+
+def test_checked_call_before_declaration(capsys):
+    interpreter, statements = resolve('f(); fun f() {}', constants=True)
+    assert statements[0].expression.checked
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == "[line 1] Undefined variable 'f'.\n"
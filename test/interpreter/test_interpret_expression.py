@@ -5,7 +5,7 @@ from lox import lox
 def interpert(s):
     interpreter = Interpreter()
     statements = Parser(Scanner(s).scan_tokens()).expression()
-    Resolver(interpreter).resolve(statements)
+    Resolver(interpreter.globals.table).resolve(statements)
     return interpreter.interpret_expression(statements)
 
 
@@ -0,0 +1,99 @@
+import warnings
+
+import pytest
+
+from lox import JIT, lox, stmt
+from test.conftest import run
+
+
+@pytest.fixture(autouse=True)
+def threshold(monkeypatch):
+    monkeypatch.setattr(JIT, 'threshold', 2)
+
+
+def test_hot_loops_are_traced(capsys):
+    interpreter, statements = run('''
+fun sum(n) {
+  var total = 0;
+  var i = 0;
+  while (i < n) { total = total + i; i = i + 1; }
+  return total;
+}
+print sum(100);
+''', types=True)
+    assert capsys.readouterr().out == '4950\n'
+    loop, = interpreter.jit.traces
+    assert type(loop) is stmt.While and interpreter.jit.traces[loop]
+    # Numbers, since n was one when traced
+    assert interpreter.jit.transpiler.typed == {
+        loop.condition, loop.body.statements[0].expression.value,
+        loop.body.statements[1].expression.value}
+
+
+def test_deoptimizes_on_other_types(capsys):
+    interpreter, _ = run('''
+fun repeat(x, n) {
+  var result = x;
+  for (var i = 1; i < n; i = i + 1) result = result + x;
+  return result;
+}
+print repeat(2, 5);
+print repeat("ab", 3);
+print repeat(1, 4);
+print repeat(true, 3);
+''', types=True)
+    assert capsys.readouterr().out == '10\nababab\n4\n3\n'
+    loop, = interpreter.jit.traced
+    assert interpreter.jit.traced[loop] == JIT.retraces
+    # Left to the interpreter
+    assert interpreter.jit.traces[loop] is None
+
+
+def test_leaving_traced_loops(capsys):
+    run('''
+fun find(n) {
+  var i = 0;
+  while (true) {
+    if (i * i >= n) return i;
+    i = i + 1;
+  }
+}
+fun first() {
+  var i = 0;
+  for (;; i = i + 1) if (i > 5) break;
+  return i;
+}
+print find(50);
+print first();
+{
+  var s = "";
+  var i = 0;
+  while (i < 3) { fun add() { return s + "x"; } s = add(); i = i + 1; }
+  print s;
+}
+''', types=True)
+    assert capsys.readouterr().out == '8\n6\nxxx\n'
+
+
+def test_runtime_errors_in_traces(capsys):
+    run('var i = 0;\nwhile (i < 10) {\n  i = i + 1;\n  if (i > 5)\n'
+        '    i = -"i";\n}', types=True)
+    assert capsys.readouterr().out == '[line 5] Operand must be a number.\n'
+    assert lox.had_runtime_error
+
+
+def test_literal_conditions_in_traces(capsys):
+    # Comparing a literal with 'is' is a SyntaxWarning, which would stop
+    # the loop from being traced
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        interpreter, statements = run('''
+var n = 0;
+for (var i = 0; i < 10; i = i + 1) {
+  if ((i, 1)) n = n + 1;
+  if (!(i, "x")) n = 0;
+}
+print n;
+''')
+    assert capsys.readouterr().out == '10\n'
+    assert interpreter.jit.traces[statements[1]]
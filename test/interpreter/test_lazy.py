@@ -0,0 +1,53 @@
+import pytest
+
+from lox import LazyBody, Parser, Scanner, backends, lox, stmt
+from test.conftest import run
+
+
+def test_bodies_are_skipped():
+    statements = Parser(Scanner('''
+    fun f() { var a = 1; { print a; } fun g() {} }
+    class A { m() { return this; } get { return 1; } }
+    ''').scan_tokens(), lazy=True).parse()
+    assert isinstance(statements[0].body, LazyBody)
+    assert all(isinstance(m.body, LazyBody) for m in statements[1].methods)
+
+
+@pytest.mark.parametrize('backend', backends.values(), ids=backends.keys())
+def test_body_parsed_on_first_call(backend, capsys):
+    _, statements = run('''
+    fun f(n) { fun g() { return n; } return g; }
+    class A {
+      init(x) { this.x = x; }
+      get { return this.x; }
+      unused() { this is not even valid; }
+    }
+    print f(1)();
+    print f(2)();
+    print A(3).get;
+    ''', backend, lazy=True)
+    assert capsys.readouterr().out == '1\n2\n3\n'
+    assert isinstance(statements[0].body, list)
+    assert isinstance(statements[0].body[0], stmt.Function)
+    assert isinstance(statements[1].methods[2].body, LazyBody)
+
+
+@pytest.mark.parametrize('backend', backends.values(), ids=backends.keys())
+@pytest.mark.parametrize('body', [
+    '{ print ; }',
+    '{ var unused = 1; }',
+    '{ var a = 1; var a = 2; print a; }',
+])
+def test_errors_reported_on_call(body, backend, capsys):
+    run(f'fun f() {body}\nprint "before";\nf();', backend, lazy=True)
+    out = capsys.readouterr().out
+    assert out.startswith('before\n[line 1] Error')
+    assert out.endswith("[line 1] Can't compile the body of 'f'.\n")
+    assert lox.had_error and lox.had_runtime_error
+
+
+def test_unbalanced_braces_reported_eagerly(capsys):
+    Parser(Scanner('fun f() { {').scan_tokens(), lazy=True).parse()
+    assert lox.had_error
+    assert capsys.readouterr().out == \
+        "[line 1] Error at end: Expect '}' after block.\n"
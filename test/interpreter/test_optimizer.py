@@ -0,0 +1,179 @@
+import sys
+
+import pytest
+
+import lox as lox_package
+from lox import Optimizer, expr, stmt, lox
+from test.conftest import resolve
+
+
+def optimize(source, constants=False):
+    interpreter, statements = resolve(source, constants=constants,
+                                      types=True)
+    optimizer = Optimizer()
+    return interpreter, optimizer, optimizer.optimize(statements)
+
+
+def printed(source):
+    """The values of the print statements after optimizing"""
+    _, _, statements = optimize(source)
+    return [s.expression for s in statements if type(s) is stmt.Print]
+
+
+@pytest.mark.parametrize('source,value', [
+    ('1 + 2 * 3', 7.0),
+    ('(1 + 2) * 3', 9.0),
+    ('"a" + "b"', 'ab'),
+    ('"a" + 1', 'a1.0'),
+    ('-(1)', -1.0),
+    ('!nil', True),
+    ('1 < 2 == true', True),
+    ('1, 2', 2.0),
+    ('true and nil', None),
+    ('nil or "x"', 'x'),
+    ('1 > 2 ? "y" : "n"', 'n'),
+])
+def test_constants_are_folded(source, value):
+    e, = printed(f'print {source};')
+    assert type(e) is expr.Literal and e.value == value
+
+
+def test_division_by_zero_is_folded_to_nan():
+    e, = printed('print 1 / 0;')
+    assert e.value != e.value
+
+
+def test_failing_expressions_are_kept(capsys):
+    interpreter, _, statements = optimize('print -"a";\nprint 1 + nil;')
+    assert [type(s.expression) for s in statements] == \
+        [expr.Unary, expr.Binary]
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '[line 1] Operand must be a number.\n'
+
+
+def test_partially_constant_expressions():
+    logical, comma, grouping = printed('''
+    var a = 1;
+    print false or a;
+    print (nil, a);
+    print (a) + (1 + 1);
+    ''')
+    assert type(logical) is expr.Variable
+    assert type(comma) is expr.Variable
+    assert type(grouping.left) is expr.Variable
+    assert grouping.right.value == 2.0
+
+
+def test_dead_code_is_removed():
+    _, optimizer, statements = optimize('''
+    fun f(a) {
+      if (false) print a;
+      if (true) { print a; } else print "no";
+      while (nil) print a;
+      1 + 2;
+      return a;
+      print "unreachable";
+    }
+    while (true) { break; print "unreachable"; }
+    ''')
+    f, loop = statements
+    assert [type(s) for s in f.body] == [stmt.Block, stmt.Return]
+    assert [type(s) for s in loop.body.statements] == [stmt.Break]
+    assert optimizer.changes == {
+        'folded': 1, 'groupings': 0, 'branches': 3, 'statements': 3,
+        'inlined': 0}
+    assert optimizer.report() == ('folded 1 expressions, removed 0 '
+                                  'groupings, pruned 3 branches and 3 '
+                                  'statements, inlined 0 calls')
+
+
+def test_pruned_branches_of_kept_statements():
+    _, _, statements = optimize('''
+    var a = 1;
+    if (a) if (false) print a;
+    while (a) if (nil) print a;
+    ''')
+    assert statements[1].then_branch.statements == []
+    assert statements[2].body.statements == []
+
+
+INLINED = '''
+fun sq(x) { return x * x; }
+fun add(a, b) { return a + b; }
+fun f(n) {
+  var t = n;
+  { var u = add(sq(t), sq(add(t, 1))); t = u; }
+  return t;
+}
+print f(2);
+{ print add("a", sq(3)); }
+'''
+
+
+def test_calls_are_inlined(capsys):
+    interpreter, optimizer, statements = optimize(INLINED, constants=True)
+    assert optimizer.changes['inlined'] == 6
+    f = statements[2]
+    # Parameters of inlined calls go after the locals
+    assert f.frame_size == 5
+    u = f.body[1].statements[0].initializer
+    assert type(u) is expr.Inline and u.slot == 3
+    assert u.body.left.slot == 3 and u.body.right.slot == 4
+    assert statements[4].frame_size == 2
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '13\na9.0\n'
+
+
+@pytest.mark.parametrize('source', [
+    # Reassigned, declared twice, or local
+    'fun g(x) { return x; } g = nil; { g(1); }',
+    'fun g(x) { return x; } fun g(x) { return x; } { g(1); }',
+    '{ fun g(x) { return x; } g(1); }',
+    # Not just a return, calling, or too big
+    'fun g(x) { print x; } { g(1); }',
+    'fun g(x) { return g(x); } { g(1); }',
+    'fun g(x) { return x' + ' + x' * 16 + '; } { g(1); }',
+    # Wrong number of arguments, or no frame to put them in
+    'fun g(x) { return x; } { g(1, 2); }',
+    'fun g(x) { return x; } g(1);',
+])
+def test_calls_not_inlined(source):
+    _, optimizer, _ = optimize(source, constants=True)
+    assert optimizer.changes['inlined'] == 0
+
+
+def test_inlined_errors(capsys):
+    interpreter, optimizer, statements = optimize('''
+    { print neg(1); }
+    fun neg(x) {
+      return -x;
+    }
+    { print neg("a"); }
+    ''', constants=True)
+    assert optimizer.changes['inlined'] == 2
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == "[line 2] Undefined variable 'neg'.\n"
+    lox.had_runtime_error = False
+    interpreter.interpret(statements[1:])
+    assert capsys.readouterr().out == '[line 4] Operand must be a number.\n'
+
+
+def test_deep_nesting():
+    depth = sys.getrecursionlimit() * 2
+    _, _, statements = optimize('print ' + '(' * depth + '1'
+                                + ' + 1)' * depth + ';')
+    assert statements[0].expression.value == depth + 1
+
+
+def test_run_with_and_without(capsys):
+    source = '''
+    fun f(n) {
+      if (1 > 2) return "no";
+      return n * (2 + 3);
+    }
+    print f(2);
+    '''
+    lox_package.run(source)
+    assert capsys.readouterr().out == '10\n'
+    lox_package.run(source, optimize=False)
+    assert capsys.readouterr().out == '10\n'
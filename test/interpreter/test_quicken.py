@@ -0,0 +1,96 @@
+import copy
+
+import lox.quicken as quicken
+from lox.token import TokenType as TT
+from test.conftest import run
+
+
+def returned(function):
+    """Expression the first statement of function returns"""
+    return function.body[0].value
+
+
+def test_specialized_for_operands(capsys):
+    _, statements = run('''
+fun add(a, b) { return a + b; }
+fun less(a, b) { return a < b; }
+fun negate(a) { return -a; }
+fun equal(a, b) { return a == b; }
+print add(1, 2);
+print add(3, 4);
+print less(1, 2);
+print negate(1);
+print equal(nil, 1);
+''')
+    add, less, negate, equal = statements[:4]
+    assert capsys.readouterr().out == '3\n7\ntrue\n-1\nfalse\n'
+    assert returned(add).variant is quicken.add_numbers
+    assert returned(less).variant is quicken.less
+    assert returned(negate).variant is quicken.negate
+    assert returned(equal).variant is quicken.equal
+
+
+def test_typed_variants_have_no_guards(capsys):
+    _, statements = run('''
+{
+  var a = 1;
+  for (var i = 0; i < 2; i = i + 1) print -(a / i);
+}
+''', types=True)
+    assert capsys.readouterr().out == 'nan\n-1\n'
+    loop = statements[0].statements[1]
+    assert loop.condition.variant is quicken.typed_variants[TT.LESS]
+    assert loop.increment.value.variant is quicken.typed_variants[TT.PLUS]
+    negate = loop.body.expression
+    assert negate.variant is quicken.negate_typed
+    assert negate.right.expression.variant \
+        is quicken.typed_variants[TT.SLASH]
+
+
+def test_generalized_when_guards_fail(capsys):
+    _, statements = run('''
+fun add(a, b) { return a + b; }
+fun negate(a) { return -a; }
+print add("a", "b");
+print add(1, 2);
+print add("a", 1);
+print negate(1);
+print negate("a");
+''')
+    add, negate = statements[:2]
+    assert capsys.readouterr().out == \
+        'ab\n3\na1.0\n-1\n[line 3] Operand must be a number.\n'
+    assert returned(add).variant is quicken.generic_binary
+    assert returned(negate).variant is quicken.generic_unary
+
+
+def test_properties(capsys):
+    _, statements = run('''
+class Point {
+  init(x) { this.x = x; }
+  double { return this.x * 2; }
+}
+fun x(p) { return p.x; }
+fun double(p) { return p.double; }
+var p = Point(1);
+print x(p);
+print double(p);
+print double(Point(2));
+p.double = "field";
+print double(p);
+print double(1);
+''')
+    assert capsys.readouterr().out == \
+        '1\n2\n4\nfield\n' \
+        '[line 7] Can only access properties on instances and classes.\n'
+    x, double = statements[1:3]
+    assert returned(x).variant.__qualname__ == 'get_field.<locals>.variant'
+    # A field shadowing the method
+    assert returned(double).variant is quicken.generic_get
+
+
+def test_copies_are_not_specialized():
+    _, statements = run('fun add(a, b) { return a + b; } add(1, 2);')
+    e = returned(statements[0])
+    assert 'variant' not in repr(e)
+    assert copy.deepcopy(e).variant is None
@@ -0,0 +1,99 @@
+import warnings
+from functools import partial
+
+import pytest
+
+from lox import Parser, PythonFunction, PythonInterpreter, Resolver, \
+    Scanner, lox
+from test import conftest
+
+resolve = partial(conftest.resolve, backend=PythonInterpreter,
+                  constants=True, types=True)
+
+
+def test_functions_and_locals():
+    interpreter, statements = resolve('''
+fun add(a, b) {
+  var sum = a + b;
+  return sum;
+}
+print add(1, 2);
+''')
+    source = interpreter.transpiler.transpile(statements)
+    assert 'def add_0(c, v0, v1):' in source
+    # The types of the parameters aren't known
+    assert '    v2 = ((v0 + v1) if type(v0) is float and type(v1) is ' \
+           'float else add(k[0], v0, v1))' in source
+    # Checked calls to global functions call theirs directly
+    assert 'add_0(None, 1.0, 2.0)' in source
+
+
+def test_runs_like_the_interpreter(capsys):
+    interpreter, statements = resolve('''
+class Counter {
+  init(start) { this.count = start; }
+  next { this.count = this.count + 1; return this.count; }
+}
+fun counter() {
+  var c = Counter(0);
+  fun next() { return c.next; }
+  return next;
+}
+var next = counter();
+next();
+var s = "";
+for (var i = 0; i < 3; i = i + 1) s = s + (i == 1 and "one" or i);
+print next() + 1 / 0 == nil or s;
+''')
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '0.0one2.0\n'
+    assert not lox.had_runtime_error
+
+
+def test_runtime_errors_have_lines(capsys):
+    interpreter, statements = resolve('var a = 1;\nprint a\n  -\n  nil;')
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '[line 3] Operands must be numbers\n'
+    assert lox.had_runtime_error
+
+
+def test_too_nested_for_python(capsys):
+    interpreter, statements = resolve('if (true) ' * 120 + 'print 1;')
+    with pytest.raises(SyntaxError):
+        interpreter.load(interpreter.transpiler.transpile(statements))
+    # Run by lox.Interpreter instead
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '1\n'
+
+
+def test_literal_conditions_compile_without_warnings(capsys):
+    interpreter, statements = resolve('''
+var a = 1;
+if ((a, 2)) print 1;
+print !(a, "s");
+print (a, 2) or 3;
+''')
+    source = interpreter.transpiler.transpile(statements)
+    # Comparing a literal with 'is' is a SyntaxWarning
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        interpreter.load(source)
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '1\nfalse\n2\n'
+
+
+def test_lazy_functions(capsys):
+    interpreter, statements = resolve(
+        'fun f(n) { return n * 2; }\nprint f(2);\nprint f(3);', lazy=True)
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '4\n6\n'
+    function = interpreter.globals.values[1]
+    assert type(function) is PythonFunction and function.code is not None
+
+
+def test_interpret_expression():
+    interpreter, statements = resolve('var a = 2;')
+    interpreter.interpret(statements)
+    expression = Parser(Scanner('a * 3').scan_tokens()).parse_repl()
+    Resolver(interpreter.globals.table).resolve(expression)
+    assert interpreter.interpret_expression(expression) == '6'
@@ -0,0 +1,110 @@
+import pytest
+
+from lox import expr
+from test.conftest import resolve
+
+
+def operations(statements):
+    """Whether each binary and unary operation in statements is typed, by
+    operator in source order"""
+    found = []
+    nodes = list(reversed(statements))
+    while nodes:
+        node = nodes.pop()
+        if type(node) in (expr.Binary, expr.Unary):
+            found.append((node.operator.lexeme, node.typed))
+        for name in reversed(node.__slots__):
+            value = getattr(node, name)
+            if type(value) is list:
+                nodes.extend(i for i in reversed(value)
+                             if hasattr(i, 'accept'))
+            elif hasattr(value, 'accept'):
+                nodes.append(value)
+    return found
+
+
+def test_literals_and_locals():
+    _, statements = resolve('''
+    {
+      var i = 0;
+      var s = "a";
+      while (i < 3) {
+        i = i + 1;
+        s = s + "b";
+      }
+      print -i * 2;
+    }
+    ''', types=True)
+    assert operations(statements) == [
+        ('<', True), ('+', True), ('+', True),
+        ('*', True), ('-', True),
+    ]
+
+
+def test_closures_assigning_locals():
+    _, statements = resolve('''
+    fun counter() {
+      var n = 0;
+      fun add() { n = n + 1; return n; }
+      fun reset() { n = "zero"; }
+      reset();
+      return add;
+    }
+    fun total() {
+      var t = 0;
+      fun add() { t = t + 1; }
+      add();
+      return t - 1;
+    }
+    ''', types=True)
+    assert operations(statements) == [('+', False), ('+', True), ('-', True)]
+
+
+@pytest.mark.parametrize('source', [
+    'fun f(a) { return a + 1; }',
+    'var g = 1; print g + 1;',
+    '{ var a; print a + 1; }',
+    '{ var a = 1; a = nil; print -a; }',
+    '{ var a = 1; print a + "b"; }',
+    '{ var a = true; print (a + a) - 1; }',
+    'fun f() { return 1; } print f() * 2;',
+    '{ var a = 1; var b = a or nil; print b + 1; }',
+    '{ var a = 1; var b = (a = 2); print a + b; }',
+])
+def test_unknown_operands_are_checked(source):
+    _, statements = resolve(source, types=True)
+    assert not any(typed for _, typed in operations(statements))
+
+
+def test_loop_feeding_earlier_local():
+    _, statements = resolve('''
+    {
+      var a = 1;
+      var b = 1;
+      while (a < 10) { a = b + 1; b = "x"; }
+    }
+    ''', types=True)
+    assert operations(statements) == [('<', False), ('+', False)]
+
+
+def test_not_typed_without_types():
+    _, statements = resolve('{ var a = 1; print a + 1; }', types=False)
+    assert operations(statements) == [('+', False)]
+
+
+def test_typed_results(capsys):
+    interpreter, statements = resolve('''
+    {
+      var a = 7;
+      var s = "x";
+      print a / 2;
+      print a / 0;
+      print a > 2;
+      print a <= 2;
+      print s + "y";
+      print -a;
+    }
+    ''', types=True)
+    assert all(typed for _, typed in operations(statements))
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == '3.5\nnan\ntrue\nfalse\nxy\n-7\n'
@@ -11,14 +11,6 @@ def parse(s):
         return None
 
 
-@pytest.fixture(autouse=True)
-def set_had_error_false():
-    try:
-        yield
-    finally:
-        lox.had_error = False
-
-
 @pytest.mark.parametrize('s', ['true', 'false', 'nil', '1', '99.99' '"string"'])
 def test_primary(s):
     e = parse(s)
@@ -136,3 +128,21 @@ def test_aunt_sally():
     assert e.right.right.operator.type == TT.STAR
     assert isinstance(e.right.right.right, expr.Unary)
     assert e.right.right.right.operator.type == TT.MINUS
+
+
+def test_deep_nesting():
+    # Nesting is kept on the parser's own stack, not Python's
+    e = parse('(' * 5000 + '-a.b(1)' + ')' * 5000)
+    for _ in range(5000):
+        assert isinstance(e, expr.Grouping)
+        e = e.expression
+    assert isinstance(e, expr.Unary)
+    assert isinstance(e.right, expr.Call)
+
+
+def test_nodes_are_slotted():
+    e = parse('a + 1')
+    assert not hasattr(e, '__dict__')
+    assert {e: 1}[e] == 1
+    assert e.kind == expr.Binary.kind != expr.Variable.kind
+    assert repr(e.right) == 'Literal(value=1.0)'
@@ -0,0 +1,48 @@
+import sys
+
+from lox import Parser, Resolver, Scanner, stmt
+import lox.lox as lox
+
+# Deeper than Python would allow with one frame per level
+DEPTH = sys.getrecursionlimit() * 2
+
+
+def parse(s):
+    return Parser(Scanner(s).scan_tokens()).parse()
+
+
+def test_nested_blocks():
+    statements = parse('{' * DEPTH + 'print 1;' + '}' * DEPTH)
+    assert not lox.had_error
+    s = statements[0]
+    for _ in range(DEPTH - 1):
+        s = s.statements[0]
+    assert isinstance(s.statements[0], stmt.Print)
+
+
+def test_nested_ifs_resolve():
+    source = ('fun f(a) {'
+              + 'if (a) while (a) ' * DEPTH
+              + 'return a' + ' + a' * DEPTH + ';}')
+    statements = parse(source)
+    assert not lox.had_error
+    Resolver().resolve(statements)
+    assert not lox.had_error
+    # Every use of a is resolved to the function's scope
+    s = statements[0].body[0]
+    for _ in range(DEPTH):
+        assert s.condition.depth == 0
+        assert s.then_branch.condition.depth == 0
+        s = s.then_branch.body
+    e = s.value
+    for _ in range(DEPTH):
+        assert e.right.depth == 0
+        e = e.left
+    assert e.depth == 0
+
+
+def test_nested_errors_are_reported(capsys):
+    statements = parse('{' * DEPTH + 'print ;' + '}' * DEPTH + 'print 1;')
+    assert lox.had_error
+    assert "Unexpected expression." in capsys.readouterr().out
+    assert isinstance(statements[-1], stmt.Print)
@@ -0,0 +1,76 @@
+import pytest
+
+import lox.lox
+import lox.parallel
+from lox import BufferScanner, Parser, RegexScanner, TokenType as TT
+
+SOURCE = '''
+var a = 1;
+fun f(x) {
+  var y = x;
+  fun g() { return y; }
+  return g;
+}
+for (var i = 0; i < 2; i = i + 1) print i;
+class A {
+  m() { var b = 2; return b; }
+}
+while (false) { var c = 3; print c; }
+print f(a)();
+''' * 20
+
+
+@pytest.fixture
+def cores(monkeypatch):
+    """Sets the number of cores the processes are capped to"""
+    def set_cores(count):
+        monkeypatch.setattr(lox.parallel.os, 'cpu_count', lambda: count)
+    set_cores(2)
+    return set_cores
+
+
+@pytest.mark.parametrize('scanner', [RegexScanner, BufferScanner])
+def test_same_as_sequential(scanner, cores):
+    tokens = scanner(SOURCE).scan_tokens()
+    assert len(lox.parallel.pieces(tokens, 8, min_piece=50)) > 2
+    statements = lox.parallel.parse(tokens, 2, min_piece=50, min_tokens=0)
+    assert repr(statements) == repr(Parser(tokens).parse())
+
+
+def test_errors_same_as_sequential(capsys, cores):
+    source = SOURCE + 'var broken = ;\nfun h() {}\n' + SOURCE
+    tokens = BufferScanner(source).scan_tokens()
+    expected = repr(Parser(tokens).parse())
+    errors = capsys.readouterr().out
+    assert '[line 261]' in errors
+
+    lox.lox.had_error = False
+    statements = lox.parallel.parse(tokens, 2, min_piece=50, min_tokens=0)
+    assert repr(statements) == expected
+    assert capsys.readouterr().out == errors
+    assert lox.lox.had_error
+
+
+@pytest.mark.parametrize('count,jobs,min_piece,min_tokens', [
+    # A single core
+    (1, 2, 50, 0),
+    # Few tokens
+    (2, 2, 50, 10 ** 6),
+    # Fewer pieces than processes
+    (2, 2, 10 ** 6, 0),
+])
+def test_sequential_when_faster(count, jobs, min_piece, min_tokens, cores,
+                                monkeypatch):
+    cores(count)
+    monkeypatch.setattr(lox.parallel, 'ProcessPoolExecutor', None)
+    tokens = BufferScanner(SOURCE).scan_tokens()
+    statements = lox.parallel.parse(tokens, jobs, min_piece, min_tokens)
+    assert repr(statements) == repr(Parser(tokens).parse())
+
+
+def test_split_points():
+    tokens = RegexScanner(
+        'fun f() { var a; } var b; for (var c;;) {} class C {}'
+    ).scan_tokens()
+    points = lox.parallel.split_points(tokens)
+    assert [tokens[i].type for i in points] == [TT.FUN, TT.VAR, TT.CLASS]
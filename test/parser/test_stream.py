@@ -0,0 +1,25 @@
+import io
+
+from lox import Parser, Scanner, StreamScanner, TokenWindow, stmt
+
+
+def test_parses_from_iterator():
+    source = 'var a = 1;\nfun f(x) { return x; }\nprint f(a);'
+    statements = Parser(iter(Scanner(source).scan_tokens())).parse()
+    assert [type(s) for s in statements] == [stmt.Var, stmt.Function,
+                                             stmt.Print]
+
+
+def test_pulls_tokens_lazily():
+    pulled = []
+
+    def tokens():
+        for token in StreamScanner(io.StringIO('print 1;\n' * 100)):
+            pulled.append(token)
+            yield token
+
+    parser = Parser(tokens())
+    assert isinstance(parser.tokens, TokenWindow)
+    parser.run(parser.declaration())
+    assert len(pulled) < 10
+    assert len(parser.tokens.window) <= 2
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+import lox
+import lox.cache
+import lox.lox
+
+SOURCE = '''
+var a = "global";
+{
+  fun show() { print a; }
+  show();
+  var a = "local";
+  show();
+  print a;
+}
+'''
+
+
+@pytest.fixture
+def script(tmp_path, monkeypatch):
+    monkeypatch.delenv('LOXCACHEPREFIX', raising=False)
+    path = tmp_path / 'script.lox'
+    path.write_text(SOURCE)
+    return str(path)
+
+
+def fail_parse(*args):
+    raise AssertionError('the cached program should have been used')
+
+
+def test_run_file_writes_cache(script, capsys):
+    lox.run_file(script)
+    assert capsys.readouterr().out == 'global\nglobal\nlocal\n'
+    assert os.path.exists(
+        os.path.join(os.path.dirname(script), '__loxcache__',
+                     'script.lox.loxc'))
+
+
+def test_run_file_reads_cache(script, capsys, monkeypatch):
+    lox.run_file(script)
+    capsys.readouterr()
+    monkeypatch.setattr(lox, 'Parser', fail_parse)
+    lox.run_file(script)
+    # The resolver's depths survive the round trip
+    assert capsys.readouterr().out == 'global\nglobal\nlocal\n'
+
+
+def test_changed_source_invalidates(script, capsys):
+    lox.run_file(script)
+    with open(script, 'w') as f:
+        f.write('print "changed";')
+    lox.run_file(script)
+    assert capsys.readouterr().out == 'global\nglobal\nlocal\nchanged\n'
+
+
+def test_corrupt_cache_is_ignored(script, capsys):
+    lox.run_file(script)
+    with open(lox.cache.cache_path(script), 'r+b') as f:
+        f.seek(-10, os.SEEK_END)
+        f.write(b'garbage')
+    lox.run_file(script)
+    assert capsys.readouterr().out == 'global\nglobal\nlocal\n' * 2
+    assert lox.cache.load(script, SOURCE) is not None
+
+
+def test_errors_are_not_cached(tmp_path, capsys):
+    path = str(tmp_path / 'error.lox')
+    with open(path, 'w') as f:
+        f.write('print;')
+    with pytest.raises(SystemExit):
+        lox.run_file(path)
+    assert not os.path.exists(lox.cache.cache_path(path))
+
+
+def test_no_cache(script, capsys):
+    lox.run_file(script, cache=False)
+    assert capsys.readouterr().out == 'global\nglobal\nlocal\n'
+    assert not os.path.exists(lox.cache.cache_path(script))
+
+
+def test_cache_prefix(script, tmp_path, monkeypatch):
+    monkeypatch.setenv('LOXCACHEPREFIX', str(tmp_path / 'prefix'))
+    path = lox.cache.cache_path(script)
+    assert path.startswith(str(tmp_path / 'prefix'))
+    assert path.endswith('script.lox.loxc')
+
+
+def test_failed_store_leaves_no_file(script, monkeypatch):
+    def fail_dump(*args):
+        raise TypeError("cannot pickle 'generator' object")
+    monkeypatch.setattr(lox.cache.pickle, 'dump', fail_dump)
+    lox.cache.store(script, SOURCE, lox.GlobalTable(), [])
+    assert os.listdir(os.path.dirname(lox.cache.cache_path(script))) == []
@@ -0,0 +1,167 @@
+import lox
+import lox.lox
+
+SOURCE = '''\
+var greeting = "hello";
+
+fun greet(name) {
+  var message = greeting + " " + name;
+  print message;
+}
+
+class Counter {
+  init() { this.count = 0; }
+  add() { this.count = this.count + 1; return this.count; }
+}
+
+fun twice(f) {
+  fun both() { f(); f(); }
+  both();
+}
+'''
+
+
+def build(source):
+    document = lox.Document()
+    assert document.update(source)
+    return document
+
+
+def assert_same_program(document, source):
+    # Resolved depths are part of the nodes' repr
+    assert repr(document.statements) == repr(build(source).statements)
+
+
+def test_chunks():
+    document = build(SOURCE)
+    assert [chunk.line for chunk in document.chunks] == [1, 3, 8, 13]
+    assert len(document.statements) == 4
+    assert_same_program(document, SOURCE)
+
+
+def test_only_edited_chunk_is_parsed():
+    document = build(SOURCE)
+    before = document.statements
+    source = SOURCE.replace('" " + name', '", " + name')
+    assert document.update(source)
+    after = document.statements
+    assert after[0] is before[0]
+    assert after[1] is not before[1]
+    assert after[2] is before[2] and after[3] is before[3]
+    assert_same_program(document, source)
+
+
+def test_lines_after_edit_are_moved():
+    document = build(SOURCE)
+    twice = document.statements[3]
+    source = SOURCE.replace('  print message;\n',
+                            '  print message;\n  print name;\n')
+    assert document.update(source)
+    assert document.statements[3] is twice
+    assert twice.name.line == 14
+    assert_same_program(document, source)
+
+
+def test_edit_merging_chunks():
+    document = build(SOURCE)
+    # Opening a block comment swallows the class
+    source = SOURCE.replace('class Counter', '/*class Counter') \
+        .replace('fun twice', '*/fun twice')
+    assert document.update(source)
+    assert len(document.statements) == 3
+    assert_same_program(document, source)
+    assert document.update(SOURCE)
+    assert_same_program(document, SOURCE)
+
+
+def test_errors_are_reported_in_full(capsys):
+    document = build(SOURCE)
+    source = SOURCE.replace('var message', 'var message =') + 'print ;\n'
+    assert not document.update(source)
+    assert capsys.readouterr().out == (
+        "[line 4] Error at '=': Unexpected expression.\n"
+        "[line 17] Error at ';': Unexpected expression.\n"
+    )
+    lox.lox.had_error = False
+    assert document.update(SOURCE)
+    assert_same_program(document, SOURCE)
+
+
+def test_watch_file(tmp_path, capsys, monkeypatch):
+    path = tmp_path / 'script.lox'
+    path.write_text(SOURCE + 'greet("you");\n')
+    edits = [
+        SOURCE + 'greet("again");\n',
+        SOURCE.replace('print message;', 'print message + "!";')
+        + 'greet("you");\n',
+    ]
+
+    def sleep(seconds):
+        if not edits:
+            raise KeyboardInterrupt
+        path.write_text(edits.pop(0))
+        # Make sure the change is seen even with coarse timestamps
+        stat = path.stat()
+        lox.lox.os.utime(path, ns=(stat.st_atime_ns,
+                                   stat.st_mtime_ns + len(edits) + 1))
+
+    monkeypatch.setattr(lox.lox.time, 'sleep', sleep)
+    lox.watch_file(str(path))
+    assert capsys.readouterr().out == \
+        'hello you\nhello again\nhello you!\n'
+
+
+def test_watch_file_edits_in_sequence(tmp_path, capsys, monkeypatch):
+    path = tmp_path / 'script.lox'
+    program = (
+        'class Counter {\n'
+        '  init() { this.count = 0; }\n'
+        '  add() { this.count = this.count + 1 * 2; return this.count; }\n'
+        '}\n'
+        'var counter = Counter();\n'
+        'print counter.add() + counter.add();\n'
+        'print -"x";\n'
+    )
+    path.write_text(program)
+    # Each adds a line before the declarations, which aren't parsed again
+    edits = ['print 1;\n' + program, 'print 1;\nprint 2;\n' + program]
+    documents = []
+
+    class Document(lox.Document):
+        def __init__(self):
+            super().__init__()
+            documents.append(self)
+
+    def sleep(seconds):
+        if not edits:
+            raise KeyboardInterrupt
+        path.write_text(edits.pop(0))
+        stat = path.stat()
+        lox.lox.os.utime(path, ns=(stat.st_atime_ns,
+                                   stat.st_mtime_ns + len(edits) + 1))
+
+    optimized = []
+    optimize = lox.Optimizer.optimize
+
+    def record(self, root):
+        optimized.extend(root)
+        return optimize(self, root)
+
+    monkeypatch.setattr(lox, 'Document', Document)
+    monkeypatch.setattr(lox.Optimizer, 'optimize', record)
+    monkeypatch.setattr(lox.lox.time, 'sleep', sleep)
+    lox.watch_file(str(path))
+    assert capsys.readouterr().out == (
+        '6\n[line 7] Operand must be a number.\n'
+        '1\n6\n[line 8] Operand must be a number.\n'
+        '1\n2\n6\n[line 9] Operand must be a number.\n'
+    )
+    document, = documents
+    class_, _, calls = document.statements[2:5]
+    # Optimized once, the literals folded
+    assert optimized.count(class_) == 1
+    add = class_.methods[1].body[0].expression.value
+    assert type(add.right) is lox.expr.Literal and add.right.value == 2.0
+    # Specialized again by the last run, for the class it declared
+    get = calls.expression.left.callee
+    assert get.variant.__qualname__ == 'get_method.<locals>.variant'
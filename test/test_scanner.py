@@ -1,128 +1,198 @@
+import io
+
 import pytest
 
-from lox import Scanner, TokenType
+from lox import (BufferScanner, Scanner, RegexScanner, StreamScanner,
+                 TokenType)
 import lox.lox as lox
 
-@pytest.fixture(autouse=True)
-def set_had_error_false():
-    try:
-        yield
-    finally:
-        lox.had_error = False
+# Every test runs against each scanner backend
+@pytest.fixture(params=[Scanner, RegexScanner, BufferScanner])
+def scanner(request):
+    return request.param
 
-def test_has_eof():
-    tokens = Scanner('').scan_tokens()
+def test_has_eof(scanner):
+    tokens = scanner('').scan_tokens()
     assert tokens[-1].type == TokenType.EOF
 
-def test_discards_whitespace():
-    tokens = Scanner(' \t\n\f\v').scan_tokens()
+def test_discards_whitespace(scanner):
+    tokens = scanner(' \t\n\f\v').scan_tokens()
     assert len(tokens) == 1
 
-def test_unknown_char():
-    tokens = Scanner('#\a\0').scan_tokens()
+def test_unknown_char(scanner):
+    tokens = scanner('#\a\0').scan_tokens()
     assert len(tokens) - 1 == 0
     assert lox.had_error
 
-def test_single_char():
+def test_single_char(scanner):
     source = '(){};+-*.,'
-    tokens = Scanner(source).scan_tokens()
+    tokens = scanner(source).scan_tokens()
     assert len(tokens) - 1 == len(source)
 
-def test_double_single_char():
-    tokens = Scanner('= ! < >').scan_tokens()
+def test_double_single_char(scanner):
+    tokens = scanner('= ! < >').scan_tokens()
     assert len(tokens) - 1 == 4
 
-def test_double_char():
-    tokens = Scanner('<= >= != ==').scan_tokens()
+def test_double_char(scanner):
+    tokens = scanner('<= >= != ==').scan_tokens()
     assert len(tokens) - 1 == 4
 
-def test_slash():
-    tokens = Scanner('/').scan_tokens()
+def test_slash(scanner):
+    tokens = scanner('/').scan_tokens()
     assert len(tokens) - 1 == 1
     assert tokens[0].type == TokenType.SLASH
-    tokens = Scanner('/ + -').scan_tokens()
+    tokens = scanner('/ + -').scan_tokens()
     assert len(tokens) - 1 == 3
     assert tokens[0].type == TokenType.SLASH
 
-def test_comment():
-    tokens = Scanner('// this is comment foo bar foo bar').scan_tokens()
+def test_comment(scanner):
+    tokens = scanner('// this is comment foo bar foo bar').scan_tokens()
     assert len(tokens) - 1 == 0
-    tokens = Scanner('{} // comment').scan_tokens()
+    tokens = scanner('{} // comment').scan_tokens()
     types = [i.type for i in tokens]
     assert len(tokens) - 1 == 2
     assert types == [TokenType.LEFT_BRACE, TokenType.RIGHT_BRACE, TokenType.EOF]
 
-def test_comment_until_newline():
-    tokens = Scanner('// comment\n+').scan_tokens()
+def test_comment_until_newline(scanner):
+    tokens = scanner('// comment\n+').scan_tokens()
     assert len(tokens) - 1 == 1
 
-def test_block_comment():
-    tokens = Scanner('/* comment */').scan_tokens()
+def test_block_comment(scanner):
+    tokens = scanner('/* comment */').scan_tokens()
     assert len(tokens) - 1 == 0
 
-def test_block_comment_nest():
-    tokens = Scanner('/* comment /* inside */ comment */').scan_tokens()
+def test_block_comment_nest(scanner):
+    tokens = scanner('/* comment /* inside */ comment */').scan_tokens()
     assert len(tokens) - 1 == 0
 
-def test_block_comment_unterminated():
-    tokens = Scanner('/* comment').scan_tokens()
+def test_block_comment_unterminated(scanner):
+    tokens = scanner('/* comment').scan_tokens()
     assert lox.had_error == True
 
-    tokens = Scanner('/* comment /* */').scan_tokens()
+    tokens = scanner('/* comment /* */').scan_tokens()
     assert lox.had_error == True
 
 @pytest.mark.parametrize('source', ['//* comment', '// /* comment'])
-def test_block_comment_after_comment(source):
-    tokens = Scanner(source).scan_tokens()
+def test_block_comment_after_comment(scanner, source):
+    tokens = scanner(source).scan_tokens()
     assert len(tokens) - 1 == 0
     assert lox.had_error == False
 
 @pytest.mark.parametrize('identifier', ['myvar', '_', 'Capital_Letters', 'number99'])
-def test_identifier(identifier):
-    tokens = Scanner(identifier).scan_tokens()
+def test_identifier(scanner, identifier):
+    tokens = scanner(identifier).scan_tokens()
     assert len(tokens) - 1 == 1
     assert tokens[0].type == TokenType.IDENTIFIER
 
 @pytest.mark.parametrize('source,literal', [('0', 0.0), ('999', 999.0), ('1.5', 1.5)])
-def test_number(source, literal):
-    tokens = Scanner(source).scan_tokens()
+def test_number(scanner, source, literal):
+    tokens = scanner(source).scan_tokens()
     assert len(tokens) - 1 == 1
     assert tokens[0].type == TokenType.NUMBER
     assert tokens[0].literal == literal
 
-def test_number_dot_identifier():
-    tokens = Scanner('42.question').scan_tokens()
+def test_number_dot_identifier(scanner):
+    tokens = scanner('42.question').scan_tokens()
     types = [i.type for i in tokens]
     assert len(tokens) - 1 == 3
     assert types == [TokenType.NUMBER, TokenType.DOT,
                      TokenType.IDENTIFIER, TokenType.EOF]
     assert tokens[0].literal == 42.0
 
-def test_number_dot_eof():
-    tokens = Scanner('42.').scan_tokens()
+def test_number_dot_eof(scanner):
+    tokens = scanner('42.').scan_tokens()
     types = [i.type for i in tokens]
     assert len(tokens) - 1 == 2
     assert types == [TokenType.NUMBER, TokenType.DOT, TokenType.EOF]
     assert tokens[0].literal == 42.0
 
-def test_string():
-    tokens = Scanner('"string"').scan_tokens()
+def test_string(scanner):
+    tokens = scanner('"string"').scan_tokens()
     assert len(tokens) - 1 == 1
     assert tokens[0].type == TokenType.STRING
     assert tokens[0].literal == 'string'
 
-def test_string_multiline():
-    tokens = Scanner('"string\nmultiline"').scan_tokens()
+def test_string_multiline(scanner):
+    tokens = scanner('"string\nmultiline"').scan_tokens()
     assert len(tokens) - 1 == 1
     assert tokens[0].literal == 'string\nmultiline'
 
-def test_string_unterminated():
-    tokens = Scanner('"oops').scan_tokens()
+def test_string_unterminated(scanner):
+    tokens = scanner('"oops').scan_tokens()
     assert len(tokens) - 1 == 0
     assert lox.had_error == True
 
-def test_keywords():
+def test_keywords(scanner):
     for keyword, type in Scanner.keywords.items():
-        tokens = Scanner(keyword).scan_tokens()
+        tokens = scanner(keyword).scan_tokens()
         assert len(tokens) - 1 == 1
         assert tokens[0].type == type
+
+
+@pytest.mark.parametrize('source', [
+    'var a = 1;\n\n  print a + "b\nc";\n',
+    '/* one\ntwo */ a /* nested /* inside */\n */ b',
+    'a "unterminated\nstring',
+    'a /* unterminated\n block',
+    '# @ \n 1.5.3 // comment\n ! != = == <= < >= >',
+    '"a"/"b" / /',
+    'a /**/ "b\n" // c\n/* d */ e\n',
+    '',
+    '\n\n',
+])
+def test_regex_scanner_matches_scanner(source, capsys):
+    tokens = Scanner(source).scan_tokens()
+    errors = capsys.readouterr().out
+    assert RegexScanner(source).scan_tokens() == tokens
+    assert capsys.readouterr().out == errors
+    assert list(BufferScanner(source).scan_tokens()) == tokens
+    assert capsys.readouterr().out == errors
+
+    # Tiny chunks make strings, comments and tokens straddle chunk boundaries
+    for chunk_size in (1, 2, 3, 7):
+        assert list(StreamScanner(io.StringIO(source), chunk_size)) == tokens
+        assert capsys.readouterr().out == errors
+        data = io.BytesIO(source.encode())
+        assert list(StreamScanner(data, chunk_size)) == tokens
+        assert capsys.readouterr().out == errors
+
+
+@pytest.mark.parametrize('block_size,min_block_size', [(0, 0), (8, 1),
+                                                       (1 << 16, 16)])
+def test_regex_scanner_scans_in_stretches(block_size, min_block_size,
+                                          monkeypatch, capsys):
+    source = ('a # /* x /* y */ */ b\n"c\nd" @ /* e\n f */ g\n'
+              'h /* i /* j /* k */ */ */ l\n $ "m\n" /* n\n /* o */ */\n') * 5
+    tokens = Scanner(source).scan_tokens()
+    errors = capsys.readouterr().out
+    monkeypatch.setattr(RegexScanner, 'block_size', block_size)
+    monkeypatch.setattr(RegexScanner, 'min_block_size', min_block_size)
+    assert RegexScanner(source).scan_tokens() == tokens
+    assert capsys.readouterr().out == errors
+
+
+def test_stream_scanner_decodes_across_chunks():
+    source = 'print "ünïcödé";\r\nprint 1;'
+    tokens = list(StreamScanner(io.BytesIO(source.encode()), 1))
+    assert tokens[1].literal == 'ünïcödé'
+    assert tokens[-2].line == 2
+
+
+def test_stream_scanner_is_lazy():
+    source = io.StringIO('a b c\n' * 1000)
+    tokens = iter(StreamScanner(source, 16))
+    assert next(tokens).lexeme == 'a'
+    assert source.tell() < 100
+
+
+def test_token_buffer_interns_identifiers():
+    tokens = BufferScanner('name + name').scan_tokens()
+    assert tokens.type_at(1) is TokenType.PLUS
+    assert tokens[0] == tokens[2]
+    assert tokens[0].lexeme is tokens[2].lexeme
+
+
+def test_token_buffer_shares_lines():
+    tokens = BufferScanner('\n' * 1000 + 'a + b').scan_tokens()
+    assert tokens[0].line == 1001
+    assert tokens[0].line is tokens[2].line
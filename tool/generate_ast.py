@@ -3,16 +3,14 @@ import sys
 from typing import Dict, List, Tuple
 
 
-def define_ast(file, base: str, ast: Dict[str, List[str]], imports: List[Tuple[str, str]] = []):  # noqa
+def define_ast(file, base: str, ast: Dict[str, List[str]], imports: List[Tuple[str, str]] = [], runtime: Dict[str, List[str]] = {}):  # noqa
     print(end=f'pouring ast into {file}... ')
     sys.stdout.flush()
 
     f = open(join(dirname(dirname(abspath(__file__))), 'lox', file), 'w+')
     f.write('"""AUTOGENERATED! DO NOT EDIT! Make changes to tool/generate_ast.py instead"""\n')
     f.write('from abc import ABC, abstractmethod\n')
-    f.write('from typing import Any, Generic, List, Optional, TypeVar\n')
-    f.write('from collections import namedtuple')
-    f.write('\n')
+    f.write('from typing import Any, Generic, List, Optional, Tuple, TypeVar\n')
 
     if imports:
         for p, i in imports:
@@ -21,17 +19,40 @@ def define_ast(file, base: str, ast: Dict[str, List[str]], imports: List[Tuple[s
 
     f.write(f"T = TypeVar('T')\n")
     f.write(f'\n')
+    # Nodes are plain slotted classes: no per-instance __dict__, and hashing
+    # and equality are object's, by identity. Each class also gets a small
+    # integer kind tag. Slots in runtime are runtime state rather than part of
+    # the node: they start as None, and are left out of reprs and pickles.
     f.write(f"class {base}:\n")
+    f.write(f"    __slots__ = ()\n")
+    f.write(f"    kind: int\n")
     f.write(f"    def accept(self, visitor: 'Visitor[T]') -> T: ...\n")
-    f.write(f'    def __hash__(self): return id(self)\n')
     f.write(f'\n')
 
-    for cls, fields in ast.items():
-        args = ' '.join(i.partition(':')[0].strip() for i in fields)
-        f.write(f"class {cls}({base}, namedtuple('{cls}', '{args}')):\n")
+    for kind, (cls, fields) in enumerate(ast.items()):
+        names = [i.partition(':')[0].strip() for i in fields]
+        extra = runtime.get(cls, [])
+        f.write(f"class {cls}({base}):\n")
+        f.write(f"    __slots__ = {tuple(names + extra)!r}\n")
+        f.write(f"    kind = {kind}\n")
+        f.write('\n')
+        f.write(f"    def __init__(self, {', '.join(fields)}):\n")
+        for name in names:
+            f.write(f"        self.{name} = {name}\n")
+        for name in extra:
+            f.write(f"        self.{name} = None\n")
+        f.write('\n')
         f.write(f"    def accept(self, visitor: 'Visitor[T]') -> T:\n")
         f.write(f"        return visitor.visit_{cls.lower()}_{base.lower()}(self)\n")
         f.write('\n')
+        f.write(f"    def __repr__(self):\n")
+        fmt = ', '.join(f'{i}={{self.{i}!r}}' for i in names)
+        f.write(f"        return f'{cls}({fmt})'\n")
+        f.write('\n')
+        f.write(f"    def __reduce__(self):\n")
+        state = ', '.join(f'self.{i}' for i in names)
+        f.write(f"        return {cls}, ({state}{',' * (len(names) == 1)})\n")
+        f.write('\n')
 
     f.write(f"R = TypeVar('R')\n")
     f.write('\n')
@@ -44,44 +65,130 @@ def define_ast(file, base: str, ast: Dict[str, List[str]], imports: List[Tuple[s
 
 
 define_ast('expr.py', 'Expr', {
-    'Assign': ['name: Token', 'value: Expr'],
-    'Binary': ['left: Expr', 'operator: Token', 'right: Expr'],
-    'Call': ['callee: Expr', 'paren: Token', 'arguments: List[Expr]'],
+    # depth and slot are filled in by the resolver: how many scopes up from
+    # the innermost one the variable is declared, None for globals, and its
+    # index in that scope's frame, or in the program's lox.GlobalTable.
+    # Variables declared in enclosing functions are in the frame of captures
+    # past the function's outermost scope. cell is set when the slot holds a
+    # lox.Cell with the value, see Stmt.Function.
+    'Assign': [
+        'name: Token',
+        'value: Expr',
+        'depth: Optional[int] = None',
+        'slot: Optional[int] = None',
+        'cell: bool = False',
+    ],
+    # typed is set by lox.infer_types when the operands can only be numbers,
+    # or only strings for '+', so they don't need to be checked
+    'Binary': [
+        'left: Expr',
+        'operator: Token',
+        'right: Expr',
+        'typed: bool = False',
+    ],
+    # checked is set by the resolver when the callee is a global function or
+    # class that's never reassigned and takes as many arguments as given
+    'Call': [
+        'callee: Expr',
+        'paren: Token',
+        'arguments: List[Expr]',
+        'checked: bool = False',
+    ],
     'Conditional': ['condition: Expr', 'then_branch: Expr', 'else_branch: Expr'],
     'Get': ['object: Expr', 'name: Token'],
     'Grouping': ['expression: Expr'],
+    # A call inlined by lox.Optimizer: the arguments are stored in the
+    # caller's frame from slot on, where body, the value the function
+    # returns, reads its parameters. callee is the global the function is
+    # declared in, which has to be defined by the time of the call
+    'Inline': [
+        'callee: Expr',
+        'arguments: List[Expr]',
+        'slot: int',
+        'body: Expr',
+    ],
     'Literal': ['value: Any'],
     'Logical': ['left: Expr', 'operator: Token', 'right: Expr'],
     'Set': ['object: Expr', 'name: Token', 'value: Expr'],
-    'This': ['keyword: Token'],
-    'Unary': ['operator: Token', 'right: Expr'],
-    'Variable': ['name: Token'],
+    'This': [
+        'keyword: Token',
+        'depth: Optional[int] = None',
+        'slot: Optional[int] = None',
+    ],
+    'Unary': ['operator: Token', 'right: Expr', 'typed: bool = False'],
+    'Variable': [
+        'name: Token',
+        'depth: Optional[int] = None',
+        'slot: Optional[int] = None',
+        'cell: bool = False',
+    ],
 }, imports=[
     ('token', 'Token'),
-])
+], runtime={
+    # variant is the function lox.Interpreter evaluates the node with once
+    # it's been evaluated, specialized for the values it got, see lox.quicken
+    'Binary': ['variant'],
+    'Get': ['variant'],
+    'Unary': ['variant'],
+})
 
 define_ast('stmt.py', 'Stmt', {
-    'Block': ['statements: List[Stmt]'],
+    # Blocks run in the frame of the function they're in. frame_size is set
+    # for the outermost blocks of top-level code, which run in the
+    # interpreter's frame for top-level locals, to the slots they need
+    'Block': [
+        'statements: List[Stmt]',
+        'frame_size: Optional[int] = None',
+    ],
     'Break': ['keyword: Token'],
+    # slot is set by the resolver for local declarations, cell when the
+    # declared variable is kept in a lox.Cell, see Function
     'Class': [
         'name: Token',
         "methods: List['Function']",
         "setters: List['Function']",
         "class_methods: List['Function']",
         "class_setters: List['Function']",
+        'slot: Optional[int] = None',
+        'cell: bool = False',
     ],
     'Expression': ['expression: Expr'],
+    # The initializer's variable is scoped to the loop. Like a block's,
+    # frame_size is set when the loop is in top-level code and needs slots
+    'For': [
+        'initializer: Optional[Stmt]',
+        'condition: Optional[Expr]',
+        'increment: Optional[Expr]',
+        'body: Stmt',
+        'frame_size: Optional[int] = None',
+    ],
+    # Functions only capture the variables of enclosing functions they use,
+    # as (depth, slot) where the function is declared, into a flat frame.
+    # Captured variables that are assigned, or captured before they're
+    # defined, are shared in cells instead: cell for the function's name,
+    # cells for the slots of parameters. All the locals of a call are in
+    # one frame of frame_size slots, parameters first
     'Function': [
         'name: Token',
         'params: List[Token]',
         'body: List[Stmt]',
         'is_getter: bool',
         'is_setter: bool',
+        'slot: Optional[int] = None',
+        'captures: Optional[List[Tuple[int, int]]] = None',
+        'cell: bool = False',
+        'cells: Optional[List[int]] = None',
+        'frame_size: Optional[int] = None',
     ],
     'If': ['condition: Expr', 'then_branch: Stmt', 'else_branch: Stmt'],
     'Print': ['expression: Expr'],
     'Return': ['keyword: Token', 'value: Expr'],
-    'Var': ['name: Token', 'initializer: Optional[Expr]'],
+    'Var': [
+        'name: Token',
+        'initializer: Optional[Expr]',
+        'slot: Optional[int] = None',
+        'cell: bool = False',
+    ],
     'While': ['condition: Expr', 'body: Stmt'],
 }, imports=[
     ('token', 'Token'),